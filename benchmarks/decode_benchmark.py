@@ -0,0 +1,64 @@
+"""
+Compare the tile decoding backends in gbdxtools.rda.decode.
+
+Encodes synthetic tiles in each format, then decodes them from a pool of
+threads (standing in for the dask scheduler threads that fetch tiles).
+
+    python benchmarks/decode_benchmark.py --tiles 512 --threads 16
+"""
+import argparse
+import time
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import imageio
+import tifffile
+
+from gbdxtools.rda import decode
+
+
+def make_tiles(size):
+    rgb = (np.random.RandomState(0).rand(size, size, 3) * 64).astype(np.uint8)
+    rgb += np.linspace(0, 190, size).astype(np.uint8)[:, None, None]
+    ms = (rgb[:, :, [0, 1, 2, 0, 1, 2, 0, 1]].astype(np.uint16) * 8)
+    tiff = BytesIO()
+    tifffile.imwrite(tiff, ms)
+    return {
+        "png": (imageio.imwrite(imageio.RETURN_BYTES, rgb, format="png"), "image/png", (3, size, size), np.uint8),
+        "jpeg": (imageio.imwrite(imageio.RETURN_BYTES, rgb, format="jpeg"), "image/jpeg", (3, size, size), np.uint8),
+        "tiff": (tiff.getvalue(), "image/tiff", (8, size, size), np.uint16),
+    }
+
+
+def run(decoder, content, content_type, count, threads):
+    def work(i):
+        decoder.decode(content, content_type)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(work, range(count)))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tiles", type=int, default=256, help="tiles to decode per run")
+    parser.add_argument("--size", type=int, default=256, help="tile width and height")
+    parser.add_argument("--threads", type=int, default=8, help="fetching threads")
+    parser.add_argument("--workers", type=int, default=None, help="decoder pool size")
+    args = parser.parse_args()
+
+    backends = [name for name in ("inline", "processes", "imagecodecs")
+                if name != "imagecodecs" or decode.has_imagecodecs]
+    print("{:<6} {:<12} {:>12}".format("format", "backend", "tiles/s"))
+    for fmt, (content, content_type, shape, dtype) in make_tiles(args.size).items():
+        for name in backends:
+            decoder = decode.decoders[name](args.workers)
+            run(decoder, content, content_type, min(args.tiles, 16), args.threads)  # warm up pools
+            elapsed = run(decoder, content, content_type, args.tiles, args.threads)
+            decoder.shutdown()
+            print("{:<6} {:<12} {:>12.0f}".format(fmt, name, args.tiles / elapsed))
+
+
+if __name__ == "__main__":
+    main()
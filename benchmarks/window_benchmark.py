@@ -0,0 +1,81 @@
+"""
+Time slicing windows out of images of increasing size.
+
+Builds synthetic tiled images with as many tiles as windows, then builds the
+graph of every window of a padded window cover. With window slicing
+independent of the size of the image the time per window stays flat, so the
+total grows linearly with the number of windows. The last column times a
+sample of the same windows with the previous code, for comparison: the image
+graph built up front, the pixel shift sliced by dask, and each window sliced
+by dask, culled and padded by concatenating zeros.
+
+    python benchmarks/window_benchmark.py --windows 10000
+"""
+import argparse
+import math
+import random
+import time
+from itertools import product
+
+import numpy as np
+import dask.array as da
+from affine import Affine
+from dask.highlevelgraph import HighLevelGraph
+from shapely.geometry import box, mapping
+
+from gbdxtools.images.layers import TemplateTileLayer
+from gbdxtools.images.meta import GeoDaskImage, DaskMeta
+from gbdxtools.rda.util import AffineTransform
+
+
+def load_tile(url):
+    raise RuntimeError("the benchmark never reads tiles")
+
+
+def make_image(ntiles, tile_size, lazy=True):
+    name = "image-benchmark-{}".format(ntiles)
+    layer = TemplateTileLayer(name, load_tile, "http://rda.test/template/benchmark/tile", "nodeId=Format",
+                              0, 0, ntiles, ntiles)
+    shape = (8, ntiles * tile_size, ntiles * tile_size)
+    img = GeoDaskImage({"dask": HighLevelGraph.from_collections(name, layer if lazy else dict(layer)), "name": name,
+                        "chunks": ((8,), (tile_size,) * ntiles, (tile_size,) * ntiles),
+                        "dtype": np.uint16, "shape": shape},
+                       __geo_interface__=mapping(box(0, -shape[1], shape[2], 0)),
+                       __geo_transform__=AffineTransform(Affine(1.0, 0.0, 0.0, 0.0, -1.0, 0.0)))
+    # the same pixel shift RDA images start with
+    bounds = (0, 0, shape[2] - tile_size // 3, shape[1] - tile_size // 3)
+    if lazy:
+        return img._window(*bounds, cull=False)
+    shifted = da.Array.__getitem__(img, (slice(None), slice(bounds[1], bounds[3]), slice(bounds[0], bounds[2])))
+    return GeoDaskImage(DaskMeta.from_darray(shifted), __geo_interface__=img.__geo_interface__,
+                        __geo_transform__=img.__geo_transform__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--windows", type=int, default=10000, help="windows in the largest image")
+    parser.add_argument("--steps", type=int, default=4, help="image sizes to try, halving the windows each time")
+    parser.add_argument("--size", type=int, default=256, help="tile and window width and height")
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>10} {:>14} {:>14}".format("windows", "tiles", "total s", "us/window", "old us/window"))
+    for step in reversed(range(args.steps)):
+        ntiles = int(math.sqrt(args.windows / 2 ** step))
+        img = make_image(ntiles, args.size)
+        start = time.perf_counter()
+        windows = sum(1 for w in img.window_cover((args.size, args.size), pad=True))
+        total = time.perf_counter() - start
+        # the previous slice and pad of a sample of the windows, including padded ones at the edges
+        old = make_image(ntiles, args.size, lazy=False)
+        origins = list(product(range(0, old.shape[1], args.size), range(0, old.shape[2], args.size)))
+        sample = random.Random(0).sample(origins, min(len(origins), 100))
+        start = time.perf_counter()
+        for y, x in sample:
+            old._slice_concat(x, y, x + args.size, y + args.size)
+        old_per = (time.perf_counter() - start) / len(sample)
+        print("{:>8} {:>8} {:>10.2f} {:>14.0f} {:>14.0f}".format(windows, ntiles * ntiles, total,
+                                                                 1e6 * total / windows, 1e6 * old_per))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,8 @@
 import os
-from requests.adapters import HTTPAdapter
 from gbdx_auth import gbdx_auth
 import logging
 
-from gbdxtools.rda.graph import VIRTUAL_RDA_URL
+from gbdxtools.connections import connection_manager
 
 auth = None
 
@@ -57,6 +56,7 @@ class _Auth(object):
                                            config_file=kwargs.get('config_file'))
                     # re-init the session
                     self.gbdx_connection = gbdx_auth.get_session(kwargs.get('config_file'))
+                    connection_manager.mount(self.gbdx_connection, self.root_url)
                     # make original request, triggers new token request first
                     return self.gbdx_connection.request(method=r.request.method, url=r.request.url)
 
@@ -68,8 +68,8 @@ class _Auth(object):
 
             self.gbdx_connection.hooks['response'].append(expire_token)
 
-            # status_forcelist=[500, 502, 504]))
-            self.gbdx_connection.mount(VIRTUAL_RDA_URL, HTTPAdapter(max_retries=5))
+            # pools for RDA, vector services and the catalog sized to the scheduler
+            connection_manager.mount(self.gbdx_connection, self.root_url)
 
         if 'GBDX_USER' in os.environ:
             header = {'User-Agent': os.environ['GBDX_USER']}
@@ -0,0 +1,160 @@
+"""
+Connection pools for the GBDX services.
+
+Requests to RDA, vector services and the catalog go through the shared GBDX
+session, and TMS tiles through a session of their own. Each service gets its
+own pool of keep-alive connections, sized to the number of workers of the
+scheduler (see gbdxtools.rda.scheduler) when the pools are made, so that
+parallel reads reuse connections instead of opening (and discarding) a new one
+for every worker beyond the pool size. Setting a scheduler resizes the pools.
+
+The pools count the requests sent through them, and how often more requests
+were in flight than the pool could hold connections for. If that happens
+regularly, the pools are too small for the scheduler:
+
+    from gbdxtools.connections import connection_manager
+
+    connection_manager.stats()
+    connection_manager.resize(128)
+"""
+import threading
+import weakref
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from gbdxtools.rda.graph import VIRTUAL_RDA_URL
+
+VECTORS_URL = 'https://vector.geobigdata.io'
+TMS_USER_AGENT = 'GBDXtools v0.17.1 contact GBDX-Support@digitalglobe.com'
+
+PoolStats = namedtuple("PoolStats", ["pool_size", "requests", "active", "peak", "exhausted", "connections"])
+
+
+class MeteredAdapter(HTTPAdapter):
+    """ An HTTPAdapter that keeps counts of how its connection pools are used
+
+    Args:
+        pool_size (int): the most connections kept open to each host
+        max_retries (int): connection retries, passed on to HTTPAdapter
+    """
+    def __init__(self, pool_size, max_retries=0):
+        self._lock = threading.Lock()
+        self.requests = self.active = self.peak = self.exhausted = 0
+        super(MeteredAdapter, self).__init__(pool_maxsize=pool_size, max_retries=max_retries)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            if self.active > self._pool_maxsize:
+                # this request's connection won't fit back in the pool and will be discarded
+                self.exhausted += 1
+        try:
+            return super(MeteredAdapter, self).send(request, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def connections(self):
+        """ The number of connections opened by the pools for every host """
+        pools = self.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def stats(self):
+        with self._lock:
+            return PoolStats(self._pool_maxsize, self.requests, self.active, self.peak,
+                             self.exhausted, self.connections())
+
+
+class ConnectionManager(object):
+    """ Owns the connection pools for RDA, TMS, vector services and the catalog
+
+    Args:
+        workers (int): the size of every pool, defaults to the number of scheduler workers
+    """
+    services = ("rda", "tms", "vectors", "catalog")
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._adapters = {}
+        self._sessions = weakref.WeakKeyDictionary()
+        self._tms = None
+
+    def adapter(self, service):
+        """ The MeteredAdapter holding the connection pool for a service """
+        if service not in self.services:
+            raise ValueError("Unknown service {}, choose from {}".format(service, ", ".join(self.services)))
+        with self._lock:
+            if service not in self._adapters:
+                # RDA keeps the connection retries the GBDX session has always had
+                retries = 5 if service == "rda" else 0
+                self._adapters[service] = MeteredAdapter(self.pool_size(), max_retries=retries)
+            return self._adapters[service]
+
+    def pool_size(self):
+        """ The size of the pools, `workers` or the number of workers of the current scheduler """
+        if self.workers is not None:
+            return self.workers
+        # imported here, the GBDX session is mounted while the scheduler module is being imported. Until
+        # a scheduler is set or used the default one, with GBDX_THREADS threads, is assumed.
+        from gbdxtools.rda import scheduler
+        current = getattr(scheduler, "_scheduler", None)
+        return getattr(current, "num_workers", None) or scheduler.threads
+
+    def mount(self, session, root_url='https://geobigdata.io'):
+        """ Route a GBDX session's RDA, vector and catalog requests through the managed pools
+
+        Args:
+            session (requests.Session): the authenticated GBDX session
+            root_url (str): the GBDX API root the catalog is served from
+        """
+        session.mount(VIRTUAL_RDA_URL, self.adapter("rda"))
+        session.mount(VECTORS_URL, self.adapter("vectors"))
+        session.mount('{}/catalog'.format(root_url), self.adapter("catalog"))
+        with self._lock:
+            self._sessions[session] = root_url
+        return session
+
+    def tms_session(self):
+        """ The session used to fetch tiles from TMS servers """
+        with self._lock:
+            if self._tms is None:
+                session = requests.Session()
+                session.headers.update({'User-Agent': TMS_USER_AGENT})
+                self._tms = session
+        adapter = self.adapter("tms")
+        self._tms.mount('http://', adapter)
+        self._tms.mount('https://', adapter)
+        return self._tms
+
+    def resize(self, workers=None):
+        """ Resize every pool for a new number of scheduler workers
+
+        Open connections are closed and the pool counters start over.
+
+        Args:
+            workers (int): the new pool size, or None to follow the scheduler
+        """
+        with self._lock:
+            old, self._adapters = self._adapters, {}
+            self.workers = workers
+            sessions = list(self._sessions.items())
+        for adapter in old.values():
+            adapter.close()
+        for session, root_url in sessions:
+            self.mount(session, root_url)
+        if self._tms is not None:
+            self.tms_session()
+
+    def stats(self):
+        """ PoolStats for every service that has made requests """
+        with self._lock:
+            adapters = dict(self._adapters)
+        return {service: adapter.stats() for service, adapter in adapters.items()}
+
+
+connection_manager = ConnectionManager()
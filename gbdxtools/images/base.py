@@ -7,7 +7,8 @@ class RDABaseImage(RDAImage):
     __rda_id__ = None
     def __new__(cls, rda_id=None, **kwargs):
         cls = cls.__Driver__(rda_id=rda_id, **kwargs).drive(cls, **kwargs)
-        self = super(RDABaseImage, cls).__new__(cls, cls.__driver__.payload, **kwargs)
+        self = super(RDABaseImage, cls).__new__(cls, cls.__driver__.payload,
+                                                **dict(kwargs, **cls.__driver__.read_options))
         return self.__post_new_hook__(**kwargs)
 
     def __post_new_hook__(self, **kwargs):
@@ -23,6 +23,7 @@ class CatalogImage(object):
         acomp (bool): Perform atmospheric compensation on the image (defaults to False, i.e. Top of Atmosphere value)
         gsd (float): The Ground Sample Distance (GSD) of the image. Must be defined in the same projected units as the image projection.
         dra (bool): Perform Dynamic Range Adjustment (DRA) on the image. DRA will override the dtype and return int8 data.  
+        tile_format (str): The encoding to request tiles in, such as "png", "jpeg" or "tiff-deflate", or "auto" for the smallest lossless encoding (defaults to the server's choice)
 
     Attributes:
         affine (list): The image affine transformation
@@ -28,6 +28,11 @@ WV_DEFAULT_OPTIONS = {
     "dtype": "float32"
     }
 
+# options of every RDA image that change how its tiles are read rather than its graph
+READ_OPTIONS = {
+    "tile_format": None
+    }
+
 WV_MODERN_OPTIONS = {
     "dra": False,
     "proj": "EPSG:4326",
@@ -76,8 +81,9 @@ class OptionParserFactory(type):
     def install_parser(inst):
         default_options = getattr(inst, "__default_options__", {})
         custom_options = getattr(inst, "__image_option_defaults__", {})
-        defaults = update_options(default_options, custom_options)
-        p = opf(inst.__name__ + "Parser", inst.image_option_support, default_values=defaults)
+        defaults = update_options(READ_OPTIONS, default_options, custom_options)
+        fields = list(inst.image_option_support) + [opt for opt in READ_OPTIONS if opt not in inst.image_option_support]
+        p = opf(inst.__name__ + "Parser", fields, default_values=defaults)
         setattr(inst, "parser", p)
         setattr(inst, "default_options", defaults)
         return inst
@@ -115,7 +121,7 @@ class RDADaskImageDriver(RDADriverInterface, metaclass=OptionParserFactory):
         self._payload = None
 
     def parse_options(self, inputs):
-        options = self.parser(**{opt: inputs[opt] for opt in self.image_option_support if opt in inputs})
+        options = self.parser(**{opt: inputs[opt] for opt in self.parser._fields if opt in inputs})
         return options
 
     @property
@@ -144,9 +150,14 @@ class RDADaskImageDriver(RDADriverInterface, metaclass=OptionParserFactory):
     def payload(self, payload):
         self._payload = payload
 
+    @property
+    def read_options(self):
+        return {opt: self.options.get(opt) for opt in READ_OPTIONS}
+
     def build_payload(self, target):
         # build_graph should always return an rda graph / dask meta
-        graph = target._build_graph(self.rda_id, **self.options)
+        options = {opt: value for opt, value in self.options.items() if opt not in READ_OPTIONS}
+        graph = target._build_graph(self.rda_id, **options)
         self._graph = graph
 
     def drive(self, target, **kwargs):
@@ -157,7 +168,7 @@ class RDADaskImageDriver(RDADriverInterface, metaclass=OptionParserFactory):
             self.rda_id = rda_id
         target.__driver__ = self
         target.__rda_id__ = self.rda_id
-        target.__supported_options__ = self.image_option_support
+        target.__supported_options__ = self.parser._fields
         target.__default_options__ = self.default_options
         self.build_payload(target)
         return target
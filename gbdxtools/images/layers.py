@@ -0,0 +1,184 @@
+"""
+Lazy dask graph layers for tiled images.
+
+A full strip can have tens of thousands of tiles, but a read only ever needs
+the tiles under its AOI. These layers are Mappings that build their tasks from
+the block index when a key is looked up, so making an image, slicing it, and
+culling the result costs time proportional to the blocks that are used rather
+than the size of the strip.
+"""
+import bisect
+import operator
+from collections.abc import Mapping
+
+import numpy as np
+from dask.array.slicing import cached_cumsum
+from shapely.geometry import box
+from shapely.prepared import prep
+
+
+class TileLayer(Mapping):
+    """ The fetch tasks of a grid of tiles, built on lookup
+
+    Keys are (name, 0, row, col) for every tile in the grid and map to
+    `(loader, url) + args`, where the url comes from `tile_url`.
+
+    Args:
+        name (str): the dask name of the tiles
+        loader (callable): the tile loader to call with each url
+        min_x (int): the column index of the first tile
+        min_y (int): the row index of the first tile
+        nx (int): the number of tile columns
+        ny (int): the number of tile rows
+        args (tuple): extra arguments passed to the loader after the url
+        footprint (Polygon): the valid area of the image in pixels of the tile grid. Tiles
+            entirely outside of it are filled with zeros instead of being fetched.
+        tile_shape (tuple): the (bands, height, width) of a tile, needed with footprint
+        dtype: the data type of the tiles, needed with footprint
+    """
+    def __init__(self, name, loader, min_x, min_y, nx, ny, args=(), footprint=None, tile_shape=None, dtype=None):
+        self.name = name
+        self.loader = loader
+        self.min_x, self.min_y = min_x, min_y
+        self.nx, self.ny = nx, ny
+        self.args = tuple(args)
+        self.footprint = None if footprint is None else prep(footprint)
+        self.tile_shape = tile_shape
+        self.dtype = dtype
+
+    def tile_url(self, x, y):
+        raise NotImplementedError
+
+    def _index(self, key):
+        try:
+            name, band, row, col = key
+            if name == self.name and band == 0 and 0 <= row < self.ny and 0 <= col < self.nx:
+                return row, col
+        except (TypeError, ValueError):
+            pass
+        raise KeyError(key)
+
+    def _empty(self, x, y):
+        if self.footprint is None:
+            return False
+        _bands, height, width = self.tile_shape
+        return not self.footprint.intersects(box(x * width, y * height, (x + 1) * width, (y + 1) * height))
+
+    def __getitem__(self, key):
+        row, col = self._index(key)
+        x, y = col + self.min_x, row + self.min_y
+        if self._empty(x, y):
+            return (np.zeros, self.tile_shape, self.dtype)
+        return (self.loader, self.tile_url(x, y)) + self.args
+
+    def __contains__(self, key):
+        try:
+            self._index(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for row in range(self.ny):
+            for col in range(self.nx):
+                yield (self.name, 0, row, col)
+
+    def __len__(self):
+        return self.nx * self.ny
+
+
+class TemplateTileLayer(TileLayer):
+    """ Tiles of an RDA template, at `{url}/{x}/{y}?{qs}` """
+    def __init__(self, name, loader, url, qs, *args, **kwargs):
+        super(TemplateTileLayer, self).__init__(name, loader, *args, **kwargs)
+        self.url = url
+        self.qs = qs
+
+    def tile_url(self, x, y):
+        return "{}/{}/{}?{}".format(self.url, x, y, self.qs)
+
+
+def _blocks_1d(chunks, start, stop):
+    # the parent blocks a [start, stop) range covers and the part of each it needs,
+    # with None in place of a block for the parts of the range outside the array
+    offsets = cached_cumsum(chunks, initial_zero=True)
+    blocks = []
+    if start < 0:
+        blocks.append((None, slice(0, min(stop, 0) - start), None))
+    lo, hi = max(start, 0), min(stop, offsets[-1])
+    if lo < hi:
+        first = bisect.bisect_right(offsets, lo) - 1
+        for idx in range(first, bisect.bisect_left(offsets, hi)):
+            offset = offsets[idx]
+            blocks.append((idx, slice(max(lo - offset, 0), min(hi - offset, chunks[idx])), chunks[idx]))
+    if stop > offsets[-1]:
+        blocks.append((None, slice(0, stop - max(start, offsets[-1])), None))
+    return blocks
+
+
+class SliceLayer(Mapping):
+    """ A rectangular pixel window of a band-first array, with tasks built on lookup
+
+    Each block of the window comes from a single block of the parent array:
+    blocks the window fully contains are aliases of the parent block, edge
+    blocks are cropped from it. Parts of the window outside the parent array
+    are filled with zeros, so padded windows need no extra concatenation.
+    Finding the blocks takes time logarithmic in the size of the parent.
+
+    Args:
+        name (str): the dask name of the window
+        parent (str): the dask name of the parent array
+        chunks (tuple): the chunks of the parent array
+        bounds (tuple): the window as (minx, miny, maxx, maxy) in parent pixels
+        dtype: the data type of the parent array, for padding
+    """
+    def __init__(self, name, parent, chunks, bounds, dtype=None):
+        assert len(chunks[0]) == 1, "SliceLayer needs all bands in one chunk"
+        minx, miny, maxx, maxy = bounds
+        self.name = name
+        self.parent = parent
+        self.bands = chunks[0]
+        self.dtype = dtype
+        self._rows = _blocks_1d(chunks[1], miny, maxy)
+        self._cols = _blocks_1d(chunks[2], minx, maxx)
+
+    @property
+    def chunks(self):
+        return (self.bands,
+                tuple(s.stop - s.start for _, s, _ in self._rows),
+                tuple(s.stop - s.start for _, s, _ in self._cols))
+
+    def _index(self, key):
+        try:
+            name, band, row, col = key
+            if name == self.name and band == 0 and 0 <= row < len(self._rows) and 0 <= col < len(self._cols):
+                return row, col
+        except (TypeError, ValueError):
+            pass
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        row, col = self._index(key)
+        prow, ys, ysize = self._rows[row]
+        pcol, xs, xsize = self._cols[col]
+        if prow is None or pcol is None:
+            return (np.zeros, (self.bands[0], ys.stop - ys.start, xs.stop - xs.start), self.dtype)
+        block = (self.parent, 0, prow, pcol)
+        if ys.stop - ys.start == ysize and xs.stop - xs.start == xsize:
+            return block
+        return (operator.getitem, block, (slice(None), ys, xs))
+
+    def __contains__(self, key):
+        try:
+            self._index(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for row in range(len(self._rows)):
+            for col in range(len(self._cols)):
+                yield (self.name, 0, row, col)
+
+    def __len__(self):
+        return len(self._rows) * len(self._cols)
@@ -1,29 +1,82 @@
 import os
 import random
-from functools import partial
+import tempfile
+from numbers import Integral
 from itertools import product
 from collections import namedtuple
 from collections.abc import Container
 
 from gbdxtools.rda.io import to_geotiff
+from gbdxtools.rda import aio, direct
+from gbdxtools.rda.scheduler import get_scheduler
+from gbdxtools.rda.prefetch import prefetch as prefetch_windows
+from gbdxtools.rda.sampler import WindowSampler, WindowLoader
 from gbdxtools.rda.util import RatPolyTransform, AffineTransform, pad_safe_positive, pad_safe_negative, RDA_TO_DTYPE, get_proj
 from gbdxtools.images.mixins import PlotMixin, BandMethodsTemplate, Deprecations
+from gbdxtools.images.layers import SliceLayer
 
 from shapely import ops, wkt
 from shapely.geometry import box, shape, mapping, asShape
 from shapely.geometry.base import BaseGeometry
+from shapely.prepared import prep
+from shapely import vectorized
 
 import pyproj
 import dask
 from dask import optimization
+from dask.base import tokenize
+from dask.highlevelgraph import HighLevelGraph
+from dask.array.slicing import cached_cumsum
 from dask.delayed import delayed
 import dask.array as da
 import numpy as np
 
 from affine import Affine
 
-threads = int(os.environ.get('GBDX_THREADS', 8))
-threaded_get = partial(dask.threaded.get, num_workers=threads)
+# reads larger than this many bytes go to a temporary memmap instead of memory
+memory_budget = int(os.environ.get('GBDX_READ_MEMORY_BUDGET', 0)) or None
+spill_dir = os.environ.get('GBDX_SPILL_DIR')
+
+def _read_target(shape, dtype, out, layout):
+    # the array to read into and a band-first view of it to store blocks through
+    hwc = layout == "HWC" and len(shape) == 3
+    full = shape[1:] + shape[:1] if hwc else shape
+    if out is None:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if memory_budget and nbytes > memory_budget:
+            out = np.memmap(tempfile.TemporaryFile(dir=spill_dir), dtype=dtype, mode="w+", shape=full)
+        else:
+            out = np.empty(full, dtype=dtype)
+    elif out.shape != full:
+        raise ValueError("Can't read an image of shape {} into an array of shape {}".format(full, out.shape))
+    return out, np.moveaxis(out, -1, 0) if hwc else out
+
+def _merge_narrow(chunks, depth):
+    # merge blocks narrower than depth into their neighbours, so every block can give a full margin
+    chunks = list(chunks)
+    if depth > sum(chunks):
+        raise ValueError("Overlap depth {} is larger than the image size {}".format(depth, sum(chunks)))
+    while len(chunks) > 1 and min(chunks) < depth:
+        i = chunks.index(min(chunks))
+        j = i + 1 if i == 0 or (i < len(chunks) - 1 and chunks[i + 1] < chunks[i - 1]) else i - 1
+        chunks[min(i, j)] = chunks[i] + chunks[j]
+        del chunks[max(i, j)]
+    return tuple(chunks)
+
+def _fill(shape, nodata, dtype):
+    # a task for a block of nodata, zeros are recognised by direct reads
+    if nodata == 0:
+        return (np.zeros, shape, dtype)
+    return (np.full, shape, nodata, dtype)
+
+def _rasterize(geometry, transform, shape):
+    # True for the pixels of a block whose centers are inside the geometry
+    rows, cols = np.mgrid[0:shape[0], 0:shape[1]] + 0.5
+    xs, ys = transform.fwd(cols.ravel(), rows.ravel())
+    return vectorized.contains(geometry, np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)).reshape(shape)
+
+def _clip_block(block, mask, nodata):
+    return np.where(mask, block, np.asarray(nodata, dtype=block.dtype))
 
 class DaskMeta(namedtuple("DaskMeta", ["dask", "name", "chunks", "dtype", "shape"])):
     __slots__ = ()
@@ -64,19 +117,48 @@ class DaskImage(da.Array):
     def __daskmeta__(self):
         return DaskMeta(self)
 
-    def read(self, bands=None, **kwargs):
+    def read(self, bands=None, engine=None, out=None, layout="CHW", **kwargs):
         """Reads data from a dask array and returns the computed ndarray matching the given bands
 
+        Blocks are stored into the output as they are computed, so reading takes about as much memory
+        as the result. Results larger than GBDX_READ_MEMORY_BUDGET bytes are spilled to a temporary
+        memory-mapped file in GBDX_SPILL_DIR rather than held in memory.
+
         Args:
             bands (list): band indices to read from the image. Returns bands in the order specified in the list of bands.
+            engine (str): how to fetch tiles, either "threads" (one request per scheduler thread) or "async"
+                (all tiles fetched concurrently with the asyncio engine). Defaults to GBDX_FETCH_ENGINE or "threads".
+                With threads, images that only fetch and slice tiles are read directly into the output
+                without going through the dask scheduler, see gbdxtools.rda.direct.
+            out (ndarray): optional array or memmap to read into, of the shape of the result in `layout`
+            layout (str): the axis order of the result, "CHW" for band-first (the default) or "HWC" for band-last
 
         Returns:
-            ndarray: a numpy array of image data
+            ndarray: a numpy array of image data, `out` if it was given
         """
+        if layout not in ("CHW", "HWC"):
+            raise ValueError("Unknown layout {}, use 'CHW' or 'HWC'".format(layout))
+        shape = self.shape if bands is None else np.empty(self.shape[0])[bands].shape + self.shape[1:]
+        out, target = _read_target(shape, self.dtype, out, layout)
+        scheduler = get_scheduler()
+        engine = engine or aio.fetch_engine
+        if engine != "async" and scheduler.name == "threads" and direct.enabled:
+            tiles = direct.plan(self)
+            if tiles is not None:
+                direct.read(self, tiles, bands=bands, out=target)
+                return out
         arr = self
         if bands is not None:
             arr = self[bands, ...]
-        return arr.compute(scheduler=threaded_get)
+        with scheduler.config():
+            if not scheduler.shared_memory:
+                # blocks computed in other processes come back whole rather than being stored into the output
+                target[...] = aio.compute(arr, scheduler=scheduler.get) if engine == "async" else arr.compute(scheduler=scheduler.get)
+            elif engine == "async":
+                aio.compute(arr, scheduler=scheduler.get, out=target)
+            else:
+                da.store(arr, target, lock=False, scheduler=scheduler.get)
+        return out
 
     def randwindow(self, window_shape):
         """Get a random window of a given shape from within an image
@@ -91,16 +173,23 @@ class DaskImage(da.Array):
         col = random.randrange(window_shape[1], self.shape[2])
         return self[:, row-window_shape[0]:row, col-window_shape[1]:col]
 
-    def iterwindows(self, count=64, window_shape=(256, 256)):
+    def iterwindows(self, count=64, window_shape=(256, 256), prefetch=0):
         """ Iterate over random windows of an image
 
         Args:
             count (int): the number of the windows to generate. Defaults to 64, if `None` will continue to iterate over random windows until stopped.
             window_shape (tuple): The desired shape of each image as (height, width) in pixels.
+            prefetch (int): the number of windows ahead to download tiles for in the background. Defaults to 0.
 
         Yields:
             image: an image of the given shape and same type.
         """
+        windows = self._iterwindows(count, window_shape)
+        if prefetch:
+            windows = prefetch_windows(windows, depth=prefetch)
+        return windows
+
+    def _iterwindows(self, count, window_shape):
         if count is None:
             while True:
                 yield self.randwindow(window_shape)
@@ -134,7 +223,50 @@ class DaskImage(da.Array):
             raise ValueError("Input geometry resulted in a window outside of the image")
         return self[:, miny:maxy, minx:maxx]
 
-    def window_cover(self, window_shape, pad=True):
+    def windows_at(self, geoms, window_shape, out_of_bounds="raise", batch_size=256):
+        """ Read windows of a given size centered on many geometries at once
+
+        The vectorized counterpart of `window_at`, for building training sets from many labels.
+        The windows are read in batches in the order of the tiles they need, so windows that
+        share tiles are read together.
+
+        Args:
+            geoms: a GeoSeries, or a sequence of shapely geometries, to center the windows on
+            window_shape (tuple): the shape of each window as (height, width) in pixels.
+            out_of_bounds (str): what to do with windows that aren't entirely inside the image:
+                "raise" a ValueError (the default), "drop" them, or "pad" them with zeros.
+            batch_size (int): the number of windows to read at once. Defaults to 256.
+
+        Returns:
+            tuple: the indices of the geometries that have windows, and an ndarray of the windows
+                of shape (N, bands, height, width)
+        """
+        if out_of_bounds not in ("raise", "drop", "pad"):
+            raise ValueError("Unknown out_of_bounds {}, use 'raise', 'drop' or 'pad'".format(out_of_bounds))
+        y_size, x_size = window_shape[0], window_shape[1]
+        nbands, y_max, x_max = self.shape
+        bounds = np.array([geom.bounds for geom in geoms], dtype=float).reshape(-1, 4)
+        # the pixel centers of the geometry bounds, as window_at finds them, in one call to the transform
+        xs = bounds[:, [0, 2, 2, 0]].ravel()
+        ys = bounds[:, [1, 1, 3, 3]].ravel()
+        px, py = [np.asarray(c, dtype=float).reshape(-1, 4).mean(axis=1) for c in self.__geo_transform__.rev(xs, ys)]
+        miny, minx = (py - y_size / 2).astype(int), (px - x_size / 2).astype(int)
+        inside = (minx >= 0) & (miny >= 0) & (minx + x_size <= x_max) & (miny + y_size <= y_max)
+        if out_of_bounds == "raise" and not inside.all():
+            raise ValueError("Input geometries {} resulted in windows outside of the image".format(
+                np.flatnonzero(~inside).tolist()))
+        index = np.flatnonzero(inside) if out_of_bounds == "drop" else np.arange(len(bounds))
+        out = np.empty((len(index), nbands, y_size, x_size), dtype=self.dtype)
+        # tile order, so the windows of a batch share as many tiles as they can
+        order = np.lexsort((minx[index] // self.chunks[2][0], miny[index] // self.chunks[1][0]))
+        scheduler = get_scheduler()
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            windows = [self._window(minx[i], miny[i], minx[i] + x_size, miny[i] + y_size) for i in index[batch]]
+            out[batch], = scheduler.compute(da.stack(windows))
+        return index, out
+
+    def window_cover(self, window_shape, pad=True, prefetch=0):
         """ Iterate over a grid of windows of a specified shape covering an image.
 
         The image is divided into a grid of tiles of size window_shape. Each iteration returns
@@ -146,10 +278,18 @@ class DaskImage(da.Array):
                 width) in pixels.
             pad: (bool): Whether or not to pad edge cells. If False, cells that do not
                 have the desired shape will not be returned. Defaults to True.
+            prefetch (int): the number of windows ahead to download tiles for in the
+                background while windows are being read. Defaults to 0.
 
         Yields:
             image: image object of same type.
         """
+        windows = self._window_cover(window_shape, pad)
+        if prefetch:
+            windows = prefetch_windows(windows, depth=prefetch)
+        return windows
+
+    def _window_cover(self, window_shape, pad):
         size_y, size_x = window_shape[0], window_shape[1]
         _ndepth, _nheight, _nwidth = self.shape
         nheight, _m = divmod(_nheight, size_y)
@@ -198,6 +338,37 @@ class GeoDaskImage(DaskImage, Container, PlotMixin, BandMethodsTemplate, Depreca
         return GeoDaskImage(darr, __geo_interface__ = self.__geo_interface__,
                             __geo_transform__ = self.__geo_transform__)
 
+    def map_overlap(self, func, depth, boundary="reflect", trim=True, **kwargs):
+        ''' Queue a deferred function to run on each block of the image with a margin of its neighbours
+
+        For neighbourhood operations such as filters, morphology and texture measures. The blocks
+        stay aligned to the image tiles, so the margins are sliced from neighbouring tiles that
+        the image reads anyway rather than fetched separately. Blocks narrower than the margin,
+        at the edges of windows and AOIs, are merged into their neighbours first.
+
+        Args:
+            func (callable): the function to run on each block with its margins
+            depth (int): the width of the margins in pixels, or a (rows, columns) tuple. Bands
+                have no margin.
+            boundary (str): how to fill the margins at the edges of the image, as for
+                dask.array.map_overlap: "reflect" (the default), "periodic", "nearest", "none"
+                or a constant value
+            trim (bool): whether to trim the margins from the result of each block. Defaults to True.
+            kwargs: see dask.Array.map_blocks
+
+        Returns:
+            GeoDaskImage: a dask array with the function queued up to run when the image is read
+        '''
+        depth_y, depth_x = (depth, depth) if isinstance(depth, Integral) else depth
+        img = self
+        chunks = (self.chunks[0], _merge_narrow(self.chunks[1], depth_y), _merge_narrow(self.chunks[2], depth_x))
+        if chunks != self.chunks:
+            img = self.rechunk(chunks)
+        darr = da.Array.map_overlap(img, func, depth={0: 0, 1: depth_y, 2: depth_x}, boundary=boundary,
+                                    trim=trim, **kwargs)
+        return GeoDaskImage(darr, __geo_interface__ = self.__geo_interface__,
+                            __geo_transform__ = self.__geo_transform__)
+
     def rechunk(self, *args, **kwargs):
         darr = super(GeoDaskImage, self).rechunk(*args, **kwargs)
         return GeoDaskImage(darr, __geo_interface__ = self.__geo_interface__,
@@ -231,20 +402,28 @@ class GeoDaskImage(DaskImage, Container, PlotMixin, BandMethodsTemplate, Depreca
         # keep EPSG code strings upper case
         return self.__geo_transform__.proj.replace('epsg', 'EPSG')
 
-    def aoi(self, **kwargs):
+    def aoi(self, mode="envelope", nodata=0, **kwargs):
         """ Subsets the Image by the given bounds
 
         Args:
             bbox (list): optional. A bounding box array [minx, miny, maxx, maxy]
             wkt (str): optional. A WKT geometry string
             geojson (str): optional. A GeoJSON geometry dictionary
+            mode (str): optional. "envelope" (the default) reads every tile in the bounding box of
+                the geometry, "exact" only reads the tiles that intersect the geometry and fills the
+                pixels outside of it with nodata. `rasterize` gives the mask of the pixels inside.
+            nodata: optional. The value of the pixels outside the geometry in "exact" mode, default 0
 
         Returns:
             image: an image instance of the same type
         """
+        if mode not in ("envelope", "exact"):
+            raise ValueError("Unknown aoi mode {}, use 'envelope' or 'exact'".format(mode))
         g = self._parse_geoms(**kwargs)
         if g is None:
-            return self
+            return self if mode == "envelope" else self._clip(shape(self), nodata)
+        elif mode == "exact":
+            return self[g]._clip(g, nodata)
         else:
             return self[g]
 
@@ -329,38 +508,244 @@ class GeoDaskImage(DaskImage, Container, PlotMixin, BandMethodsTemplate, Depreca
         tfm = pyproj.Transformer.from_crs(get_proj(from_proj), get_proj(to_proj), always_xy=True)
         return ops.transform(tfm.transform, geometry)
 
-    def _slice_padded(self, _bounds):
-        pads = (max(-_bounds[0], 0), max(-_bounds[1], 0),
-                max(_bounds[2]-self.shape[2], 0), max(_bounds[3]-self.shape[1], 0))
-        bounds = (max(_bounds[0], 0),
-                  max(_bounds[1], 0),
-                  max(min(_bounds[2], self.shape[2]), 0),
-                  max(min(_bounds[3], self.shape[1]), 0))
-        result = self[:, bounds[1]:bounds[3], bounds[0]:bounds[2]]
-        if pads[0] > 0:
-            dims = (result.shape[0], result.shape[1], pads[0])
-            result = da.concatenate([da.zeros(dims, chunks=dims, dtype=result.dtype),
-                                     result], axis=2)
-        if pads[2] > 0:
-            dims = (result.shape[0], result.shape[1], pads[2])
-            result = da.concatenate([result,
-                                     da.zeros(dims, chunks=dims, dtype=result.dtype)], axis=2)
-        if pads[1] > 0:
-            dims = (result.shape[0], pads[1], result.shape[2])
-            result = da.concatenate([da.zeros(dims, chunks=dims, dtype=result.dtype),
-                                     result], axis=1)
-        if pads[3] > 0:
-            dims = (result.shape[0], pads[3], result.shape[2])
-            result = da.concatenate([result,
-                                     da.zeros(dims, chunks=dims, dtype=result.dtype)], axis=1)
-
-        return (result, _bounds[0], _bounds[1])
+    def _slice_padded(self, _bounds, cull=True):
+        """ The pixel window at bounds as a graph, padded with zeros where it falls outside the image
+
+        Images with all bands in one chunk have the window built in a single step from the
+        blocks it covers, so the cost depends on the size of the window rather than the image.
+        Others are sliced by dask and padded by concatenating blocks of zeros.
+
+        Args:
+            _bounds (tuple): the window as (minx, miny, maxx, maxy) in pixels
+            cull (bool): keep only the tasks the window needs in its graph. Leave the graph
+                lazy with False, for windows that will be sliced again before being read.
+
+        Returns:
+            tuple: the DaskMeta of the window, and its minx and miny
+        """
+        minx, miny, maxx, maxy = [int(b) for b in _bounds]
+        if len(self.chunks[0]) != 1:
+            return (self._slice_concat(minx, miny, maxx, maxy), minx, miny)
+        name = "getitem-" + tokenize(self.name, (minx, miny, maxx, maxy))
+        layer = SliceLayer(name, self.name, self.chunks, (minx, miny, maxx, maxy), dtype=self.dtype)
+        dsk = HighLevelGraph.from_collections(name, layer, dependencies=[self])
+        if cull:
+            # tasks are looked up from the keys of the window, the rest of the graph is never visited
+            dsk, _ = optimization.cull(dsk, list(layer))
+        dm = DaskMeta(dsk, name, layer.chunks, self.dtype, (self.shape[0], maxy - miny, maxx - minx))
+        return (dm, minx, miny)
+
+    def _slice_concat(self, minx, miny, maxx, maxy):
+        # a window of an image with bands in several chunks, which SliceLayer can't build
+        _nbands, ysize, xsize = self.shape
+        x0, y0 = min(max(minx, 0), xsize), min(max(miny, 0), ysize)
+        x1, y1 = max(min(maxx, xsize), x0), max(min(maxy, ysize), y0)
+        result = da.Array.__getitem__(self, (slice(None), slice(y0, y1), slice(x0, x1)))
+        for axis, before, after in ((2, x0 - minx, maxx - x1), (1, y0 - miny, maxy - y1)):
+            for size, at_end in ((before, False), (after, True)):
+                if size > 0:
+                    chunks = list(result.chunks)
+                    chunks[axis] = (size,)
+                    zeros = da.zeros(tuple(sum(c) for c in chunks), chunks=tuple(chunks), dtype=result.dtype)
+                    result = da.concatenate([result, zeros] if at_end else [zeros, result], axis=axis)
+        return DaskMeta.from_darray(result)
+
+    def _window(self, minx, miny, maxx, maxy, cull=True):
+        """ A pixel window of the image, padded with zeros where it falls outside of it
+
+        Args:
+            minx, miny, maxx, maxy (int): the window bounds in pixels
+            cull (bool): keep only the tasks the window needs in its graph
+
+        Returns:
+            image: the window as an image of the same type
+        """
+        result, minx, miny = self._slice_padded((minx, miny, maxx, maxy), cull=cull)
+        gt = self.__geo_transform__ + (minx, miny)
+        return super(GeoDaskImage, self.__class__).__new__(self.__class__, result,
+                                                           __geo_interface__=self._footprint(minx, miny, maxx, maxy),
+                                                           __geo_transform__=gt)
+
+    def clip_to(self, geometry, nodata=0):
+        """ Clip the image to a geometry, filling the pixels outside of it with nodata
+
+        The clip is lazy: each block is masked with the part of the geometry over it when the
+        image is read, and blocks entirely outside the geometry aren't fetched.
+
+        Args:
+            geometry: a shapely geometry, or an object with a __geo_interface__, in the
+                projection of the image
+            nodata: the value of the pixels outside of the geometry. Defaults to 0.
+
+        Returns:
+            image: the image over the bounds of the geometry, of the same type
+        """
+        g = shape(geometry)
+        return self[g]._clip(g, nodata)
+
+    def _clip(self, g, nodata=0):
+        # the image with the pixels outside of a geometry filled with nodata, without reading
+        # the blocks that are entirely outside of it
+        name = "clip-" + tokenize(self.name, g.wkb, nodata)
+        layer = {}
+        for i, j, where in self._geometry_blocks(g):
+            for k, nbands in enumerate(self.chunks[0]):
+                block_shape = (nbands, self.chunks[1][i], self.chunks[2][j])
+                if where is True:
+                    layer[(name, k, i, j)] = (self.name, k, i, j)
+                elif where is False:
+                    layer[(name, k, i, j)] = _fill(block_shape, nodata, self.dtype)
+                else:
+                    part, transform = where
+                    layer[(name, k, i, j)] = (_clip_block, (self.name, k, i, j),
+                                              (_rasterize, part, transform, block_shape[1:]), nodata)
+        dsk = HighLevelGraph.from_collections(name, layer, dependencies=[self])
+        dsk, _ = optimization.cull(dsk, list(layer))
+        image = super(GeoDaskImage, self.__class__).__new__(self.__class__,
+                                                            DaskMeta(dsk, name, self.chunks, self.dtype, self.shape))
+        # keeps the geo interface and transform, and the sources of the image type
+        image.__dict__.update(vars(self))
+        return image
+
+    def rasterize(self, geometry):
+        """ A lazy boolean mask of the pixels of the image inside a geometry
+
+        Pixels are inside when their centers are. Parts of multi-part geometries are all
+        included, and each block only rasterizes the part of the geometry over it.
+
+        Args:
+            geometry: a shapely geometry, or an object with a __geo_interface__, in the
+                projection of the image
+
+        Returns:
+            dask.array.Array: a boolean array of the height and width of the image
+        """
+        g = shape(geometry)
+        name = "rasterize-" + tokenize(self.name, g.wkb)
+        dsk = {}
+        for i, j, where in self._geometry_blocks(g):
+            block_shape = (self.chunks[1][i], self.chunks[2][j])
+            if where is True or where is False:
+                dsk[(name, i, j)] = (np.full, block_shape, where, bool)
+            else:
+                part, transform = where
+                dsk[(name, i, j)] = (_rasterize, part, transform, block_shape)
+        return da.Array(dsk, name, self.chunks[1:], dtype=bool)
+
+    def _geometry_blocks(self, g):
+        # for each block, True if it is inside the geometry, False if it is outside, or the part of
+        # the geometry over it and its transform if it is partly covered
+        rows, cols = self.chunks[1], self.chunks[2]
+        ys, xs = cached_cumsum(rows, initial_zero=True), cached_cumsum(cols, initial_zero=True)
+        prepared = prep(g)
+        for i, j in product(range(len(rows)), range(len(cols))):
+            cell = shape(self._footprint(xs[j], ys[i], xs[j + 1], ys[i + 1]))
+            if prepared.contains(cell):
+                yield i, j, True
+            elif prepared.intersects(cell) and g.intersection(cell).area > 0:
+                yield i, j, (g.intersection(cell), self.__geo_transform__ + (xs[j], ys[i]))
+            else:
+                # including blocks the geometry only touches, none of their pixels are inside
+                yield i, j, False
+
+    def _footprint(self, minx, miny, maxx, maxy):
+        # the geo interface of the transformed pixel box, in one vectorized call to the transform
+        xs = np.array([maxx, maxx, minx, minx, maxx], dtype=float)
+        ys = np.array([miny, maxy, maxy, miny, miny], dtype=float)
+        ring = tuple(zip(*[np.asarray(c).tolist() for c in self.__geo_transform__.fwd(xs, ys)]))
+        return {"type": "Polygon", "coordinates": (ring,)}
+
+    def _window_cover(self, window_shape, pad):
+        size_y, size_x = window_shape[0], window_shape[1]
+        _ndepth, height, width = self.shape
+        if pad is False:
+            height, width = height - height % size_y, width - width % size_x
+        for miny, minx in product(range(0, height, size_y), range(0, width, size_x)):
+            yield self._window(minx, miny, minx + size_x, miny + size_y)
+
+    def window_batches(self, window_shape, batch_size=32, stride=None, pad=True):
+        """ Iterate over batches of windows covering an image, each read as one array
+
+        The windows of a batch are read together, so tiles shared by overlapping windows,
+        or windows that straddle the same tile, are only fetched once per batch.
+
+        Args:
+            window_shape (tuple): the shape of each window as (height, width) in pixels.
+            batch_size (int): the number of windows in each batch. Defaults to 32.
+            stride (tuple): the distance between window origins as (rows, columns) in pixels, or
+                an int for both. Smaller than window_shape for overlapping windows, such as for
+                sliding window inference. Defaults to window_shape.
+            pad (bool): whether to include windows that extend past the edge of the image, padded
+                with zeros. If False, only windows inside the image are returned. Defaults to True.
+
+        Yields:
+            tuple: the (row, column) pixel origins of the windows, and an ndarray of the batch of
+                shape (N, bands, height, width)
+        """
+        size_y, size_x = window_shape[0], window_shape[1]
+        if stride is None:
+            stride = (size_y, size_x)
+        elif isinstance(stride, Integral):
+            stride = (stride, stride)
+        _nbands, height, width = self.shape
+        if pad:
+            rows = range(0, max(height - size_y, 0) + stride[0], stride[0])
+            cols = range(0, max(width - size_x, 0) + stride[1], stride[1])
+        else:
+            rows = range(0, height - size_y + 1, stride[0])
+            cols = range(0, width - size_x + 1, stride[1])
+        origins = list(product(rows, cols))
+        scheduler = get_scheduler()
+        for start in range(0, len(origins), batch_size):
+            batch = origins[start:start + batch_size]
+            windows = [self._window(x, y, x + size_x, y + size_y) for y, x in batch]
+            data, = scheduler.compute(da.stack(windows))
+            yield batch, data
+
+    def window_loader(self, window_shape, batch_size=16, count=None, locality=0.75, workers=2, queue_size=4,
+                      seed=None):
+        """ Iterate over batches of random windows read in the background, for training models
+
+        Most windows are drawn near recently drawn windows, so they reuse tiles that are cached
+        or already downloading, see gbdxtools.rda.sampler.
+
+        Args:
+            window_shape (tuple): the shape of each window as (height, width) in pixels.
+            batch_size (int): the number of windows in each batch. Defaults to 16.
+            count (int): the number of batches, or None to continue until the loader is closed.
+            locality (float): the fraction of windows drawn near recent windows, from 0 for
+                uniformly random windows to 1. Defaults to 0.75.
+            workers (int): the number of batches to read at once. Defaults to 2.
+            queue_size (int): the most batches to read ahead. Defaults to 4.
+            seed (int): seed for the random windows.
+
+        Returns:
+            WindowLoader: an iterator of the (row, column) origins of the windows of each batch
+                and an ndarray of the batch of shape (N, bands, height, width)
+        """
+        sampler = WindowSampler(self, window_shape, locality=locality, seed=seed)
+        return WindowLoader(sampler, batch_size=batch_size, count=count, workers=workers, queue_size=queue_size)
 
     def __contains__(self, g):
         geometry = ops.transform(self.__geo_transform__.rev, g)
         img_bounds = box(0, 0, *self.shape[2:0:-1])
         return img_bounds.contains(geometry)
 
+    def _is_window(self, index):
+        # all bands of an in-bounds, step 1 pixel window
+        band_idx, y_idx, x_idx = index
+        if self.ndim != 3 or len(self.chunks[0]) != 1 or not (isinstance(band_idx, slice) and band_idx == slice(None)):
+            return False
+        _nbands, ysize, xsize = self.shape
+        for idx, size in ((y_idx, ysize), (x_idx, xsize)):
+            start = 0 if idx.start is None else idx.start
+            stop = size if idx.stop is None else idx.stop
+            if idx.step not in (None, 1) or not all(isinstance(i, Integral) for i in (start, stop)):
+                return False
+            if not 0 <= start < min(stop, size):
+                return False
+        return True
+
     def __getitem__(self, geometry):
         if isinstance(geometry, BaseGeometry) or getattr(geometry, "__geo_interface__", None) is not None:
             g = shape(geometry)
@@ -403,7 +788,11 @@ class GeoDaskImage(DaskImage, Container, PlotMixin, BandMethodsTemplate, Depreca
                     raise IndexError("Index completely out of image bounds")
 
                 g = ops.transform(self.__geo_transform__.fwd, box(xmin, ymin, xmax, ymax))
-                result = super(GeoDaskImage, self).__getitem__(geometry)
+                if self._is_window(geometry):
+                    # plain pixel windows skip dask's slicing and culling of the parent graph
+                    result, _, _ = self._slice_padded((xmin, ymin, min(xmax, xsize), min(ymax, ysize)))
+                else:
+                    result = super(GeoDaskImage, self).__getitem__(geometry)
 
             else:
                 return super(GeoDaskImage, self).__getitem__(geometry)
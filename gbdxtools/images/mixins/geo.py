@@ -10,6 +10,7 @@ import mercantile
 from shapely.geometry import box, shape, mapping, asShape
 from gbdxtools.deprecate import deprecation
 from gbdxtools.images.browse_image import BrowseImage
+from gbdxtools.rda.scheduler import get_scheduler
 
 import numpy as np
 try:
@@ -51,16 +52,14 @@ class PlotMixin(object):
             return self.histogram_stretch(use_bands, stretch=[0, 100], **kwargs)
         # DRA'ed images should be left alone if not explicitly adjusted
         elif kwargs["histogram"] == "ignore" or self.options.get('dra'):
-            data = self._read(self[use_bands,...], **kwargs)
-            return np.rollaxis(data, 0, 3)
+            return self._read(self[use_bands,...], layout="HWC", **kwargs)
         else:
             raise KeyError('Unknown histogram parameter, use "equalize", "match", "minmax", or "ignore"')
 
     def histogram_equalize(self, use_bands, **kwargs):
         ''' Equalize and the histogram and normalize value range
             Equalization is on all three bands, not per-band'''
-        data = self._read(self[use_bands,...], **kwargs)
-        data = np.rollaxis(data.astype(np.float32), 0, 3)
+        data = self._read(self[use_bands,...], layout="HWC", **kwargs).astype(np.float32)
         flattened = data.flatten()
         if 0 in data:
             masked = np.ma.masked_values(data, 0).compressed()
@@ -79,8 +78,7 @@ class PlotMixin(object):
     def histogram_match(self, use_bands, blm_source='browse', **kwargs):
         ''' Match the histogram to Browse imagery '''
         assert has_rio, "To match image histograms please install rio_hist"
-        data = self._read(self[use_bands,...], **kwargs)
-        data = np.rollaxis(data.astype(np.float32), 0, 3)
+        data = self._read(self[use_bands,...], layout="HWC", **kwargs).astype(np.float32)
         if 0 in data:
             data = np.ma.masked_values(data, 0)
         bounds = self._reproject(box(*self.bounds), from_proj=self.proj, to_proj="EPSG:4326").bounds
@@ -94,8 +92,7 @@ class PlotMixin(object):
 
     def histogram_stretch(self, use_bands, **kwargs):
         ''' entry point for contrast stretching '''
-        data = self._read(self[use_bands,...], **kwargs)
-        data = np.rollaxis(data.astype(np.float32), 0, 3)
+        data = self._read(self[use_bands,...], layout="HWC", **kwargs).astype(np.float32)
         return self._histogram_stretch(data, **kwargs)
 
     def _histogram_stretch(self, data, **kwargs):
@@ -202,11 +199,11 @@ class PlotMixin(object):
         plt.imshow(tfm(**kwargs), interpolation='nearest', cmap=kwargs.get("cmap", None))
         plt.show(block=False)
 
-    def _read(self, data, **kwargs):
+    def _read(self, data, layout="CHW", **kwargs):
         if hasattr(data, 'read'):
-            return data.read(**kwargs)
-        else:
-            return data.compute(scheduler=threaded_get)
+            return data.read(layout=layout, **kwargs)
+        data, = get_scheduler().compute(data)
+        return np.rollaxis(data, 0, 3) if layout == "HWC" else data
 
     def _single_band(self, **kwargs):
         arr = self._read(self, **kwargs)
@@ -1,6 +1,17 @@
+import os
 import sys
+import operator
+import warnings
+from numbers import Integral
+
+import numpy as np
+from dask import optimization
+from dask.base import tokenize
+from dask.core import flatten
+from dask.highlevelgraph import HighLevelGraph
 
 from gbdxtools.images.meta import DaskMeta, GeoDaskImage
+from gbdxtools.rda import direct
 from gbdxtools.rda.util import RatPolyTransform, AffineTransform, deprecation, get_proj
 from gbdxtools.auth import Auth
 
@@ -16,6 +27,10 @@ try:
 except NameError:
     xrange = range
 
+# select bands in RDA rather than after fetching every band, set GBDX_BAND_PUSHDOWN=0 to turn off. The first
+# selection from a template creates a band selecting template in RDA, so indexing an image makes a POST.
+band_pushdown = os.environ.get("GBDX_BAND_PUSHDOWN", "1").lower() in ("1", "true", "yes")
+
 def _reproject(geo, from_proj, to_proj):
     if from_proj != to_proj:
         from_proj = get_proj(from_proj)
@@ -117,26 +132,114 @@ class RDAGeoAdapter(object):
 def rda_image_shift(image):
     minx, maxx = image.__geo__.minx, image.__geo__.maxx
     miny, maxy = image.__geo__.miny, image.__geo__.maxy
-    return image[:, miny:maxy, minx:maxx]
+    _nbands, ysize, xsize = image.shape
+    # a lazy window, so the tiles of the strip are only looked at once an AOI is read
+    return image._window(minx, miny, min(maxx, xsize), min(maxy, ysize), cull=False)
+
+
+def _compose(indexes, tile_shape):
+    # the slices of a tile as a single slice of each axis, all bands kept
+    index = [slice(None)]
+    for axis, size in enumerate(tile_shape, 1):
+        pixels = range(size)
+        for idx in indexes:
+            if idx[0] != slice(None):
+                return None
+            pixels = pixels[idx[axis]]
+        if pixels.step != 1:
+            return None
+        index.append(slice(None) if pixels == range(size) else slice(pixels.start, pixels.stop))
+    return tuple(index)
 
 
 class RDAImage(GeoDaskImage):
     _default_proj = "EPSG:4326"
 
     def __new__(cls, op, **kwargs):
+        if kwargs.get("tile_format") is not None:
+            op.tile_format = kwargs["tile_format"]
         cls.__geo__ = RDAGeoAdapter(op.metadata, dfp=cls._default_proj)
         cls.__geo_transform__ = cls.__geo__.geo_transform
         cls.__geo_interface__ = cls.__geo__.geo_interface
         cls._rda_op = op
         self = super(RDAImage, cls).__new__(cls, op)
-        return rda_image_shift(self)
+        image = rda_image_shift(self)
+        image._rda_op = op
+        return image
 
     def __getitem__(self, geometry):
+        if isinstance(geometry, tuple) and len(geometry) == 3 and not isinstance(geometry[0], slice):
+            # slice the window first, then ask RDA for just the bands of it
+            window = self[(slice(None),) + geometry[1:]]
+            selected = window._select_bands(geometry[0]) if isinstance(window, RDAImage) else None
+            if selected is not None:
+                return selected[0, :, :] if isinstance(geometry[0], Integral) else selected
         im = super(RDAImage, self).__getitem__(geometry)
         if isinstance(im, GeoDaskImage):
             im._rda_op = self._rda_op
         return im
 
+    def _select_bands(self, bands):
+        """ The image with the given bands fetched from RDA in place of all of them
+
+        The tiles are requested from a band selecting template, and the blocks of this image
+        are rebuilt from them with the same slices.
+
+        Args:
+            bands: band indices, as for numpy indexing
+
+        Returns:
+            image: the band selected image, or None if the bands can't be selected in RDA
+        """
+        if not band_pushdown or self.ndim != 3 or len(self.chunks[0]) != 1 or not hasattr(self.rda, "band_select"):
+            return None
+        try:
+            indices = np.atleast_1d(np.arange(self.shape[0])[bands]).tolist()
+        except IndexError:
+            return None
+        if not indices or indices == list(range(self.shape[0])):
+            return None
+        dsk = self.__dask_graph__()
+        img_md = self.rda.metadata["image"]
+        tile_shape = (img_md["tileYSize"], img_md["tileXSize"])
+        blocks = []
+        for key in flatten(self.__dask_keys__()):
+            source = direct.block_source(dsk, key)
+            if source is None:
+                return None
+            source_key, indexes = source
+            if dsk[source_key][0] is np.zeros:
+                blocks.append((key, None, None))
+            elif source_key[0] == self.rda.name and _compose(indexes, tile_shape) is not None:
+                blocks.append((key, source_key, _compose(indexes, tile_shape)))
+            else:
+                return None
+        rda = self.rda.band_select(indices)
+        if rda is None:
+            return None
+        try:
+            tiles = rda.dask
+        except Exception as e:
+            warnings.warn("Unable to select bands {} in RDA, fetching all bands: {}".format(indices, e))
+            return None
+        name = "bands-" + tokenize(self.name, rda.name)
+        chunks = ((len(indices),),) + self.chunks[1:]
+        layer = {}
+        for (_, _, i, j), source_key, index in blocks:
+            if source_key is None:
+                layer[(name, 0, i, j)] = (np.zeros, (len(indices), chunks[1][i], chunks[2][j]), self.dtype)
+            else:
+                tile = (rda.name,) + source_key[1:]
+                layer[(name, 0, i, j)] = tile if index == (slice(None),) * 3 else (operator.getitem, tile, index)
+        graph = HighLevelGraph({name: layer, rda.name: tiles}, {name: {rda.name}, rda.name: set()})
+        graph, _ = optimization.cull(graph, list(layer))
+        dm = DaskMeta(graph, name, chunks, self.dtype, (len(indices),) + self.shape[1:])
+        image = super(GeoDaskImage, self.__class__).__new__(self.__class__, dm,
+                                                            __geo_interface__=self.__geo_interface__,
+                                                            __geo_transform__=self.__geo_transform__)
+        image._rda_op = rda
+        return image
+
     @property
     def __daskmeta__(self):
         return self.rda
@@ -161,7 +264,11 @@ class RDAImage(GeoDaskImage):
     def read(self, bands=None, quiet=True, **kwargs):
         if not quiet:
             print('Fetching Image... {} {}'.format(self.ntiles, 'tiles' if self.ntiles > 1 else 'tile'))
-        return super(RDAImage, self).read(bands=bands)
+        if bands is not None:
+            selected = self._select_bands(bands)
+            if selected is not None:
+                return super(RDAImage, selected).read(bands=0 if isinstance(bands, Integral) else None, **kwargs)
+        return super(RDAImage, self).read(bands=bands, **kwargs)
 
     def materialize(self, node=None, bounds=None, callback=None, out_format='TIF', **kwargs):
         """
@@ -3,17 +3,37 @@ GBDX Template Image Interface.
 
 Contact: marc.pfister@maxar.com
 """
-from gbdxtools.images.rda_image import RDAImage, GraphMeta
+import os
+import warnings
+from copy import deepcopy
+
+from gbdxtools.images.rda_image import RDAImage, GraphMeta, RDAGeoAdapter, _reproject
 from gbdxtools.rda.graph import get_rda_graph_template, get_rda_template_metadata, VIRTUAL_RDA_URL, get_template_stats, \
     create_rda_template, materialize_status, materialize_template
 from gbdxtools.auth import Auth
-from gbdxtools.rda.fetch import load_url
+from gbdxtools.rda.fetch import load_url, accept_header
 from gbdxtools.rda.util import RDA_TO_DTYPE
+from gbdxtools.images.layers import TemplateTileLayer
+from shapely import wkt, ops
 from shapely.geometry import box
+from dask.base import tokenize
 from urllib.parse import urlencode
 
 
+BAND_SELECT_NODE = "GbdxtoolsBandSelect"
+
+# fill tiles outside of the image bounds with zeros rather than fetching them, set GBDX_SKIP_EMPTY_TILES=0 to turn off
+skip_empty_tiles = os.environ.get("GBDX_SKIP_EMPTY_TILES", "1").lower() in ("1", "true", "yes")
+# pixels added around the image bounds, so tiles the bounds only just miss are still fetched
+FOOTPRINT_MARGIN = 2
+
+
 class TemplateMeta(GraphMeta):
+    # encoding to request tiles in, see gbdxtools.rda.fetch.accept_header
+    tile_format = os.environ.get("GBDX_TILE_FORMAT")
+    # templates with a band selection node added, by template id and node, None where one couldn't be made
+    _band_templates = {}
+
     def __init__(self, name, node_id=None, **kwargs):
         self._template_name = name
         self._template_id = None
@@ -43,24 +63,39 @@ class TemplateMeta(GraphMeta):
             self._template_id = template.get("id")
         return self._graph
 
-    def _collect_urls(self):
-        img_md = self.metadata["image"]
-        rda_id = self._template_id
-        qs = urlencode(self._params)
-        return {(y, x): f"{VIRTUAL_RDA_URL}/template/{rda_id}/tile/{x}/{y}?{qs}"
-                for y in range(img_md['minTileY'], img_md["maxTileY"] + 1)
-                for x in range(img_md['minTileX'], img_md["maxTileX"] + 1)}
-
     @property
     def dask(self):
-        _name = self.name
         img_md = self.metadata["image"]
-        return {(_name, 0, y - img_md['minTileY'], x - img_md['minTileX']): (load_url, url)
-                for (y, x), url in self._collect_urls().items()}
+        accept = accept_header(self.tile_format, self.dtype)
+        return TemplateTileLayer(self.name, load_url,
+                                 f"{VIRTUAL_RDA_URL}/template/{self._template_id}/tile", urlencode(self._params),
+                                 img_md['minTileX'], img_md['minTileY'],
+                                 img_md['maxTileX'] - img_md['minTileX'] + 1,
+                                 img_md['maxTileY'] - img_md['minTileY'] + 1,
+                                 args=() if accept is None else (accept,),
+                                 footprint=self._footprint(),
+                                 tile_shape=(img_md['numBands'], img_md['tileYSize'], img_md['tileXSize']),
+                                 dtype=self.dtype)
+
+    def _footprint(self):
+        # the image bounds in pixels of the tile grid. Only for georeferenced images: the
+        # bounds of images with a sensor model don't account for terrain.
+        md = self.metadata
+        bounds = md["image"].get("imageBoundsWGS84")
+        if not skip_empty_tiles or md["georef"] is None or bounds is None:
+            return None
+        geo = RDAGeoAdapter(md)
+        footprint = _reproject(wkt.loads(bounds), "EPSG:4326", geo.srs)
+        return ops.transform(geo.tfm.rev, footprint).buffer(FOOTPRINT_MARGIN)
 
     @property
     def name(self):
-        return "image-{}".format(self._id)
+        # derived from the template, its parameters and the tile encoding, so the same image
+        # always has the same keys and shared tiles are only fetched once per graph. Only what
+        # the caller gave is used, so naming an image doesn't fetch its template
+        token = tokenize(self._template_name, self._node_id, self._params, self.tile_format)
+        node = self._node_id or self._params.get("nodeId") or self._template_name
+        return "image-{}-{}".format(node, token)
 
     @property
     def chunks(self):
@@ -102,6 +137,52 @@ class TemplateMeta(GraphMeta):
                 (img_md["maxTileY"] - img_md["minTileY"] + 1) * img_md["tileYSize"],
                 (img_md["maxTileX"] - img_md["minTileX"] + 1) * img_md["tileXSize"])
 
+    def band_select(self, bands):
+        """ The image with only the given bands, selected by RDA so tiles are sent with just those bands
+
+        A BandSelect node is added after the rendered node of the template, as a new template
+        that is made once per template and node and takes the band indices as a parameter.
+
+        Args:
+            bands (list): band indices, in the order to return them
+
+        Returns:
+            TemplateMeta: the band selected image, or None if the band selecting template can't be made
+        """
+        source = getattr(self, "_band_source", None)
+        if source is not None:
+            # select from the original bands rather than stacking band selections
+            parent, indices = source
+            return parent.band_select([indices[b] for b in bands])
+        graph = self.graph()
+        node = self._params.get("nodeId") or graph.get("defaultNodeId") or self._id
+        key = (self._template_id, node)
+        if key not in self._band_templates:
+            selected = deepcopy(graph)
+            selected.pop("id", None)
+            selected["nodes"].append({"id": BAND_SELECT_NODE, "operator": "BandSelect",
+                                      "parameters": {"bandIndices": "${bandIndices}"}})
+            # single node templates have no edges
+            selected.setdefault("edges", []).append({"id": BAND_SELECT_NODE + "-edge", "index": 1,
+                                                     "source": node, "destination": BAND_SELECT_NODE})
+            selected["defaultNodeId"] = BAND_SELECT_NODE
+            try:
+                selected["id"] = create_rda_template(self._interface.gbdx_connection, selected)
+            except Exception as e:
+                # don't retry, or warn again, for every selection from this template
+                warnings.warn("Unable to select bands of {} in RDA, fetching all bands: {}".format(key, e))
+                selected = None
+            self._band_templates[key] = selected
+        selected = self._band_templates[key]
+        if selected is None:
+            return None
+        params = dict(self._params, nodeId=BAND_SELECT_NODE, bandIndices=",".join(str(b) for b in bands))
+        meta = TemplateMeta(selected["id"], BAND_SELECT_NODE, **params)
+        meta._graph, meta._template_id = selected, selected["id"]
+        meta.tile_format = self.tile_format
+        meta._band_source = (self, list(bands))
+        return meta
+
     def _materialize(self, node=None, bounds=None, callback=None, out_format='TIF', **kwargs):
         conn = self._interface.gbdx_connection
         graph = self.graph()
@@ -137,13 +218,15 @@ class RDATemplateImage(object):
     Args:
         name (str): The RDA template name or ID
         node_id (str): the node ID to render as the image (defaults to None) 
+        tile_format (str): the encoding to request tiles in, such as "png", "jpeg" or "tiff-deflate",
+            or "auto" for the smallest lossless encoding (defaults to the server's choice)
         kwargs: Parameters needed to fill the template params
 
     Returns:
         image (ndarray): An image instance
     '''
 
-    def __new__(cls, name, node_id=None, **kwargs):
+    def __new__(cls, name, node_id=None, tile_format=None, **kwargs):
         if node_id and 'nodeId' not in kwargs:
             kwargs['nodeId'] = node_id
-        return RDAImage(TemplateMeta(name, node_id, **kwargs))
\ No newline at end of file
+        return RDAImage(TemplateMeta(name, node_id, **kwargs), tile_format=tile_format)
\ No newline at end of file
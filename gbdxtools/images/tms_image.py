@@ -1,29 +1,34 @@
-import uuid
-from io import BytesIO
-from functools import lru_cache
-
 import numpy as np
 import mercantile
-import requests
 from affine import Affine
-from imageio import imread
 
 from gbdxtools.images.meta import GeoDaskImage, DaskMeta
 from gbdxtools.rda.util import AffineTransform
+from gbdxtools.rda.cache import load_tile
+from gbdxtools.connections import connection_manager, TMS_USER_AGENT
+from gbdxtools.rda.fetch import tile_loader, decode_tile
+from gbdxtools.rda.governor import governor
+from gbdxtools.rda.hedge import hedger
 
 from shapely.geometry import mapping, box
 from shapely.geometry.base import BaseGeometry
 from shapely import ops
+from dask.base import tokenize
 import pyproj
 
-@lru_cache(maxsize=128)
+USER_AGENT = {'user-agent': TMS_USER_AGENT}
+
+@tile_loader(headers=lambda: USER_AGENT)
 def load_url(url):
-    user_agent = {'user-agent': 'GBDXtools v0.17.1 contact GBDX-Support@digitalglobe.com'}
-    r = requests.get(url, headers=user_agent)
+    return load_tile(url, _fetch_url)
+
+def _fetch_url(url):
+    return hedger.call(url, _request_tile)
+
+def _request_tile(url):
+    r = governor.get(connection_manager.tms_session(), url)
     r.raise_for_status()
-    memfile = BytesIO(r.content)
-    arr = imread(memfile)
-    return np.rollaxis(arr, 2, 0)
+    return decode_tile(r.content, r.headers.get('Content-Type'))
 
 class EphemeralImage(Exception):
     pass
@@ -36,7 +41,6 @@ def raise_aoi_required():
 class TmsMeta(object):
     def __init__(self, url, zoom=18, bounds=None):
         self.zoom_level = zoom
-        self._name = "image-{}".format(str(uuid.uuid4()))
         self._url = url
 
         _first_tile = mercantile.Tile(z=self.zoom_level, x=0, y=0)
@@ -66,15 +70,17 @@ class TmsMeta(object):
 
     @property
     def name(self):
-        return self._name
+        # the same tiles always get the same keys, so they are only fetched once per graph
+        bounds = None if self._bounds is None else tuple(self._bounds)
+        return "image-{}".format(tokenize(self._url, self.zoom_level, bounds))
 
     @property
     def dask(self):
         if self._bounds is None:
-            return {self._name: (raise_aoi_required, )}
+            return {self.name: (raise_aoi_required, )}
         else:
             urls, shape = self._collect_urls(self.bounds)
-            return {(self._name, 0, y, x): (load_url, url) for (y, x), url in urls.items()}
+            return {(self.name, 0, y, x): (load_url, url) for (y, x), url in urls.items()}
 
     @property
     def dtype(self):
@@ -205,9 +211,12 @@ class TmsImage(GeoDaskImage):
     def rgb(self, **kwargs):
         return np.rollaxis(self.read(), 0, 3)
 
-    def aoi(self, **kwargs):
+    def aoi(self, mode="envelope", nodata=0, **kwargs):
+        if mode not in ("envelope", "exact"):
+            raise ValueError("Unknown aoi mode {}, use 'envelope' or 'exact'".format(mode))
         g = self._parse_geoms(**kwargs)
-        return self.__class__(bounds=list(g.bounds), **self._base_args)[g]
+        image = self.__class__(bounds=list(g.bounds), **self._base_args)[g]
+        return image._clip(g, nodata) if mode == "exact" else image
 
     def __getitem__(self, geometry):
         if isinstance(geometry, BaseGeometry) or getattr(geometry, "__geo_interface__", None) is not None:
@@ -4,6 +4,7 @@ from shapely import wkt
 from shapely.geometry import box
 import warnings
 from gbdxtools.rda.error import MissingMetadata
+from gbdxtools.rda.governor import governor
 
 band_types = {
     'Ms': 'MS',
@@ -41,13 +42,12 @@ def vector_services_query(query, aoi=None, **kwargs):
 
 
 def _req_with_retries(conn, url, retries=5):
-    for i in range(retries):
-        try:
-            res = conn.get(url)
-            if res.status_code != 502:
-                return res
-        except:
-            pass
+    try:
+        res = governor.get(conn, url, retries=retries, retry_on=[502])
+    except Exception:
+        return None
+    if res.status_code != 502:
+        return res
     return None
 
 
@@ -0,0 +1,291 @@
+"""
+Asyncio tile fetching engine.
+
+Instead of each scheduler thread making one blocking request at a time, the
+engine pulls every tile a read needs out of the image graph and fetches them
+from a single event loop. Hundreds of requests can be in flight over a small
+pool of keep-alive connections (multiplexed over HTTP/2 if the h2 package is
+installed). The decoded tiles are put back into the graph in place of their
+fetch tasks and the rest of the graph runs on the normal scheduler.
+
+Requires httpx. Select the engine with `image.read(engine="async")` or set
+GBDX_FETCH_ENGINE=async to make it the default. GBDX_MAX_IN_FLIGHT and
+GBDX_MAX_CONNECTIONS set the request and connection limits; requests also
+share the per-host limits of the concurrency governor with the threaded fetcher.
+"""
+import os
+import asyncio
+import operator
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import httpx
+    has_httpx = True
+except ImportError:
+    has_httpx = False
+
+try:
+    import h2
+    has_h2 = True
+except ImportError:
+    has_h2 = False
+
+from dask import optimization
+from dask.core import flatten
+from dask.array.core import slices_from_chunks
+
+try:
+    from dask._task_spec import Alias, DataNode, Task, TaskRef
+    has_task_spec = True
+except ImportError:
+    # dask before 2024.12 only builds graphs of tuples
+    has_task_spec = False
+
+from gbdxtools.rda import cache
+from gbdxtools.rda.cache import tile_key, request_key
+from gbdxtools.rda.error import CacheMiss
+from gbdxtools.rda.fetch import tile_loaders, decode_tile, refresh_token
+from gbdxtools.rda.governor import governor, backoff, RETRIES, RETRY_STATUS
+from gbdxtools.rda.hedge import hedger
+
+fetch_engine = os.environ.get("GBDX_FETCH_ENGINE", "threads")
+
+MAX_IN_FLIGHT = int(os.environ.get("GBDX_MAX_IN_FLIGHT", 256))
+MAX_CONNECTIONS = int(os.environ.get("GBDX_MAX_CONNECTIONS", 16))
+
+
+class AsyncTileEngine(object):
+    """ Fetches and decodes tiles concurrently on a background event loop
+
+    The event loop runs in its own daemon thread so the engine can be used from
+    code that already has a running loop, such as a Jupyter kernel. The HTTP
+    client and its connections are kept open between reads.
+
+    Args:
+        max_in_flight (int): maximum number of requests in flight at once
+        max_connections (int): maximum number of open connections
+    """
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_connections=MAX_CONNECTIONS):
+        assert has_httpx, "To use the async fetch engine please install httpx"
+        self.max_in_flight = max_in_flight
+        self.max_connections = max_connections
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+        self._decoder = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="gbdxtools-tile-engine", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def fetch(self, requests):
+        """ Fetch and decode tiles
+
+        Args:
+            requests (dict): tile request keys mapped to the url to fetch them from and a
+                function returning the headers for each request, so they carry the current token
+
+        Returns:
+            dict: tile request keys mapped to the decoded tiles
+        """
+        if not requests:
+            return {}
+        future = asyncio.run_coroutine_threadsafe(self._fetch_all(requests), self.loop)
+        return future.result()
+
+    async def _fetch_all(self, requests):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self._client = httpx.AsyncClient(http2=has_h2, limits=limits,
+                                             timeout=httpx.Timeout(60.0, pool=None))
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        async def fetch(key, url, headers):
+            async with in_flight:
+                return key, await hedger.call_async(url, self._fetch_one, headers)
+
+        results = await asyncio.gather(*[fetch(key, url, headers) for key, (url, headers) in requests.items()])
+        return dict(results)
+
+    async def _fetch_one(self, url, headers):
+        # same governor and retry policy as the threaded fetcher, without tying up a thread while we wait
+        limiter = governor.limiter(url)
+        loop = asyncio.get_event_loop()
+        err = None
+        refreshed = False
+        for i in range(RETRIES):
+            await limiter.acquire_async()
+            start = loop.time()
+            request_headers = headers()
+            try:
+                r = await self._client.get(url, headers=request_headers)
+            except asyncio.CancelledError:
+                # a hedged request that lost the race
+                limiter.release()
+                raise
+            except Exception as e:
+                limiter.release(error=e)
+                err = e
+            else:
+                limiter.release(status=r.status_code, latency=loop.time() - start)
+                bearer = request_headers.get('Authorization', '')
+                if r.status_code == 401 and bearer.startswith('Bearer ') and not refreshed:
+                    # the token expired or was revoked, get a new one from the session and try again
+                    await loop.run_in_executor(None, refresh_token, bearer[len('Bearer '):])
+                    refreshed = True
+                    continue
+                if r.status_code not in RETRY_STATUS:
+                    try:
+                        r.raise_for_status()
+                    except Exception as e:
+                        err = e
+                        break
+                    return await loop.run_in_executor(self._decoder, decode_tile, r.content,
+                                                      r.headers.get('Content-Type'))
+                err = "{} {}".format(r.status_code, r.reason_phrase)
+            if i < RETRIES - 1:
+                await asyncio.sleep(backoff(i))
+        raise TypeError(f"Unable to download tile {url} in {RETRIES} retries. \n\n Last fetch error: {err}")
+
+
+_engine = None
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = AsyncTileEngine()
+    return _engine
+
+
+def as_tuple(task):
+    """ A graph task as a (function, *args) tuple, however dask stores it
+
+    Newer versions of dask build graphs of Task objects. These are turned back into
+    tuples, with references to other keys replaced by the keys. Tasks with keyword
+    arguments, and anything that isn't a task, are returned as is.
+    """
+    if has_task_spec:
+        if isinstance(task, Task):
+            if task.kwargs:
+                return task
+            return (task.func,) + tuple(as_tuple(arg) for arg in task.args)
+        if isinstance(task, Alias):
+            return task.target
+        if isinstance(task, TaskRef):
+            return task.key
+        if isinstance(task, DataNode):
+            return task.value
+    return task
+
+
+def is_tile_task(task):
+    """ True if a graph task is a call to one of the registered tile loaders """
+    task = as_tuple(task)
+    try:
+        return type(task) is tuple and len(task) > 1 and task[0] in tile_loaders
+    except TypeError:
+        return False
+
+
+def tile_request(task):
+    """ The (url, accept) of a tile task """
+    task = as_tuple(task)
+    url = task[1]
+    accept = task[2] if len(task) > 2 else None
+    return url, accept
+
+
+def _request_headers(headers, accept=None):
+    headers = headers()
+    return headers if accept is None else dict(headers, Accept=accept)
+
+
+def fetch_tiles(tasks):
+    """ Fetch the tiles for a collection of tile tasks through the tile caches and the engine
+
+    Args:
+        tasks (iterable): tile loader tasks, calls of (loader, url) or (loader, url, accept)
+
+    Returns:
+        dict: tile request keys mapped to the decoded tiles
+    """
+    dc = cache.disk_cache
+    found, missing, requests = {}, {}, {}
+    for task in set(as_tuple(task) for task in tasks):
+        loader = task[0]
+        url, accept = tile_request(task)
+        key = request_key(url, accept)
+        if key in requests:
+            continue
+        requests[key] = (url, accept)
+        arr = cache.tile_cache.get(key)
+        if arr is not None:
+            found[key] = arr
+            continue
+        if dc is not None:
+            arr = dc.get(tile_key(url, accept))
+            if arr is not None:
+                cache.tile_cache.put(key, arr)
+                found[key] = arr
+                continue
+            if dc.offline:
+                raise CacheMiss("Tile {} is not in the tile cache at {} and offline mode is enabled".format(url, dc.path))
+        missing[key] = (url, partial(_request_headers, tile_loaders[loader], accept))
+    # tiles already being fetched elsewhere in the process are waited on rather than requested again
+    claimed, waiting = {}, {}
+    for key, request in missing.items():
+        future, leader = cache.in_flight.claim(key)
+        if leader:
+            claimed[key] = request
+        else:
+            waiting[key] = future
+    try:
+        fetched = get_engine().fetch(claimed)
+    except Exception as e:
+        for key in claimed:
+            cache.in_flight.resolve(key, error=e)
+        raise
+    for key, arr in fetched.items():
+        if dc is not None:
+            dc.put(tile_key(*requests[key]), arr)
+        cache.tile_cache.put(key, arr)
+        cache.in_flight.resolve(key, arr)
+    found.update(fetched)
+    found.update({key: future.result() for key, future in waiting.items()})
+    return found
+
+
+def compute(arr, scheduler, out=None):
+    """ Compute a dask array, fetching all of its tiles with the async engine first
+
+    Args:
+        arr (dask.array.Array): the array to compute
+        scheduler (callable): dask get function used for the rest of the graph
+        out (ndarray): optional array to store the blocks into as they are computed,
+            instead of concatenating them at the end
+
+    Returns:
+        ndarray: the computed array
+    """
+    keys = arr.__dask_keys__()
+    dsk, _ = optimization.cull(arr.__dask_graph__(), keys)
+    tiles = {key: task for key, task in dsk.items() if is_tile_task(task)}
+    arrays = fetch_tiles(tiles.values())
+    dsk.update({key: arrays[request_key(*tile_request(task))] for key, task in tiles.items()})
+    if out is not None:
+        name = "store-" + arr.name
+        stores = {(name,) + key[1:]: (operator.setitem, out, region, key)
+                  for key, region in zip(flatten(keys), slices_from_chunks(arr.chunks))}
+        dsk.update(stores)
+        scheduler(dsk, list(stores))
+        return out
+    finalize, args = arr.__dask_postcompute__()
+    return finalize(scheduler(dsk, keys), *args)
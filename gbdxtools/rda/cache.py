@@ -0,0 +1,533 @@
+"""
+Tile caching for RDA and TMS image reads.
+
+Tiles are cached at two levels. The in-memory tile cache holds decoded tiles
+up to a byte budget, optionally compressing the least recently used entries.
+It is configured with:
+
+    GBDX_TILE_CACHE_BYTES     memory budget in bytes, defaults to 512MB, 0 disables the cache
+    GBDX_TILE_CACHE_COMPRESS  codec for cold entries: lz4, blosc or zlib. Off by default.
+
+Behind it, decoded tiles can also be stored on disk as .npy files addressed by
+a hash of the normalized tile URL, so the same tile requested by a later
+process is read from disk instead of being downloaded again. The disk cache is
+disabled until a cache directory is configured, either with set_disk_cache()
+or with the following environment variables:
+
+    GBDX_CACHE_DIR      directory to store tiles in
+    GBDX_CACHE_SIZE     size cap in bytes, defaults to 2GB
+    GBDX_CACHE_OFFLINE  if set to a true value, never fetch tiles that aren't cached
+"""
+import os
+import time
+import zlib
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import Future
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import numpy as np
+
+from gbdxtools.rda.error import CacheMiss
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import lz4.frame
+    has_lz4 = True
+except ImportError:
+    has_lz4 = False
+
+try:
+    import blosc
+    has_blosc = True
+except ImportError:
+    has_blosc = False
+
+DEFAULT_CACHE_SIZE = 2 * 1024 ** 3
+DEFAULT_MEMORY_SIZE = 512 * 1024 ** 2
+
+
+def tile_key(url, accept=None):
+    """ Build a content address for a tile URL
+
+    The key is a hash of the URL with its query parameters sorted, so the
+    template ID, the template parameters, and the tile x/y all contribute to the
+    key but the order the parameters were given in does not.
+
+    Args:
+        url (str): the tile url
+        accept (str): the Accept header the tile is requested with, if any
+
+    Returns:
+        str: a hex digest identifying the tile
+    """
+    parts = urlsplit(url)
+    qs = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    normed = "{}://{}{}?{}".format(parts.scheme, parts.netloc.lower(), parts.path, qs)
+    if accept is not None:
+        # tiles in a lossy encoding aren't interchangeable with the server's default
+        normed += "#accept=" + accept
+    return hashlib.sha256(normed.encode("utf-8")).hexdigest()
+
+
+def request_key(url, accept=None):
+    """ The key a tile request is cached and coalesced under in memory """
+    return url if accept is None else (url, accept)
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "entries", "nbytes", "max_bytes"])
+
+_codecs = {
+    "zlib": (lambda buf, itemsize: zlib.compress(buf, 1),
+             lambda buf: bytearray(zlib.decompress(buf))),
+}
+if has_lz4:
+    _codecs["lz4"] = (lambda buf, itemsize: lz4.frame.compress(buf),
+                      lambda buf: lz4.frame.decompress(buf, return_bytearray=True))
+if has_blosc:
+    _codecs["blosc"] = (lambda buf, itemsize: blosc.compress(buf, typesize=itemsize),
+                        lambda buf: blosc.decompress(buf, as_bytearray=True))
+
+
+class TileCache(object):
+    """ A thread-safe, least recently used cache of decoded tiles with a byte budget
+
+    Entries are evicted by size rather than by count, so the cache holds a predictable
+    amount of memory whatever the tile dtype and band count. If a codec is given, the
+    least recently used entries beyond the hot share of the budget are kept compressed
+    and decompressed again when they are next read.
+
+    Args:
+        max_bytes (int): the memory budget in bytes, 0 disables the cache
+        compress (str): codec for cold entries: "lz4", "blosc", "zlib" or None
+        hot_fraction (float): share of the budget kept uncompressed when compressing
+    """
+    def __init__(self, max_bytes=DEFAULT_MEMORY_SIZE, compress=None, hot_fraction=0.5):
+        if compress is not None and compress not in _codecs:
+            raise ValueError("Unknown or unavailable tile cache codec {}, use one of {}".format(compress, sorted(_codecs)))
+        self.max_bytes = int(max_bytes)
+        self.compress = compress
+        self.hot_fraction = hot_fraction
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # key -> (value, nbytes, (shape, dtype) if compressed)
+        self._hot = OrderedDict()      # keys of uncompressed entries, in LRU order
+        self._nbytes = 0
+        self._hot_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """ The memory currently held by cached tiles in bytes """
+        return self._nbytes
+
+    def get(self, key):
+        """ Read a tile from the cache
+
+        Args:
+            key (str): the tile key
+
+        Returns:
+            ndarray: the cached tile, or None if the tile isn't cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value, nbytes, meta = entry
+            if meta is None:
+                self._entries.move_to_end(key)
+                if key in self._hot:
+                    self._hot.move_to_end(key)
+                return value
+            shape, dtype = meta
+            arr = np.frombuffer(_codecs[self.compress][1](value), dtype=dtype).reshape(shape)
+            self._discard(key)
+            self._insert(key, arr)
+            return arr
+
+    def put(self, key, arr):
+        """ Add a tile to the cache, evicting least recently used tiles to stay within budget
+
+        Args:
+            key (str): the tile key
+            arr (ndarray): the decoded tile
+        """
+        if arr.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._insert(key, arr)
+
+    def clear(self):
+        """ Remove every tile from the cache and reset the counters """
+        with self._lock:
+            self._entries.clear()
+            self._hot.clear()
+            self._nbytes = self._hot_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def resize(self, max_bytes):
+        """ Change the memory budget, evicting tiles if the cache is now over budget
+
+        Args:
+            max_bytes (int): the new memory budget in bytes
+        """
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._shrink()
+
+    def cache_info(self):
+        """ Report cache statistics
+
+        Returns:
+            CacheInfo: named tuple of hits, misses, evictions, entries, nbytes and max_bytes
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, len(self._entries),
+                             self._nbytes, self.max_bytes)
+
+    def _insert(self, key, arr):
+        self._entries[key] = (arr, arr.nbytes, None)
+        self._hot[key] = None
+        self._nbytes += arr.nbytes
+        self._hot_bytes += arr.nbytes
+        self._shrink()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._nbytes -= entry[1]
+            if key in self._hot:
+                del self._hot[key]
+                self._hot_bytes -= entry[1]
+
+    def _shrink(self):
+        if self.compress is not None:
+            hot_budget = self.max_bytes * self.hot_fraction
+            while self._hot_bytes > hot_budget and len(self._hot) > 1:
+                key, _ = self._hot.popitem(last=False)
+                arr, nbytes, _ = self._entries[key]
+                self._hot_bytes -= nbytes
+                packed = _codecs[self.compress][0](np.ascontiguousarray(arr).tobytes(), arr.itemsize)
+                if len(packed) < nbytes:
+                    self._entries[key] = (packed, len(packed), (arr.shape, arr.dtype))
+                    self._nbytes += len(packed) - nbytes
+        while self._nbytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._discard(key)
+            self.evictions += 1
+
+
+class DiskCache(object):
+    """ A size-capped, least recently used cache of decoded tiles on disk
+
+    Several processes can share the same cache directory. Tiles are written to
+    a temporary file and atomically moved into place, reads refresh the file's
+    modification time, and eviction removes the least recently used files until
+    the cache is back under 90% of its size cap.
+
+    Args:
+        path (str): directory to store the tiles in, created if needed
+        max_size (int): size cap of the cache in bytes
+        offline (bool): raise CacheMiss instead of fetching tiles that are not cached
+    """
+    suffix = ".npy"
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE, offline=False):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_size = int(max_size)
+        self.offline = offline
+        self._size = None
+        os.makedirs(self.path, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.path, key[:2], key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """ Read a tile from the cache
+
+        Args:
+            key (str): the tile key
+
+        Returns:
+            ndarray: the cached tile, or None if the tile isn't cached
+        """
+        path = self._path(key)
+        try:
+            arr = np.load(path, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # a truncated or corrupt file, treat it as a miss
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return arr
+
+    def put(self, key, arr):
+        """ Store a tile in the cache, evicting old tiles if the cache is full
+
+        Args:
+            key (str): the tile key
+            arr (ndarray): the decoded tile
+        """
+        path = self._path(key)
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(arr), allow_pickle=False)
+            os.replace(tmp, path)
+        except Exception:
+            self._remove(tmp)
+            raise
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_size:
+            self.evict()
+
+    def size(self):
+        """ The total size of the cached tiles in bytes """
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self, target=None):
+        """ Remove least recently used tiles until the cache is under the target size
+
+        If another process is already evicting from the same directory this is a no-op.
+
+        Args:
+            target (int): size to shrink the cache to in bytes, defaults to 90% of max_size
+        """
+        if target is None:
+            target = int(self.max_size * 0.9)
+        with _EvictionLock(os.path.join(self.path, ".lock")) as locked:
+            if not locked:
+                return
+            entries = sorted(self._entries(), key=lambda e: e[1])
+            total = sum(size for _, _, size in entries)
+            for path, _, size in entries:
+                if total <= target:
+                    break
+                if self._remove(path):
+                    total -= size
+            self._size = total
+
+    def clear(self):
+        """ Remove all tiles from the cache """
+        self.evict(target=0)
+
+    def _entries(self):
+        stale = time.time() - 3600
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(self.suffix):
+                    yield path, st.st_mtime, st.st_size
+                elif name.endswith(".tmp") and st.st_mtime < stale:
+                    # left behind by a process that died mid-write
+                    self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+class SingleFlight(object):
+    """ Coalesces concurrent requests for the same key into one call
+
+    The first caller to claim a key becomes its leader and does the work, later
+    callers get the leader's future and wait on it. Claims are released as soon
+    as the leader resolves them, so this only deduplicates work that is in
+    flight at the same time; caching the result is up to the caller.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def claim(self, key):
+        """ Claim a key
+
+        Args:
+            key: the key to claim
+
+        Returns:
+            tuple: the Future for the key, and True if the caller is the leader and must resolve it
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def resolve(self, key, result=None, error=None):
+        """ Release a claimed key, passing its result or error to everyone waiting on it """
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args):
+        """ Call fn(*args), or wait for the result of an identical call already in flight """
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.resolve(key, error=e)
+            raise
+        self.resolve(key, result)
+        return result
+
+
+class _EvictionLock(object):
+    """ Non-blocking inter-process lock, a no-op where fcntl isn't available """
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return True
+        self._f = open(self.path, "a")
+        try:
+            fcntl.flock(self._f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._f.close()
+            self._f = None
+            return False
+        return True
+
+    def __exit__(self, *args):
+        if self._f is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
+
+
+tile_cache = TileCache(max_bytes=int(os.environ.get("GBDX_TILE_CACHE_BYTES", DEFAULT_MEMORY_SIZE)),
+                       compress=os.environ.get("GBDX_TILE_CACHE_COMPRESS") or None)
+
+# tile urls currently being fetched, shared by the threaded loaders and the async engine
+in_flight = SingleFlight()
+
+
+def _from_env():
+    path = os.environ.get("GBDX_CACHE_DIR")
+    if not path:
+        return None
+    size = int(os.environ.get("GBDX_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+    offline = os.environ.get("GBDX_CACHE_OFFLINE", "").lower() in ("1", "true", "yes")
+    return DiskCache(path, max_size=size, offline=offline)
+
+disk_cache = _from_env()
+
+
+def set_disk_cache(path, max_size=DEFAULT_CACHE_SIZE, offline=False):
+    """ Configure the persistent tile cache used by all image reads
+
+    Args:
+        path (str): directory to store tiles in. Pass None to disable the disk cache.
+        max_size (int): size cap of the cache in bytes, defaults to 2GB
+        offline (bool): only read tiles from the cache, never from the network
+
+    Returns:
+        DiskCache: the configured cache, or None if disabled
+    """
+    global disk_cache
+    disk_cache = DiskCache(path, max_size=max_size, offline=offline) if path is not None else None
+    return disk_cache
+
+
+def cached_fetch(url, fetch, accept=None):
+    """ Read a tile through the disk cache
+
+    Args:
+        url (str): the tile url
+        fetch (callable): function that downloads and decodes the tile at url
+        accept (str): the Accept header fetch requests the tile with, if any
+
+    Returns:
+        ndarray: the decoded tile
+    """
+    cache = disk_cache
+    if cache is None:
+        return fetch(url)
+    key = tile_key(url, accept)
+    arr = cache.get(key)
+    if arr is not None:
+        return arr
+    if cache.offline:
+        raise CacheMiss("Tile {} is not in the tile cache at {} and offline mode is enabled".format(url, cache.path))
+    arr = fetch(url)
+    cache.put(key, arr)
+    return arr
+
+
+def load_tile(url, fetch, accept=None):
+    """ Read a tile through the memory and disk caches
+
+    Concurrent requests for the same tile, from any thread, share a single fetch.
+
+    Args:
+        url (str): the tile url
+        fetch (callable): function that downloads and decodes the tile at url
+        accept (str): the Accept header fetch requests the tile with, if any
+
+    Returns:
+        ndarray: the decoded tile
+    """
+    key = request_key(url, accept)
+    arr = tile_cache.get(key)
+    if arr is None:
+        arr = in_flight.do(key, _load_tile, url, fetch, accept)
+    return arr
+
+
+def _load_tile(url, fetch, accept):
+    # the tile may have been cached by a fetch that finished after our first lookup
+    key = request_key(url, accept)
+    arr = tile_cache.get(key)
+    if arr is None:
+        arr = cached_fetch(url, fetch, accept)
+        tile_cache.put(key, arr)
+    return arr
@@ -0,0 +1,172 @@
+"""
+Tile decoding backends.
+
+Decoding JPEG and PNG tiles is the main CPU cost of a read. By default tiles
+are decoded on the thread that fetched them. Other backends can be selected
+with the GBDX_DECODER environment variable or `set_decoder`:
+
+    inline:      decode on the calling thread (default)
+    processes:   decode in a process pool, so decoding never holds the GIL of the fetching process
+    imagecodecs: decode with the imagecodecs package, which releases the GIL while decoding
+
+Tiles are already fetched from many threads, so a thread pool would only hand
+each tile to another thread under the same GIL. GBDX_DECODE_WORKERS sets the
+size of the process pool (default: the number of CPUs).
+
+Tiles are returned band-first.
+"""
+import os
+import threading
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import imageio
+import tifffile
+
+try:
+    import imagecodecs
+    has_imagecodecs = True
+except ImportError:
+    has_imagecodecs = False
+
+WORKERS = int(os.environ.get("GBDX_DECODE_WORKERS", os.cpu_count() or 1))
+
+
+def _band_first(arr):
+    if arr.ndim == 3:
+        return np.rollaxis(arr, 2, 0)
+    return np.expand_dims(arr, axis=0)
+
+
+def media_type(content_type):
+    """ The media type of a Content-Type header, without its parameters """
+    if content_type is None:
+        return None
+    return content_type.split(';')[0].strip().lower()
+
+
+def read_image(content, content_type=None):
+    """ Decode an encoded tile with tifffile or imageio, returning it as the decoder lays it out """
+    memfile = BytesIO(content)
+    if media_type(content_type) == 'image/tiff':
+        return tifffile.imread(memfile)
+    return imageio.imread(memfile)
+
+
+_codecs = {
+    'image/jpeg': ('jpeg8_decode', 'jpeg_decode'),
+    'image/png': ('png_decode',),
+    'image/tiff': ('tiff_decode',),
+    'image/webp': ('webp_decode',),
+}
+
+
+def read_image_imagecodecs(content, content_type=None):
+    """ Decode an encoded tile with imagecodecs, falling back to imageio for other formats """
+    for name in _codecs.get(media_type(content_type), ()):
+        codec = getattr(imagecodecs, name, None)
+        if codec is not None:
+            return codec(content)
+    return read_image(content, content_type)
+
+
+class Decoder(object):
+    """ Decodes tiles on the calling thread """
+    name = "inline"
+
+    def __init__(self, workers=None):
+        self.workers = workers
+
+    def read(self, content, content_type=None):
+        return read_image(content, content_type)
+
+    def decode(self, content, content_type=None):
+        """ Decode a tile
+
+        Args:
+            content (bytes): the encoded tile
+            content_type (str): the tile's mime type
+
+        Returns:
+            ndarray: the band-first tile
+        """
+        return _band_first(self.read(content, content_type))
+
+    def shutdown(self):
+        pass
+
+
+class ProcessDecoder(Decoder):
+    """ Decodes tiles in a pool of processes """
+    name = "processes"
+
+    def __init__(self, workers=None):
+        super(ProcessDecoder, self).__init__(workers or WORKERS)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                # forking a process that is running scheduler threads can copy held locks into the children
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def read(self, content, content_type=None):
+        return self.pool.submit(read_image, content, content_type).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+class ImagecodecsDecoder(Decoder):
+    """ Decodes tiles on the calling thread with imagecodecs, which doesn't hold the GIL while decoding """
+    name = "imagecodecs"
+
+    def __init__(self, workers=None):
+        assert has_imagecodecs, "To use the imagecodecs decoder please install imagecodecs"
+        super(ImagecodecsDecoder, self).__init__(workers)
+
+    def read(self, content, content_type=None):
+        return read_image_imagecodecs(content, content_type)
+
+
+decoders = {cls.name: cls for cls in (Decoder, ProcessDecoder, ImagecodecsDecoder)}
+
+_decoder = None
+
+
+def set_decoder(name, workers=None):
+    """ Select the tile decoding backend
+
+    Args:
+        name (str): one of "inline", "processes" or "imagecodecs"
+        workers (int): the pool size for the processes backend
+    """
+    global _decoder
+    if name not in decoders:
+        raise ValueError("Unknown tile decoder {}, choose from {}".format(name, ", ".join(sorted(decoders))))
+    decoder = decoders[name](workers)
+    if _decoder is not None:
+        _decoder.shutdown()
+    _decoder = decoder
+    return decoder
+
+
+def get_decoder():
+    """ The active tile decoder, created from GBDX_DECODER on first use """
+    if _decoder is None:
+        set_decoder(os.environ.get("GBDX_DECODER", "inline"))
+    return _decoder
+
+
+def decode(content, content_type=None):
+    """ Decode a tile into a band-first array with the active decoder """
+    return get_decoder().decode(content, content_type)
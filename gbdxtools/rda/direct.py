@@ -0,0 +1,160 @@
+"""
+Direct reads of fetch-and-slice images.
+
+Most reads are of an image, or a window or AOI of one, with nothing else in
+the graph: each block of the result is a tile, or a slice of one. Computing
+these with dask costs a task per tile and per slice and a final concatenate,
+which adds up on reads of thousands of tiles. `plan` recognises these graphs
+and `read` fetches their tiles from a bounded thread pool, placing each one
+straight into the output array. Graphs that do anything else, such as user
+`map_blocks` or band math, aren't planned and are computed by dask as before.
+
+Direct reads are on by default, set GBDX_DIRECT_READ=0 to always use dask.
+"""
+import os
+import operator
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+import numpy as np
+from dask.core import flatten
+from dask.array.slicing import cached_cumsum
+
+from gbdxtools.rda.aio import as_tuple, is_tile_task
+from gbdxtools.rda.scheduler import get_scheduler, threads
+
+try:
+    from dask.array.chunk import getitem
+    # newer versions of dask slice blocks with their own getitem
+    GETITEMS = (operator.getitem, getitem)
+except ImportError:
+    GETITEMS = (operator.getitem,)
+
+enabled = os.environ.get("GBDX_DIRECT_READ", "1").lower() in ("1", "true", "yes")
+
+# the longest chain of aliases and slices followed back to a tile
+MAX_DEPTH = 16
+
+_pool = None
+_pool_workers = None
+_lock = threading.Lock()
+
+
+def _executor():
+    # a thread per scheduler worker, made again when the scheduler changes
+    global _pool, _pool_workers
+    workers = get_scheduler().num_workers or threads
+    with _lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gbdxtools-read")
+            _pool_workers = workers
+        return _pool
+
+
+def _is_key(dsk, value):
+    try:
+        return value in dsk
+    except TypeError:
+        return False
+
+
+def _is_slices(index):
+    return type(index) is tuple and all(isinstance(i, slice) for i in index)
+
+
+def _is_zeros(task):
+    return type(task) is tuple and len(task) == 3 and task[0] is np.zeros
+
+
+def block_source(dsk, key):
+    """ Follow a block back to the tile (or zeros) it is sliced from
+
+    Returns:
+        tuple: the key of the tile task and the slices applied to it in order, or None if
+            the block is made some other way
+    """
+    task, indexes = as_tuple(dsk[key]), []
+    for _ in range(MAX_DEPTH):
+        if is_tile_task(task) or _is_zeros(task):
+            return key, indexes[::-1]
+        if _is_key(dsk, task):
+            key = task
+            task = as_tuple(dsk[key])
+        elif (type(task) is tuple and len(task) == 3 and task[0] in GETITEMS
+              and _is_key(dsk, task[1]) and _is_slices(task[2])):
+            indexes.append(task[2])
+            key = task[1]
+            task = as_tuple(dsk[key])
+        else:
+            return None
+    return None
+
+
+def plan(arr):
+    """ Where every block of an array comes from, if it only fetches and slices tiles
+
+    Args:
+        arr (dask.array.Array): a band-first image array
+
+    Returns:
+        dict: tile tasks mapped to a list of (output slices, slices of the tile) for each
+            block made from them, zeros tasks are keyed by None. None if the array can't
+            be read directly.
+    """
+    if arr.ndim != 3 or len(arr.chunks[0]) != 1:
+        return None
+    dsk = arr.__dask_graph__()
+    rows = cached_cumsum(arr.chunks[1], initial_zero=True)
+    cols = cached_cumsum(arr.chunks[2], initial_zero=True)
+    tiles = {}
+    for key in flatten(arr.__dask_keys__()):
+        source = block_source(dsk, key)
+        if source is None:
+            return None
+        source_key, indexes = source
+        task = as_tuple(dsk[source_key])
+        _, _, i, j = key
+        region = (slice(rows[i], rows[i + 1]), slice(cols[j], cols[j + 1]))
+        tiles.setdefault(None if _is_zeros(task) else task, []).append((region, indexes))
+    return tiles
+
+
+def _place(task, blocks, out, bands):
+    tile = task[0](*task[1:])
+    for (ys, xs), indexes in blocks:
+        block = tile
+        for index in indexes:
+            block = block[index]
+        if bands is not None:
+            block = block[bands]
+        np.copyto(out[..., ys, xs], block, casting="unsafe")
+
+
+def read(arr, tiles, bands=None, out=None):
+    """ Read an array by fetching its tiles into the output from a thread pool
+
+    Args:
+        arr (dask.array.Array): the array to read
+        tiles (dict): the plan of the array
+        bands: band indices to read, as for numpy indexing
+        out (ndarray): band-first array to read into, such as a memmap
+
+    Returns:
+        ndarray: the image data
+    """
+    if out is None:
+        nbands, height, width = arr.shape
+        band_shape = np.empty(nbands)[bands].shape if bands is not None else (nbands,)
+        out = np.empty(band_shape + (height, width), dtype=arr.dtype)
+    for (ys, xs), _ in tiles.pop(None, []):
+        out[..., ys, xs] = 0
+    pool = _executor()
+    futures = [pool.submit(_place, task, blocks, out, bands) for task, blocks in tiles.items()]
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for future in pending:
+        future.cancel()
+    for future in done:
+        future.result()
+    return out
@@ -41,3 +41,9 @@ class PendingDeprecation(PendingDeprecationWarning):
 
 class IncompatibleOptions(Exception):
     pass
+
+class CacheMiss(Exception):
+    pass
+
+class CircuitOpen(Exception):
+    pass
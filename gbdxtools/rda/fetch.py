@@ -1,33 +1,124 @@
-from time import sleep
-from io import BytesIO
-from functools import lru_cache
+import time
+import threading
+from functools import partial
+
 import numpy as np
-import imageio
-import tifffile
 
 from gbdxtools.auth import Auth
+from gbdxtools.rda.cache import load_tile
+from gbdxtools.rda.decode import decode
+from gbdxtools.rda.error import CircuitOpen, IncompatibleOptions
+from gbdxtools.rda.governor import governor, RETRIES
+from gbdxtools.rda.hedge import hedger
 conn = Auth().gbdx_connection
 
+# tile loading functions used in image graphs, mapped to a function
+# returning the request headers needed to fetch their urls
+tile_loaders = {}
+
+def tile_loader(headers):
+    def register(fn):
+        tile_loaders[fn] = headers
+        return fn
+    return register
+
+_token_lock = threading.Lock()
+
+def _token(gbdx_conn):
+    token = getattr(gbdx_conn, 'token', None)
+    return token if isinstance(token, dict) else {}
+
+def refresh_token(expired=None):
+    """ Get a new access token for the gbdx session, as the session does when a request finds its token expired
+
+    For requests made outside of the session, such as by the async fetch engine.
+
+    Args:
+        expired (str): the access token that was found expired or rejected. Nothing is done
+            if the session has a different token, another request has already refreshed it.
+    """
+    gbdx_conn = Auth().gbdx_connection
+    with _token_lock:
+        token = _token(gbdx_conn)
+        refresh_url = getattr(gbdx_conn, 'auto_refresh_url', None)
+        if refresh_url is None or (expired is not None and token.get('access_token') != expired):
+            return
+        token = gbdx_conn.refresh_token(refresh_url)
+        if gbdx_conn.token_updater:
+            gbdx_conn.token_updater(token)
+
+def rda_headers():
+    gbdx_conn = Auth().gbdx_connection
+    headers = {'User-Agent': gbdx_conn.headers.get('User-Agent')}
+    token = _token(gbdx_conn)
+    if token.get('expires_at') and token['expires_at'] < time.time():
+        refresh_token(token.get('access_token'))
+        token = _token(gbdx_conn)
+    if 'access_token' in token:
+        headers['Authorization'] = 'Bearer {}'.format(token['access_token'])
+    return headers
+
+# tile encodings that can be asked for, mapped to their media types
+TILE_FORMATS = {
+    "tiff": "image/tiff",
+    "tiff-deflate": "image/tiff; compression=deflate",
+    "tiff-zstd": "image/tiff; compression=zstd",
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+# encodings that can't hold every data type
+FORMAT_DTYPES = {
+    "png": (np.uint8, np.uint16),
+    "jpeg": (np.uint8,),
+    "webp": (np.uint8,),
+}
+
+def accept_header(tile_format, dtype):
+    """ The Accept header to request tiles in an encoding with
+
+    Args:
+        tile_format (str): one of TILE_FORMATS, "auto" for the smallest lossless
+            encoding for the data type, or None for the server's default
+        dtype: the data type of the tiles
+
+    Returns:
+        str: the Accept header, None to use the server's default
+    """
+    if tile_format is None:
+        return None
+    dtype = np.dtype(dtype)
+    if tile_format == "auto":
+        tile_format = "png" if dtype in FORMAT_DTYPES["png"] else "tiff-deflate"
+    if tile_format not in TILE_FORMATS:
+        raise ValueError("Unknown tile format {}, choose from {}".format(tile_format, ", ".join(sorted(TILE_FORMATS))))
+    if dtype not in FORMAT_DTYPES.get(tile_format, (dtype,)):
+        raise IncompatibleOptions("{} tiles can't hold {} data".format(tile_format, dtype))
+    # a server that can't encode the tile as asked still sends its default rather than a 406
+    return "{}, */*;q=0.1".format(TILE_FORMATS[tile_format])
+
+def decode_tile(content, content_type=None):
+    return decode(content, content_type)
+
 # cache tile fetches so we don't re-request tiles from RDA
-@lru_cache(maxsize=128)
-def load_url(url):
-    # try 5 times to get a tile from RDA
-    # but sleep an exponentially increasing amount
-    # so that RDA autoscaling can catch up
-    for i in range(5):
-        try:
-            r = conn.get(url)
-            r.raise_for_status()
-            memfile = BytesIO(r.content)
-            if r.headers['Content-Type'] == 'image/tiff':
-                arr = tifffile.imread(memfile)
-            else:
-                arr = imageio.imread(memfile)
-            if len(arr.shape) == 3:
-                arr = np.rollaxis(arr, 2, 0)
-            else:
-                arr = np.expand_dims(arr, axis=0)
-            return arr
-        except Exception as e:
-            sleep(2**i)
-    raise TypeError(f"Unable to download tile {url} in 5 retries. \n\n Last fetch error: {e}")
+@tile_loader(headers=rda_headers)
+def load_url(url, accept=None):
+    fetch = _fetch_url if accept is None else partial(_fetch_url, accept=accept)
+    return load_tile(url, fetch, accept)
+
+def _fetch_url(url, accept=None):
+    return hedger.call(url, _request_tile, accept)
+
+def _request_tile(url, accept=None):
+    # the governor retries overloaded requests with jittered exponential
+    # backoff so that RDA autoscaling can catch up
+    headers = None if accept is None else {'Accept': accept}
+    try:
+        r = governor.get(conn, url, headers=headers)
+        r.raise_for_status()
+    except CircuitOpen:
+        raise
+    except Exception as e:
+        raise TypeError(f"Unable to download tile {url} in {RETRIES} retries. \n\n Last fetch error: {e}")
+    return decode_tile(r.content, r.headers['Content-Type'])
@@ -0,0 +1,307 @@
+"""
+Process-wide concurrency governor for GBDX HTTP traffic.
+
+Every tile and RDA request made by gbdxtools takes a slot from the limiter for
+its host before it is sent, so the number of requests in flight to a host is
+bounded no matter how many scheduler threads, event loops or images are
+fetching at once.
+
+The per-host limit adapts to the service (AIMD): it grows by one request per
+round trip while responses come back healthy, and is cut multiplicatively when
+the host answers 429/502/503/504, when requests fail to connect, or when
+latency climbs well above what the host has shown it can do. Retries back off
+exponentially with full jitter instead of sleeping fixed amounts, so a burst of
+throttled requests doesn't come back as a second burst.
+
+A host that keeps failing (500s, connection errors) trips a circuit breaker:
+for a cool-down period requests fail immediately with CircuitOpen rather than
+queueing behind timeouts, then a single probe request decides whether to close
+it again while other requests wait on its outcome. Throttling responses are
+not failures, the host is up and only needs fewer requests.
+
+Configuration:
+    GBDX_HOST_MAX_IN_FLIGHT: upper bound (and starting value) of the per-host limit, default 64
+    GBDX_CIRCUIT_FAILURES: consecutive failures that open a host's circuit, default 10
+    GBDX_CIRCUIT_RESET: seconds a circuit stays open before it is probed, default 30
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from gbdxtools.rda.error import CircuitOpen
+
+MAX_IN_FLIGHT = int(os.environ.get("GBDX_HOST_MAX_IN_FLIGHT", 64))
+FAILURE_THRESHOLD = int(os.environ.get("GBDX_CIRCUIT_FAILURES", 10))
+RESET_TIMEOUT = float(os.environ.get("GBDX_CIRCUIT_RESET", 30))
+RETRIES = 5
+
+# responses that mean the host is overloaded and the request should be tried again
+THROTTLE_STATUS = frozenset([429, 502, 503, 504])
+RETRY_STATUS = THROTTLE_STATUS | frozenset([500])
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+HostStats = namedtuple("HostStats", ["limit", "in_flight", "state", "latency", "throttled", "failures"])
+
+
+class HostLimiter(object):
+    """ Adaptive in-flight request limit and circuit breaker for a single host
+
+    Args:
+        max_limit (int): the most requests allowed in flight at once
+        min_limit (int): the limit is never cut below this
+        failure_threshold (int): consecutive failures that open the circuit
+        reset_timeout (float): seconds the circuit stays open before a probe is let through
+        backoff (float): multiplicative decrease applied when the host throttles or fails
+        latency_factor (float): latency this many times the host's baseline counts as congestion
+    """
+    def __init__(self, max_limit=MAX_IN_FLIGHT, min_limit=1, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT, backoff=0.5, latency_factor=4.0):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.state = CLOSED
+        self.failures = 0
+        self.throttled = 0
+        self.latency = None
+        self._baseline = None
+        self._opened_at = 0
+        self._last_decrease = 0
+        self._probing = False
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    def _try_acquire(self):
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpen("Too many failed requests, not sending more for {:.0f}s".format(
+                    self.reset_timeout - (time.monotonic() - self._opened_at)))
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probing:
+                # wait for the probe to close the circuit or open it again
+                return False
+            self._probing = True
+        elif self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def acquire(self, timeout=None):
+        """ Block until a request slot is free
+
+        While a probe request decides whether to close the host's circuit, waits for its outcome.
+
+        Raises:
+            CircuitOpen: if the host's circuit is open
+            TimeoutError: if no slot frees up within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._try_acquire():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No request slot became free in {}s".format(timeout))
+                self._cond.wait(remaining)
+
+    async def acquire_async(self):
+        """ Wait for a request slot from a coroutine without blocking the event loop """
+        loop = asyncio.get_event_loop()
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, status=None, latency=None, error=None):
+        """ Give back a request slot and adjust the limit from the outcome of the request
+
+        Release without a status or error for a request that was cancelled.
+
+        Args:
+            status (int): the response status code, if a response was received
+            latency (float): seconds the request took
+            error (Exception): the connection error, if no response was received
+        """
+        with self._cond:
+            self.in_flight -= 1
+            probe, self._probing = (self._probing and self.state == HALF_OPEN), False
+            if status in THROTTLE_STATUS:
+                self.throttled += 1
+            if status is None and error is None:
+                # the request was cancelled, there's nothing to learn from it
+                pass
+            elif status in THROTTLE_STATUS:
+                # the host is up (or scaling up) but we are asking too much of it
+                self.failures = 0
+                self._close(probe)
+                self._decrease(self.backoff)
+            elif error is not None or status >= 500:
+                self._failure(probe)
+                self._decrease(self.backoff)
+            else:
+                self.failures = 0
+                self._close(probe)
+                if latency is not None and self._congested(latency):
+                    self._decrease(0.9)
+                elif self.limit < self.max_limit:
+                    # additive increase: about one more request per round trip
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def _congested(self, latency):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self._baseline is None or self.latency < self._baseline:
+            self._baseline = self.latency
+        else:
+            # let the baseline drift up slowly so a permanently slower host doesn't stay "congested"
+            self._baseline += 0.01 * (self.latency - self._baseline)
+        return self.latency > self.latency_factor * self._baseline
+
+    def _decrease(self, factor):
+        # one cut per round trip: a burst of throttled responses to requests that
+        # were all sent at the old limit shouldn't collapse the limit to the minimum
+        now = time.monotonic()
+        if now - self._last_decrease >= (self.latency or 1.0):
+            self.limit = max(self.min_limit, self.limit * factor)
+            self._last_decrease = now
+
+    def _failure(self, probe):
+        self.failures += 1
+        if probe or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+    def _close(self, probe):
+        if probe:
+            self.state = CLOSED
+
+    def _wake(self):
+        self._cond.notify_all()
+        waiters = [(loop, waiter) for loop, waiter in self._async_waiters if not waiter.cancelled()]
+        free = len(waiters) if self.state != CLOSED else int(self.limit) - self.in_flight
+        woken, self._async_waiters = waiters[:free], waiters[free:]
+        for loop, waiter in woken:
+            loop.call_soon_threadsafe(_set_waiter, waiter)
+
+    def stats(self):
+        with self._cond:
+            return HostStats(int(self.limit), self.in_flight, self.state, self.latency,
+                             self.throttled, self.failures)
+
+
+def _set_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Governor(object):
+    """ Hands out request slots for every host gbdxtools talks to
+
+    Args:
+        **kwargs: HostLimiter options used for every host
+    """
+    def __init__(self, **kwargs):
+        self._options = kwargs
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, url):
+        """ The HostLimiter for a url's host """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostLimiter(**self._options)
+            return self._hosts[host]
+
+    def configure(self, **kwargs):
+        """ Change the HostLimiter options, dropping the state of every host """
+        with self._lock:
+            self._options.update(kwargs)
+            self._hosts = {}
+
+    @contextmanager
+    def slot(self, url):
+        """ Hold a request slot for a url's host while the block runs
+
+        Call `record` on the yielded object with the response status code. An
+        exception raised inside the block is recorded as a failed request.
+        """
+        limiter = self.limiter(url)
+        limiter.acquire()
+        outcome = _Outcome()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception as e:
+            limiter.release(error=e)
+            raise
+        else:
+            limiter.release(status=outcome.status, latency=time.monotonic() - start)
+
+    def get(self, session, url, retries=RETRIES, retry_on=RETRY_STATUS, **kwargs):
+        """ GET a url within its host's limit, retrying overloaded and failed requests with backoff
+
+        Args:
+            session: a requests Session (or the requests module)
+            url (str): the url to get
+            retries (int): the most attempts to make
+            retry_on (set): response status codes to try again on
+
+        Returns:
+            Response: the first response with a status outside retry_on, or the last response
+
+        Raises:
+            CircuitOpen: if the host's circuit is open
+            Exception: the last connection error if no attempt got a response
+        """
+        res, err = None, None
+        for i in range(retries):
+            try:
+                with self.slot(url) as outcome:
+                    res = session.get(url, **kwargs)
+                    outcome.record(res.status_code)
+                if res.status_code not in retry_on:
+                    return res
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                err = e
+            if i < retries - 1:
+                time.sleep(backoff(i))
+        if res is None:
+            raise err
+        return res
+
+    def stats(self):
+        """ HostStats for every host requests have been made to """
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: limiter.stats() for host, limiter in hosts.items()}
+
+
+class _Outcome(object):
+    status = None
+
+    def record(self, status):
+        self.status = status
+
+
+def backoff(attempt, base=0.5, cap=30.0):
+    """ Seconds to wait before retry number `attempt`: exponential with full jitter """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+governor = Governor()
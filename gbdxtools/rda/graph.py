@@ -1,7 +1,7 @@
 import os
 import json
-import time
 from gbdxtools.rda.error import NotFound, BadRequest
+from gbdxtools.rda.governor import governor
 from urllib.parse import urlencode
 from functools import lru_cache
 
@@ -10,17 +10,10 @@ VIRTUAL_RDA_URL = os.environ.get("VIRTUAL_RDA_URL", "https://rda.geobigdata.io/v
 
 @lru_cache()
 def req_with_retries(conn, url, retries=5):
-    for i in range(retries):
-        try:
-            res = conn.get(url)
-            if res.status_code not in [502, 429]:
-                return res
-            elif res.status_code == 501:
-                raise Exception('501 Auth error')
-        except:
-            pass
-        time.sleep(0.5 * (i + 1))
-    raise Exception('RDA is overloaded')
+    res = governor.get(conn, url, retries=retries, retry_on=[502, 429])
+    if res.status_code in [502, 429]:
+        raise Exception('RDA is overloaded')
+    return res
 
 
 def get_template_stats(conn, template_id, **kwargs):
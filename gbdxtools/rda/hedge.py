@@ -0,0 +1,185 @@
+"""
+Hedged tile requests.
+
+A read is only as fast as its slowest tile. With hedging enabled, a tile
+request that is still pending after the host's p95 latency gets a duplicate
+request; whichever response arrives first is used and the other request is
+cancelled (or, in the threaded fetcher where a blocking request can't be
+interrupted, abandoned). Hedges are limited to a share of all requests so that
+hedging can't add more than that much extra load.
+
+Hedging is off by default. Set GBDX_HEDGE=1 to enable it and
+GBDX_HEDGE_BUDGET to the most extra requests to make, as a fraction of all
+requests (default 0.05), or configure it in code with `hedger.configure`.
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from gbdxtools.rda.governor import MAX_IN_FLIGHT
+
+HedgeInfo = namedtuple("HedgeInfo", ["requests", "hedges", "wins"])
+
+
+class LatencyTracker(object):
+    """ Recent request latencies for one host
+
+    Args:
+        window (int): the number of latencies to keep
+        min_samples (int): no percentile is reported until this many requests have finished
+    """
+    def __init__(self, window=500, min_samples=20):
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+
+    def add(self, latency):
+        self._latencies.append(latency)
+
+    def percentile(self, q):
+        latencies = list(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        return float(np.percentile(latencies, q))
+
+
+class Hedger(object):
+    """ Sends a second request for tiles that take longer than a host's usual tail latency
+
+    Args:
+        enabled (bool): hedge requests, otherwise requests are only timed
+        budget (float): the most hedges to send, as a fraction of requests
+        quantile (float): the latency percentile after which a request is hedged
+        min_samples (int): requests to a host that must finish before hedging starts
+    """
+    def __init__(self, enabled=False, budget=0.05, quantile=95, min_samples=20):
+        self.enabled = enabled
+        self.budget = budget
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self.requests = self.hedges = self.wins = 0
+
+    def configure(self, enabled=True, budget=None, quantile=None):
+        """ Turn hedging on or off and change its budget or latency percentile """
+        self.enabled = enabled
+        if budget is not None:
+            self.budget = budget
+        if quantile is not None:
+            self.quantile = quantile
+
+    def tracker(self, url):
+        """ The LatencyTracker for a url's host """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._trackers:
+                self._trackers[host] = LatencyTracker(min_samples=self.min_samples)
+            return self._trackers[host]
+
+    def threshold(self, url):
+        """ Seconds after which a request for the url is hedged, None if it shouldn't be """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self.requests += 1
+        return self.tracker(url).percentile(self.quantile)
+
+    def _take_budget(self):
+        with self._lock:
+            # allow a single hedge before there are enough requests to make up a share
+            if self.hedges + 1 > max(1, self.budget * self.requests):
+                return False
+            self.hedges += 1
+            return True
+
+    def _won(self):
+        with self._lock:
+            self.wins += 1
+
+    def call(self, url, fn, *args):
+        """ Call fn(url, *args) in a worker thread, hedging it if it runs long
+
+        Returns:
+            the result of the first call to succeed
+        """
+        threshold = self.threshold(url)
+        if threshold is None:
+            return self._timed(url, fn, *args)
+        pool = self._executor()
+        primary = pool.submit(self._timed, url, fn, *args)
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._take_budget():
+            return primary.result()
+        backup = pool.submit(self._timed, url, fn, *args)
+        done, pending = wait([primary, backup], return_when=FIRST_COMPLETED)
+        first = done.pop()
+        if first.exception() is not None and pending:
+            # the first request failed, so the other one is the only one left
+            first = pending.pop()
+        for future in pending:
+            # a blocking request that has started can't be interrupted, its result is dropped
+            future.cancel()
+        if first is backup:
+            self._won()
+        return first.result()
+
+    async def call_async(self, url, fn, *args):
+        """ Await fn(url, *args), hedging it if it runs long; the slower request is cancelled
+
+        Returns:
+            the result of the first call to succeed
+        """
+        threshold = self.threshold(url)
+        if threshold is None:
+            return await self._timed_async(url, fn, *args)
+        primary = asyncio.ensure_future(self._timed_async(url, fn, *args))
+        done, _ = await asyncio.wait([primary], timeout=threshold)
+        if done or not self._take_budget():
+            return await primary
+        backup = asyncio.ensure_future(self._timed_async(url, fn, *args))
+        done, pending = await asyncio.wait([primary, backup], return_when=asyncio.FIRST_COMPLETED)
+        first = done.pop()
+        if first.exception() is not None and pending:
+            first = pending.pop()
+            await asyncio.wait([first])
+        for task in pending:
+            task.cancel()
+        if first is backup:
+            self._won()
+        return first.result()
+
+    def _timed(self, url, fn, *args):
+        start = time.monotonic()
+        result = fn(url, *args)
+        self.tracker(url).add(time.monotonic() - start)
+        return result
+
+    async def _timed_async(self, url, fn, *args):
+        start = time.monotonic()
+        result = await fn(url, *args)
+        self.tracker(url).add(time.monotonic() - start)
+        return result
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # room for every request the governor allows plus its hedge
+                self._pool = ThreadPoolExecutor(max_workers=2 * MAX_IN_FLIGHT,
+                                                thread_name_prefix="gbdxtools-hedge")
+            return self._pool
+
+    def info(self):
+        """ Counts of requests, hedges sent, and hedges that returned first """
+        with self._lock:
+            return HedgeInfo(self.requests, self.hedges, self.wins)
+
+
+hedger = Hedger(enabled=os.environ.get("GBDX_HEDGE", "0").lower() in ("1", "true", "yes"),
+                budget=float(os.environ.get("GBDX_HEDGE_BUDGET", 0.05)))
@@ -4,16 +4,11 @@ try:
 except:
     has_rasterio = False
 
-from functools import partial
-import os
-
-import dask
 from dask.array import store
 
 import numpy as np
 
-threads = int(os.environ.get('GBDX_THREADS', 64))
-threaded_get = partial(dask.threaded.get, num_workers=threads)
+from gbdxtools.rda.scheduler import get_scheduler
 
 class rio_writer(object):
     def __init__(self, dst):
@@ -77,9 +72,19 @@ def to_geotiff(arr, path='./output.tif', proj=None, spec=None, bands=None, **kwa
     if "tiled" in kwargs and kwargs["tiled"]:
         meta.update(blockxsize=x_size, blockysize=y_size, tiled="yes")
 
-    with rasterio.open(path, "w", **meta) as dst:
+    scheduler = get_scheduler()
+    with rasterio.open(path, "w", **meta) as dst, scheduler.config():
         writer = rio_writer(dst)
-        result = store(arr, writer, compute=False)
-        result.compute(scheduler=threaded_get)
+        if scheduler.shared_memory:
+            result = store(arr, writer, compute=False)
+            result.compute(scheduler=scheduler.get)
+        else:
+            # the file is only open in this process, so rows of blocks are computed
+            # on the scheduler and written here
+            offset = 0
+            for height in arr.chunks[1]:
+                rows = slice(offset, offset + height)
+                writer[:, rows, 0:arr.shape[2]] = arr[:, rows, :].compute(scheduler=scheduler.get)
+                offset += height
     
     return path
@@ -0,0 +1,112 @@
+"""
+Spatial prefetching for window traversals.
+
+Computing windows one after the other leaves the network idle while each
+window is processed, and the tiles for the next window are only requested
+once the current one is done. `prefetch` wraps an iterator of windows and
+keeps the tiles of the next few windows downloading into the tile cache in the
+background, so by the time a window is read its tiles are (mostly) in memory.
+
+The tiles being prefetched are limited to a byte budget, by default half of
+the tile cache so prefetched tiles aren't evicted before they're used, and
+downloads that haven't started are cancelled when the iterator is closed or
+dropped.
+"""
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dask import optimization
+
+from gbdxtools.rda import cache
+from gbdxtools.rda.aio import is_tile_task, tile_request
+from gbdxtools.rda.cache import request_key
+from gbdxtools.rda.governor import MAX_IN_FLIGHT
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="gbdxtools-prefetch")
+        return _pool
+
+
+def tile_tasks(arr):
+    """ The tile tasks a dask array needs, keyed by their tile request key """
+    dsk, _ = optimization.cull(arr.__dask_graph__(), arr.__dask_keys__())
+    return {request_key(*tile_request(task)): task for task in dsk.values() if is_tile_task(task)}
+
+
+def _load(task):
+    # only the size goes back to the prefetcher, the tile itself stays in the cache
+    return task[0](*task[1:]).nbytes
+
+
+class _Window(object):
+    __slots__ = ("window", "futures", "keys")
+
+    def __init__(self, window, futures, keys):
+        self.window = window
+        self.futures = futures
+        self.keys = keys
+
+
+def prefetch(windows, depth=4, max_bytes=None):
+    """ Iterate over windows while the tiles of the windows after them download in the background
+
+    Args:
+        windows (iterable): image windows, in the order they'll be read
+        depth (int): how many windows ahead to prefetch
+        max_bytes (int): the most bytes of tiles to have in flight or waiting to be
+            read. Defaults to half the tile cache.
+
+    Yields:
+        the windows, unchanged
+    """
+    if cache.tile_cache.max_bytes == 0 or depth < 1:
+        # without a tile cache there's nowhere to keep prefetched tiles
+        yield from windows
+        return
+    budget = cache.tile_cache.max_bytes // 2 if max_bytes is None else max_bytes
+    windows = iter(windows)
+    pool = _executor()
+    ahead = deque()
+    requested = {}
+    tile_nbytes = None
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(ahead) <= depth:
+                if ahead and tile_nbytes is not None and len(requested) * tile_nbytes >= budget:
+                    break
+                try:
+                    window = next(windows)
+                except StopIteration:
+                    exhausted = True
+                    break
+                futures, keys = [], []
+                for key, task in tile_tasks(window).items():
+                    if key in requested or key in cache.tile_cache:
+                        continue
+                    future = pool.submit(_load, task)
+                    requested[key] = future
+                    futures.append(future)
+                    keys.append(key)
+                if tile_nbytes is None:
+                    tile_nbytes = window.nbytes // max(1, len(keys))
+                ahead.append(_Window(window, futures, keys))
+            if not ahead:
+                return
+            current = ahead.popleft()
+            for key, future in zip(current.keys, current.futures):
+                del requested[key]
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    tile_nbytes = max(tile_nbytes, future.result())
+            yield current.window
+    finally:
+        for future in requested.values():
+            future.cancel()
@@ -0,0 +1,98 @@
+"""
+Opportunistic cache of task results across computes.
+
+Image graphs have deterministic keys, so reading overlapping AOIs of an image,
+or plotting it again, recomputes many of the same tasks: the slices and band
+selections of the same tiles, the inputs to a stretch. With the result cache
+enabled, the scheduler keeps the array results of the tasks it runs in a least
+recently used cache with a byte budget, and later computes take any results it
+has in place of their tasks (and the tasks only they needed).
+
+Tile fetches aren't kept, the tile cache already holds the tiles. Results that
+are views, such as slices of tiles, are kept as compact copies so the cache
+doesn't hold on to the arrays they were sliced from. The cache is
+off by default: set GBDX_RESULT_CACHE_BYTES or call `set_result_cache`. It is
+used by the local schedulers, a dask.distributed cluster has its own.
+"""
+import os
+from collections.abc import Mapping
+
+import numpy as np
+from dask.core import istask
+from dask.callbacks import Callback
+from dask.optimization import cull
+
+from gbdxtools.rda.aio import is_tile_task
+from gbdxtools.rda.cache import TileCache
+
+
+class ResultCache(object):
+    """ A byte-budgeted cache of task results, keyed by task key
+
+    Args:
+        max_bytes (int): the memory budget in bytes, 0 disables the cache
+    """
+    def __init__(self, max_bytes=0):
+        self._store = TileCache(max_bytes=max_bytes)
+        self._callback = Callback(posttask=self._posttask)._callback
+
+    @property
+    def max_bytes(self):
+        return self._store.max_bytes
+
+    def resize(self, max_bytes):
+        """ Change the memory budget, evicting results if the cache is now over budget """
+        self._store.resize(max_bytes)
+
+    def clear(self):
+        """ Remove every result from the cache """
+        self._store.clear()
+
+    def cache_info(self):
+        """ Hits, misses, evictions, entries, nbytes and max_bytes of the cache """
+        return self._store.cache_info()
+
+    def wrap(self, get):
+        """ Wrap a dask get function to use and fill the cache
+
+        Args:
+            get (callable): a local dask scheduler's get function
+
+        Returns:
+            callable: the wrapped get function
+        """
+        def cached_get(dsk, keys, callbacks=None, **kwargs):
+            if not isinstance(dsk, Mapping):
+                # newer versions of dask pass the schedulers a graph expression
+                dsk = dsk.__dask_graph__()
+            hits = {key: self._store.get(key) for key in dsk if key in self._store}
+            hits = {key: value for key, value in hits.items() if value is not None}
+            if hits:
+                dsk = dict(dsk)
+                dsk.update(hits)
+                dsk, _ = cull(dsk, keys)
+            callbacks = tuple(callbacks or Callback.active) + (self._callback,)
+            return get(dsk, keys, callbacks=callbacks, **kwargs)
+        return cached_get
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        task = dsk[key]
+        if isinstance(result, np.ndarray) and istask(task) and not is_tile_task(task):
+            if result.base is not None and result.nbytes <= self._store.max_bytes:
+                # a view would keep its parent alive while only its own bytes are counted
+                result = np.ascontiguousarray(result).copy()
+            self._store.put(key, result)
+
+
+result_cache = ResultCache(max_bytes=int(os.environ.get("GBDX_RESULT_CACHE_BYTES", 0)))
+
+
+def set_result_cache(max_bytes):
+    """ Set the memory budget of the result cache, 0 turns it off
+
+    Args:
+        max_bytes (int): the memory budget in bytes
+    """
+    result_cache.resize(max_bytes)
+    if not max_bytes:
+        result_cache.clear()
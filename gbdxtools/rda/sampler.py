@@ -0,0 +1,221 @@
+"""
+Random window sampling and loading for training models on image data.
+
+Uniformly random windows almost never share tiles, so every sample waits on
+new downloads and training is bound by network round trips. `WindowSampler`
+draws most windows near windows it drew recently, choosing among nearby
+positions the one with the most tiles already in the tile cache or still
+downloading, and the rest uniformly from the whole image so samples keep
+covering it. `locality` sets the trade off: 0 samples uniformly, as
+`randwindow` does, and values close to 1 reuse tiles the most.
+
+`WindowLoader` reads batches of sampled windows in background threads into a
+bounded queue, so a training loop can take batches at a steady rate::
+
+    for origins, batch in img.window_loader((256, 256), batch_size=32, count=1000):
+        model.train_on_batch(batch)
+"""
+import bisect
+import queue
+import random
+import threading
+from itertools import product
+
+import dask.array as da
+from dask.array.slicing import cached_cumsum
+
+from gbdxtools.rda import cache, direct
+from gbdxtools.rda.aio import is_tile_task, tile_request
+from gbdxtools.rda.cache import request_key
+from gbdxtools.rda.scheduler import get_scheduler
+
+# positions tried around an anchor for a window on cached tiles
+CANDIDATES = 16
+
+
+class WindowSampler(object):
+    """ Random windows of an image, drawn mostly near recent windows
+
+    Of the positions tried near a recent window, the one with the fewest tiles that are
+    neither in the tile cache nor being fetched is used.
+
+    Args:
+        image (GeoDaskImage): the image to sample
+        window_shape (tuple): the shape of the windows as (height, width) in pixels
+        locality (float): the fraction of windows drawn near a recent window, between 0 and 1
+        anchors (int): the number of recent uniformly drawn windows to draw near
+        radius (tuple): the furthest a window is drawn from its anchor, as (rows, columns) in
+            pixels. Defaults to the window shape, so neighbouring windows share tiles.
+        seed (int): seed for the random draws
+    """
+    def __init__(self, image, window_shape, locality=0.75, anchors=8, radius=None, seed=None):
+        if not 0 <= locality <= 1:
+            raise ValueError("locality must be between 0 and 1, not {}".format(locality))
+        _nbands, height, width = image.shape
+        if window_shape[0] > height or window_shape[1] > width:
+            raise ValueError("Window shape {} is larger than the image {}".format(window_shape, image.shape))
+        self.image = image
+        self.window_shape = tuple(window_shape[:2])
+        self.locality = locality
+        self.radius = self.window_shape if radius is None else tuple(radius)
+        self._max_origin = (height - self.window_shape[0], width - self.window_shape[1])
+        self._anchors = []
+        self._max_anchors = anchors
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._rows = cached_cumsum(image.chunks[1], initial_zero=True)
+        self._cols = cached_cumsum(image.chunks[2], initial_zero=True)
+        # the tile request of each block looked at so far
+        self._tiles = {}
+
+    def _tile(self, block):
+        # the request key of the tile a block is sliced from, True for zeros, None for anything else
+        if block not in self._tiles:
+            dsk = self.image.__dask_graph__()
+            source = direct.block_source(dsk, (self.image.name, 0) + block)
+            task = None if source is None else dsk[source[0]]
+            if task is None:
+                self._tiles[block] = None
+            elif is_tile_task(task):
+                self._tiles[block] = request_key(*tile_request(task))
+            else:
+                self._tiles[block] = True
+        return self._tiles[block]
+
+    def _cold(self, origin):
+        # the number of tiles under a window that are neither cached nor being fetched
+        y, x = origin
+        rows = range(bisect.bisect_right(self._rows, y) - 1, bisect.bisect_left(self._rows, y + self.window_shape[0]))
+        cols = range(bisect.bisect_right(self._cols, x) - 1, bisect.bisect_left(self._cols, x + self.window_shape[1]))
+        cold = 0
+        for block in product(rows, cols):
+            key = self._tile(block)
+            if key is None or (key is not True and key not in cache.tile_cache and key not in cache.in_flight):
+                cold += 1
+        return cold
+
+    def origin(self):
+        """ The (row, column) pixel origin of the next window """
+        with self._lock:
+            if self._anchors and self._random.random() < self.locality:
+                y, x = self._random.choice(self._anchors)
+                best, fewest = None, None
+                for _ in range(CANDIDATES):
+                    origin = tuple(min(max(v + self._random.randint(-r, r), 0), top)
+                                   for v, r, top in zip((y, x), self.radius, self._max_origin))
+                    cold = self._cold(origin)
+                    if best is None or cold < fewest:
+                        best, fewest = origin, cold
+                    if cold == 0:
+                        break
+                return best
+            origin = tuple(self._random.randint(0, top) for top in self._max_origin)
+            # the oldest anchor's tiles are the likeliest to have been evicted
+            self._anchors = (self._anchors + [origin])[-self._max_anchors:]
+            return origin
+
+    def window(self):
+        """ The next window, with its origin
+
+        Returns:
+            tuple: the (row, column) origin and the window image
+        """
+        y, x = self.origin()
+        return (y, x), self.image._window(x, y, x + self.window_shape[1], y + self.window_shape[0])
+
+    def __iter__(self):
+        while True:
+            yield self.window()
+
+
+_done = object()
+
+
+class WindowLoader(object):
+    """ Batches of sampled windows, read in background threads
+
+    Iterating starts the workers, which read batches into a queue ahead of the
+    consumer. Stop early with `close`, or by using the loader as a context manager.
+
+    Args:
+        sampler (WindowSampler): the windows to read
+        batch_size (int): the number of windows in each batch
+        count (int): the number of batches, or None to continue until closed
+        workers (int): the number of batches to read at once
+        queue_size (int): the most batches to read ahead of the consumer
+    """
+    def __init__(self, sampler, batch_size=16, count=None, workers=2, queue_size=4):
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.count = count
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+        self._remaining = count
+        self._lock = threading.Lock()
+
+    def _claim(self):
+        # claim a batch to read, False once count batches have been claimed
+        with self._lock:
+            if self._remaining is None:
+                return True
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _work(self):
+        scheduler = get_scheduler()
+        try:
+            while not self._stop.is_set() and self._claim():
+                origins, windows = zip(*[self.sampler.window() for _ in range(self.batch_size)])
+                data, = scheduler.compute(da.stack(windows))
+                if not self._put((list(origins), data)):
+                    return
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(_done)
+
+    def __iter__(self):
+        self._threads = [threading.Thread(target=self._work, name="gbdxtools-loader-{}".format(i), daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        running = len(self._threads)
+        try:
+            while running:
+                item = self._queue.get()
+                if item is _done:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """ Stop the workers and drop any batches read ahead """
+        self._stop.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,138 @@
+"""
+Scheduler configuration for image computation.
+
+Reading images, plotting them and writing geotiffs all compute their dask
+graphs with the scheduler configured here: a pool of threads in this process
+(the default), a pool of processes, the synchronous scheduler for debugging,
+or a dask.distributed cluster. Configure it from code::
+
+    from gbdxtools.rda.scheduler import set_scheduler
+
+    set_scheduler("processes", num_workers=8)
+    set_scheduler(client=Client("tcp://scheduler:8786"))
+
+or from the environment with GBDX_SCHEDULER (threads, processes, sync or
+distributed), GBDX_SCHEDULER_ADDRESS (the address of a distributed scheduler)
+and GBDX_THREADS (the number of threads). The local schedulers reuse task
+results across computes when the result cache is enabled, see
+gbdxtools.rda.results.
+"""
+import os
+from functools import partial
+
+import dask
+import dask.threaded
+import dask.multiprocessing
+import dask.local
+
+try:
+    from distributed import Client
+    has_distributed = True
+except ImportError:
+    has_distributed = False
+
+SCHEDULERS = ("threads", "processes", "sync", "distributed")
+
+# each thread fetches a tile at a time, raise it to keep more requests in flight
+threads = int(os.environ.get('GBDX_THREADS', 8))
+
+
+def _result_cache():
+    # imported here, the results module imports the tile fetchers, which mount the GBDX session
+    # on connection pools sized from this module
+    from gbdxtools.rda.results import result_cache
+    return result_cache
+
+
+class Scheduler(object):
+    """ A dask scheduler to compute images with
+
+    Args:
+        name (str): one of "threads", "processes", "sync" or "distributed"
+        num_workers (int): the number of threads or processes, defaults to GBDX_THREADS
+            threads or a process per CPU
+        client: a dask.distributed Client, or the address of a scheduler to connect to.
+            Implies "distributed".
+    """
+    def __init__(self, name="threads", num_workers=None, client=None):
+        if client is not None:
+            name = "distributed"
+        if name not in SCHEDULERS:
+            raise ValueError("Unknown scheduler {}, choose from {}".format(name, ", ".join(SCHEDULERS)))
+        if name == "distributed":
+            assert has_distributed, "To compute images on a dask cluster please install distributed"
+            if client is None or isinstance(client, str):
+                client = Client(client)
+        if num_workers is None and name == "threads":
+            num_workers = threads
+        self.name = name
+        self.num_workers = num_workers
+        self.client = client
+
+    @property
+    def get(self):
+        """ The dask get function of the scheduler, using the result cache if it is enabled """
+        if self.name == "distributed":
+            return self.client.get
+        if self.name == "threads":
+            get = partial(dask.threaded.get, num_workers=self.num_workers)
+        elif self.name == "processes":
+            get = partial(dask.multiprocessing.get, num_workers=self.num_workers)
+        else:
+            get = dask.local.get_sync
+        result_cache = _result_cache()
+        if result_cache.max_bytes:
+            return result_cache.wrap(get)
+        return get
+
+    def config(self):
+        """ The dask configuration to compute images with, as a context manager """
+        # fused tasks keep the results of the tasks inside them from the result cache
+        caching = self.name != "distributed" and bool(_result_cache().max_bytes)
+        return dask.config.set({"optimization.fuse.active": not caching and dask.config.get("optimization.fuse.active")})
+
+    @property
+    def shared_memory(self):
+        """ True if tasks run in this process, so they can write into local arrays and files """
+        return self.name in ("threads", "sync")
+
+    def compute(self, *args, **kwargs):
+        """ Compute dask collections on the scheduler, as dask.compute """
+        with self.config():
+            return dask.compute(*args, scheduler=self.get, **kwargs)
+
+    def __repr__(self):
+        return "Scheduler({!r}, num_workers={!r})".format(self.name, self.num_workers)
+
+
+_scheduler = None
+
+
+def set_scheduler(name="threads", num_workers=None, client=None):
+    """ Set the scheduler used to compute images
+
+    The connection pools and the direct read pool are resized for its number of workers.
+
+    Args:
+        name (str): one of "threads", "processes", "sync" or "distributed"
+        num_workers (int): the number of threads or processes
+        client: a dask.distributed Client or scheduler address, implies "distributed"
+
+    Returns:
+        Scheduler: the new scheduler
+    """
+    global _scheduler
+    _scheduler = Scheduler(name, num_workers=num_workers, client=client)
+    # imported here, the connections are set up while this module is being imported
+    from gbdxtools.connections import connection_manager
+    connection_manager.resize()
+    return _scheduler
+
+
+def get_scheduler():
+    """ The scheduler used to compute images, configured from the environment until it is set """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(os.environ.get("GBDX_SCHEDULER", "threads"),
+                               client=os.environ.get("GBDX_SCHEDULER_ADDRESS"))
+    return _scheduler
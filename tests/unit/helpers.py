@@ -2,6 +2,7 @@
 
     - a GBDX Interface object that mocks the connection when used with VCR
     - A preconfigure VCRpy object that ignores auth calls
+    - synthetic tiled images that record the tiles they fetch
 
 '''
 
@@ -9,6 +10,7 @@
 import os
 import base64
 import json
+import unittest
 from configparser import ConfigParser
 from datetime import datetime
 from gbdxtools import Interface, Ordering
@@ -18,6 +20,16 @@ from requests_oauthlib import OAuth2Session
 
 import vcr
 
+import numpy as np
+from affine import Affine
+from dask.highlevelgraph import HighLevelGraph
+from shapely.geometry import box, mapping
+
+from gbdxtools.images.layers import TemplateTileLayer
+from gbdxtools.images.meta import GeoDaskImage
+from gbdxtools.rda.fetch import tile_loader
+from gbdxtools.rda.util import AffineTransform
+
 
 # Test images
 WV01_CATID = '1020010044CEA300'
@@ -94,3 +106,44 @@ gbdx_vcr = vcr.VCR(
 # TODO: vcr probably should check to see if it has a real connection before it tries to record.
 
 
+# Synthetic tiled images. Tiles are TILE pixels square and their urls are recorded in `urls` as they are
+# fetched. The image's pixel (row, col) is at x = col, y = -row.
+TILE = 8
+urls = []
+
+def tile_xy(url):
+    x, y = [int(v) for v in url.split('?')[0].split('/')[-2:]]
+    return x, y
+
+@tile_loader(headers=dict)
+def load_tile(url, accept=None):
+    ''' 3 band tiles of distinct values, tiles with negative x fail to download '''
+    urls.append(url)
+    x, y = tile_xy(url)
+    if x < 0:
+        raise TypeError("Unable to download tile {}".format(url))
+    tile = np.arange(3 * TILE * TILE, dtype=np.uint16).reshape(3, TILE, TILE)
+    return tile + 1000 * y + 100 * x
+
+def make_image(nx, ny, min_x=0, nbands=3, loader=load_tile):
+    ''' a GeoDaskImage of nx by ny tiles, fetched from loader '''
+    name = 'image-test-{}-{}-{}-{}'.format(nx, ny, min_x, loader.__name__)
+    layer = TemplateTileLayer(name, loader, 'http://rda.test/template/abc/tile', 'nodeId=Format',
+                              min_x, 0, nx, ny)
+    return GeoDaskImage({'dask': HighLevelGraph.from_collections(name, layer), 'name': name,
+                         'chunks': ((nbands,), (TILE,) * ny, (TILE,) * nx),
+                         'dtype': np.uint16, 'shape': (nbands, TILE * ny, TILE * nx)},
+                        __geo_interface__=mapping(box(0, -TILE * ny, TILE * nx, 0)),
+                        __geo_transform__=AffineTransform(Affine(1.0, 0.0, 0.0, 0.0, -1.0, 0.0)))
+
+class TileTestCase(unittest.TestCase):
+    ''' starts each test with no tiles fetched '''
+
+    def setUp(self):
+        del urls[:]
+
+    def expected(self, img):
+        ''' the image computed by dask, without counting its tiles as fetched '''
+        data = img.compute(scheduler='sync')
+        del urls[:]
+        return data
@@ -0,0 +1,155 @@
+'''
+Unit tests for the asyncio tile fetch engine, run against a local tile server
+'''
+
+import time
+import operator
+import threading
+import unittest
+from unittest import mock
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import imageio
+import numpy as np
+import dask
+import dask.array as da
+
+from gbdxtools.rda import aio, fetch
+from gbdxtools.rda.fetch import tile_loader
+from gbdxtools.images.tms_image import load_url
+
+
+TILE = (np.arange(8 * 8 * 3) % 255).astype(np.uint8).reshape(8, 8, 3)
+PNG = imageio.imwrite(imageio.RETURN_BYTES, TILE, format='png')
+
+# the session's access tokens, newest last
+tokens = []
+
+
+@tile_loader(headers=lambda: {'Authorization': 'Bearer ' + tokens[-1]})
+def load_authorized_url(url, accept=None):
+    return load_url(url)
+
+
+class Session(object):
+    auto_refresh_url = 'https://auth.test/token'
+    headers = {'User-Agent': 'test'}
+
+    def __init__(self, token):
+        self.token = token
+
+    def refresh_token(self, url):
+        return {'access_token': 'fresh', 'expires_at': time.time() + 600}
+
+    def token_updater(self, token):
+        self.token = token
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    requests = []
+    accept = []
+    authorization = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        self.accept.append(self.headers.get('Accept'))
+        self.authorization.append(self.headers.get('Authorization'))
+        if self.headers.get('Authorization') == 'Bearer expired':
+            self.send_response(401)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(PNG)))
+        self.end_headers()
+        self.wfile.write(PNG)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipUnless(aio.has_httpx, "httpx is not installed")
+class AsyncEngineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), TileHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:{}'.format(cls.server.server_port) + '/{z}/{x}/{y}.png'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        TileHandler.requests = []
+        TileHandler.accept = []
+        TileHandler.authorization = []
+
+    def test_compute(self):
+        dsk = {('async-test', 0, y, x): (load_url, self.url.format(z=1, x=x, y=y))
+               for y in range(3) for x in range(4)}
+        arr = da.Array(dsk, 'async-test', chunks=((3,), (8,) * 3, (8,) * 4), dtype=np.uint8)
+        result = aio.compute(arr[:, 4:20, 4:20], scheduler=dask.get)
+        self.assertEqual(result.shape, (3, 16, 16))
+        np.testing.assert_array_equal(result[:, 4:12, 4:12], np.rollaxis(TILE, 2, 0))
+        # every tile in the slice was fetched exactly once, none outside of it
+        self.assertEqual(len(TileHandler.requests), 9)
+        self.assertEqual(len(set(TileHandler.requests)), 9)
+
+    def test_compute_out(self):
+        dsk = {('async-out', 0, y, x): (load_url, self.url.format(z=3, x=x, y=y))
+               for y in range(2) for x in range(2)}
+        arr = da.Array(dsk, 'async-out', chunks=((3,), (8,) * 2, (8,) * 2), dtype=np.uint8)
+        out = np.zeros((3, 12, 12), dtype=np.uint8)
+        self.assertIs(aio.compute(arr[:, 2:14, 2:14], scheduler=dask.get, out=out), out)
+        np.testing.assert_array_equal(out[:, 6:, 6:], np.rollaxis(TILE, 2, 0)[:, :6, :6])
+
+    def test_accept_header(self):
+        url = self.url.format(z=2, x=0, y=0)
+        accept = 'image/png, */*;q=0.1'
+        dsk = {('async-accept', 0, 0, 0): (fetch.load_url, url, accept)}
+        arr = da.Array(dsk, 'async-accept', chunks=((3,), (8,), (8,)), dtype=np.uint8)
+        aio.compute(arr, scheduler=dask.get)
+        self.assertEqual(TileHandler.accept, [accept])
+        # the same tile in another encoding is a different tile
+        aio.compute(arr, scheduler=dask.get)
+        dsk = {('async-accept2', 0, 0, 0): (fetch.load_url, url)}
+        aio.compute(da.Array(dsk, 'async-accept2', chunks=((3,), (8,), (8,)), dtype=np.uint8), scheduler=dask.get)
+        self.assertEqual(len(TileHandler.requests), 2)
+
+    def test_refreshes_token(self):
+        tokens[:] = ['expired']
+        dsk = {('async-auth', 0, 0, 0): (load_authorized_url, self.url.format(z=4, x=0, y=0))}
+        arr = da.Array(dsk, 'async-auth', chunks=((3,), (8,), (8,)), dtype=np.uint8)
+        with mock.patch.object(aio, 'refresh_token', side_effect=lambda expired: tokens.append('fresh')) as refresh:
+            result = aio.compute(arr, scheduler=dask.get)
+        np.testing.assert_array_equal(result, np.rollaxis(TILE, 2, 0))
+        refresh.assert_called_once_with('expired')
+        # the retry is made with the session's new token
+        self.assertEqual(TileHandler.authorization, ['Bearer expired', 'Bearer fresh'])
+
+    def test_rda_headers(self):
+        session = Session({'access_token': 'expired', 'expires_at': time.time() - 1})
+        with mock.patch.object(fetch, 'Auth', return_value=mock.Mock(gbdx_connection=session)):
+            # a token that has already been replaced isn't refreshed again
+            fetch.refresh_token('older')
+            self.assertEqual(session.token['access_token'], 'expired')
+            self.assertEqual(fetch.rda_headers()['Authorization'], 'Bearer fresh')
+
+    def test_is_tile_task(self):
+        self.assertTrue(aio.is_tile_task((load_url, 'http://example.com/1/1/1.png')))
+        self.assertFalse(aio.is_tile_task((np.zeros, (1, 8, 8))))
+        self.assertFalse(aio.is_tile_task(('image-1', 0, 0, 0)))
+
+    @unittest.skipUnless(aio.has_task_spec, "dask builds graphs of tuples")
+    def test_task_objects(self):
+        from dask._task_spec import Alias, Task, TaskRef
+        url = 'http://example.com/1/1/1.png'
+        task = Task(('image-1', 0, 0, 0), load_url, url, 'image/png')
+        self.assertTrue(aio.is_tile_task(task))
+        self.assertEqual(aio.tile_request(task), (url, 'image/png'))
+        self.assertEqual(aio.as_tuple(Task(('slice-1', 0), operator.getitem, TaskRef(('image-1', 0, 0, 0)), 1)),
+                         (operator.getitem, ('image-1', 0, 0, 0), 1))
+        self.assertEqual(aio.as_tuple(Alias(('alias-1', 0), ('image-1', 0, 0, 0))), ('image-1', 0, 0, 0))
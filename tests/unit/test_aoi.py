@@ -0,0 +1,53 @@
+'''
+Unit tests for reading only the tiles of an image that intersect an AOI
+'''
+
+import numpy as np
+from shapely.geometry import box, LineString, MultiPolygon
+
+from helpers import TileTestCase, make_image, urls
+
+
+def geo_image(nx, ny):
+    img = make_image(nx, ny)
+    img.__geo_transform__.proj = 'EPSG:4326'
+    return img
+
+
+class ExactAoiTest(TileTestCase):
+
+    def test_scattered_fields(self):
+        img = geo_image(6, 6)
+        expected = self.expected(img)
+        fields = MultiPolygon([box(2, -5, 5, -2), box(42, -45, 45, -42)])
+        aoi = img.aoi(wkt=fields.wkt, mode='exact')
+        self.assertEqual(aoi.shape, img.aoi(wkt=fields.wkt).shape)
+        data = aoi.read()
+        # only the two tiles under the fields are fetched, out of the 36 in the envelope
+        self.assertEqual(len(urls), 2)
+        mask = aoi.rasterize(fields).compute(scheduler='sync')
+        self.assertEqual(mask.shape, aoi.shape[1:])
+        # the pixels of the two fields
+        self.assertEqual(mask.sum(), 3 * 3 + 3 * 3)
+        np.testing.assert_array_equal(data[:, mask], expected[:, 2:45, 2:45][:, mask])
+        self.assertFalse(data[:, ~mask].any())
+        self.assertEqual(aoi.__geo_transform__.fwd(0, 0), (2.0, -2.0))
+        self.assertEqual(type(aoi), type(img))
+
+    def test_corridor(self):
+        img = geo_image(6, 6)
+        corridor = LineString([(0, 0), (48, -48)]).buffer(1)
+        aoi = img.aoi(wkt=corridor.wkt, mode='exact', nodata=7)
+        data = aoi.compute(scheduler='sync')
+        mask = aoi.rasterize(corridor).compute(scheduler='sync')
+        # the tiles along the diagonal and those the corridor clips at their corners
+        self.assertEqual(len(urls), 6 + 2 * 5)
+        self.assertTrue((data[:, ~mask] == 7).all())
+        self.assertFalse((data[:, mask] == 7).any())
+
+    def test_modes(self):
+        img = geo_image(2, 2)
+        whole = img.aoi(mode='exact')
+        np.testing.assert_array_equal(whole.compute(scheduler='sync'), img.compute(scheduler='sync'))
+        with self.assertRaises(ValueError):
+            img.aoi(bbox=[0, -8, 8, 0], mode='bounds')
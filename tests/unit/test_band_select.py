@@ -0,0 +1,150 @@
+'''
+Unit tests for selecting bands in RDA before tiles are fetched
+'''
+
+import unittest
+import warnings
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from auth_mock import gbdx
+from gbdxtools.images import rda_image, template_image
+from gbdxtools.images.rda_image import RDAImage
+from gbdxtools.images.template_image import TemplateMeta
+from gbdxtools.rda import direct
+from gbdxtools.rda.fetch import tile_loader
+
+TILE = 8
+NBANDS = 8
+urls = []
+templates = []
+
+
+@tile_loader(headers=dict)
+def load_band_tile(url, accept=None):
+    urls.append(url)
+    parts = urlparse(url)
+    x, y = [int(v) for v in parts.path.split('/')[-2:]]
+    bands = parse_qs(parts.query).get('bandIndices', [','.join(str(b) for b in range(NBANDS))])[0]
+    tile = np.arange(NBANDS)[:, None, None] * 1000 + np.arange(TILE * TILE).reshape(TILE, TILE) + 100 * y + 10 * x
+    return tile[[int(b) for b in bands.split(',')]].astype(np.uint16)
+
+
+def template_metadata(conn, template_id, **params):
+    nbands = len(params['bandIndices'].split(',')) if 'bandIndices' in params else NBANDS
+    return {
+        "image": {"minTileX": 0, "minTileY": 0, "maxTileX": 3, "maxTileY": 2, "tileXSize": TILE, "tileYSize": TILE,
+                  "minX": 0, "minY": 0, "maxX": 4 * TILE, "maxY": 3 * TILE, "numBands": nbands,
+                  "dataType": "UNSIGNED_SHORT",
+                  "imageBoundsWGS84": "POLYGON ((0 -24, 32 -24, 32 0, 0 0, 0 -24))"},
+        "georef": {"spatialReferenceSystemCode": "EPSG:4326", "translateX": 0.0, "scaleX": 1.0, "shearX": 0.0,
+                   "translateY": 0.0, "shearY": 0.0, "scaleY": -1.0},
+        "rpcs": None
+    }
+
+
+def create_template(conn, graph):
+    templates.append(graph)
+    return "selected-{}".format(len(templates))
+
+
+def make_image(graph=None, **params):
+    meta = TemplateMeta("DigitalGlobeStripTemplate", **(params or dict(nodeId="Format", catId="abc")))
+    meta._graph = graph or {"id": "strip", "defaultNodeId": "Format", "nodes": [{"id": "Format"}], "edges": []}
+    meta._template_id = meta._graph["id"]
+    return RDAImage(meta)
+
+
+@mock.patch.object(template_image, "create_rda_template", create_template)
+@mock.patch.object(template_image, "get_rda_template_metadata", template_metadata)
+@mock.patch.object(template_image, "load_url", load_band_tile)
+class BandSelectTest(unittest.TestCase):
+
+    def setUp(self):
+        del urls[:]
+        del templates[:]
+        TemplateMeta._band_templates.clear()
+
+    def test_band_select(self):
+        img = make_image()
+        expected = img.compute(scheduler='sync')
+        del urls[:]
+        rgb = img[[4, 2, 1], ...]
+        self.assertEqual(rgb.shape, (3, 3 * TILE, 4 * TILE))
+        np.testing.assert_array_equal(rgb.compute(scheduler='sync'), expected[[4, 2, 1]])
+        self.assertTrue(all('bandIndices=4%2C2%2C1' in url for url in urls))
+        self.assertEqual(rgb.__geo_transform__.fwd(0, 0), img.__geo_transform__.fwd(0, 0))
+        # one template with the band select node after the rendered node
+        self.assertEqual(len(templates), 1)
+        self.assertEqual(templates[0]["edges"][-1]["source"], "Format")
+
+    def test_windows(self):
+        img = make_image()
+        expected = img.compute(scheduler='sync')
+        for window in [img[:, 3:21, 5:30], img[:, 3:21, 5:30][:, 1:10, 2:9], img._window(-4, 10, 20, 30)]:
+            full = window.compute(scheduler='sync')
+            selected = window[[6, 4], ...]
+            self.assertEqual(selected.shape, (2,) + window.shape[1:])
+            np.testing.assert_array_equal(selected.compute(scheduler='sync'), full[[6, 4]])
+            self.assertIsNotNone(direct.plan(selected))
+        np.testing.assert_array_equal(img[[1], 2:5, 2:5].compute(scheduler='sync'), expected[[1], 2:5, 2:5])
+        np.testing.assert_array_equal(img[3, 2:5, 2:5].compute(scheduler='sync'), expected[3, 2:5, 2:5])
+        # band selections are made from the original bands
+        np.testing.assert_array_equal(img[[4, 2, 1], ...][[2, 0], ...].compute(scheduler='sync'), expected[[1, 4]])
+        self.assertEqual(len(templates), 1)
+
+    def test_read(self):
+        img = make_image()[:, 2:20, 3:25]
+        expected = img.compute(scheduler='sync')
+        del urls[:]
+        np.testing.assert_array_equal(img.read(bands=[7, 0]), expected[[7, 0]])
+        np.testing.assert_array_equal(img.read(bands=5), expected[5])
+        self.assertTrue(all('bandIndices' in url for url in urls))
+
+    def test_single_node(self):
+        # templates like DigitalGlobeImageTemplate have one node and no edges
+        img = make_image({"id": "idaho", "defaultNodeId": "IdahoRead", "nodes": [{"id": "IdahoRead"}]},
+                         idahoId="abc")
+        expected = img.compute(scheduler='sync')
+        del urls[:]
+        np.testing.assert_array_equal(img[[4, 2, 1], ...].compute(scheduler='sync'), expected[[4, 2, 1]])
+        self.assertTrue(urls)
+        self.assertTrue(all('bandIndices=4%2C2%2C1' in url for url in urls))
+        self.assertEqual(templates[0]["edges"], [{"id": "GbdxtoolsBandSelect-edge", "index": 1,
+                                                  "source": "IdahoRead", "destination": "GbdxtoolsBandSelect"}])
+
+    def test_failed_template(self):
+        img = make_image()
+        calls = []
+
+        def fail(conn, graph):
+            calls.append(graph)
+            raise ValueError("template rejected")
+        with mock.patch.object(template_image, "create_rda_template", fail), \
+                warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for bands in ([4, 2, 1], [4, 2, 1], [0]):
+                self.assertEqual(img[bands, ...].shape, (len(bands),) + img.shape[1:])
+        # the template is only tried, and warned about, once
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len([w for w in caught if "Unable to select bands" in str(w.message)]), 1)
+        # bands of the template are selected after fetching
+        np.testing.assert_array_equal(img[[4, 2, 1], ...].compute(scheduler='sync'),
+                                      img.compute(scheduler='sync')[[4, 2, 1]])
+        self.assertFalse(any('bandIndices' in url for url in urls))
+
+    def test_all_bands(self):
+        img = make_image()
+        self.assertIsNone(img._select_bands(slice(None)))
+        self.assertIsNone(img._select_bands(list(range(NBANDS))))
+        self.assertIsNone(img[:, ::2, ::2]._select_bands([0]))
+        self.assertEqual(templates, [])
+
+    def test_disabled(self):
+        img = make_image()
+        with mock.patch.object(rda_image, "band_pushdown", False):
+            img[[4, 2, 1], ...].compute(scheduler='sync')
+        self.assertEqual(templates, [])
+        self.assertFalse(any('bandIndices' in url for url in urls))
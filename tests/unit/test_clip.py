@@ -0,0 +1,54 @@
+'''
+Unit tests for lazy clipping of images to geometries
+'''
+
+import numpy as np
+from shapely.geometry import Polygon, MultiPolygon, box
+from shapely import vectorized
+
+from helpers import TileTestCase, make_image, urls
+
+
+def pixel_mask(geometry, height, width, minx=0, miny=0):
+    # pixel centers inside the geometry, for the test image's transform of x = col, y = -row
+    rows, cols = np.mgrid[miny:miny + height, minx:minx + width] + 0.5
+    return vectorized.contains(geometry, cols, -rows)
+
+
+class ClipTest(TileTestCase):
+
+    def test_clip(self):
+        img = make_image(6, 6)
+        expected = self.expected(img)
+        triangle = Polygon([(2, -2), (46, -2), (2, -46)])
+        clipped = img.clip_to(triangle, nodata=9)
+        self.assertEqual(clipped.__geo_transform__.fwd(0, 0), (2.0, -2.0))
+        data = clipped.read()
+        mask = pixel_mask(triangle, *clipped.shape[1:], minx=2, miny=2)
+        np.testing.assert_array_equal(data[:, mask], expected[:, 2:46, 2:46][:, mask])
+        self.assertTrue((data[:, ~mask] == 9).all())
+        # the tiles below the diagonal are never fetched
+        self.assertEqual(len(urls), 6 * 7 // 2)
+        self.assertEqual(type(clipped), type(img))
+
+    def test_rasterize(self):
+        img = make_image(6, 6)
+        fields = MultiPolygon([box(1.5, -10, 20, -3.2), Polygon([(30, -30), (47, -33), (40, -47)])])
+        mask = img.rasterize(fields)
+        self.assertEqual(mask.shape, img.shape[1:])
+        self.assertEqual(mask.chunks, img.chunks[1:])
+        np.testing.assert_array_equal(mask.compute(scheduler='sync'), pixel_mask(fields, 48, 48))
+        # rasterizing doesn't read the image
+        self.assertEqual(urls, [])
+        # a clip and the mask of its geometry line up
+        clipped = img.clip_to(fields)
+        minx, miny = clipped.__geo_transform__.fwd(0, 0)
+        np.testing.assert_array_equal(clipped.rasterize(fields).compute(scheduler='sync'),
+                                      pixel_mask(fields, *clipped.shape[1:], minx=int(minx), miny=-int(miny)))
+
+    def test_value_clip(self):
+        img = make_image(2, 2)
+        np.testing.assert_array_equal(img.clip(10, 20).compute(scheduler='sync'),
+                                      np.clip(img.compute(scheduler='sync'), 10, 20))
+        np.testing.assert_array_equal(img.clip(max=5).compute(scheduler='sync'),
+                                      np.clip(img.compute(scheduler='sync'), None, 5))
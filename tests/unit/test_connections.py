@@ -0,0 +1,102 @@
+'''
+Unit tests for the connection manager, run against a local server
+'''
+
+import time
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from gbdxtools.connections import ConnectionManager, MeteredAdapter, TMS_USER_AGENT, connection_manager
+from gbdxtools.rda import scheduler
+from gbdxtools.rda.scheduler import set_scheduler
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    agents = []
+
+    def do_GET(self):
+        self.agents.append(self.headers.get('User-Agent'))
+        time.sleep(0.1)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionManagerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def get_concurrently(self, session, n):
+        threads = [threading.Thread(target=session.get, args=(self.url,)) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_exhaustion_metrics(self):
+        session = requests.Session()
+        adapter = MeteredAdapter(pool_size=2)
+        session.mount('http://', adapter)
+        self.get_concurrently(session, 6)
+        stats = adapter.stats()
+        self.assertEqual(stats.requests, 6)
+        self.assertEqual(stats.active, 0)
+        self.assertTrue(stats.peak > 2)
+        self.assertTrue(stats.exhausted > 0)
+        self.assertEqual(stats.connections, 6)
+
+    def test_pool_sized_to_workers(self):
+        manager = ConnectionManager(workers=8)
+        session = manager.tms_session()
+        self.get_concurrently(session, 6)
+        self.get_concurrently(session, 6)
+        stats = manager.stats()['tms']
+        self.assertEqual((stats.pool_size, stats.requests, stats.exhausted), (8, 12, 0))
+        # the second round reused the connections from the first
+        self.assertEqual(stats.connections, 6)
+        self.assertEqual(SlowHandler.agents[-1], TMS_USER_AGENT)
+
+    def test_mount_and_resize(self):
+        manager = ConnectionManager(workers=8)
+        session = manager.mount(requests.Session())
+        rda = session.get_adapter('https://rda.geobigdata.io/v1/template/abc')
+        self.assertIs(rda, manager.adapter('rda'))
+        self.assertIs(session.get_adapter('https://geobigdata.io/catalog/v2/record/abc'), manager.adapter('catalog'))
+        self.assertIs(session.get_adapter('https://vector.geobigdata.io/insight-vector/api/vectors'), manager.adapter('vectors'))
+        manager.resize(32)
+        self.assertIsNot(session.get_adapter('https://rda.geobigdata.io/v1/template/abc'), rda)
+        self.assertEqual(manager.stats()['rda'].pool_size, 32)
+        with self.assertRaises(ValueError):
+            manager.adapter('nope')
+
+    def test_sized_to_scheduler(self):
+        saved = scheduler._scheduler
+        session = connection_manager.mount(requests.Session())
+        url = 'https://rda.geobigdata.io/v1/template/abc'
+        try:
+            set_scheduler("threads", num_workers=6)
+            self.assertEqual(session.get_adapter(url).stats().pool_size, 6)
+            # changing the scheduler resizes the pools of mounted sessions
+            set_scheduler("threads", num_workers=12)
+            self.assertEqual(session.get_adapter(url).stats().pool_size, 12)
+            # and pools made later are sized for it too
+            self.assertEqual(ConnectionManager().adapter('tms').stats().pool_size, 12)
+        finally:
+            scheduler._scheduler = saved
+            connection_manager.resize()
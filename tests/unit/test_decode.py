@@ -0,0 +1,51 @@
+'''
+Unit tests for the tile decoding backends
+'''
+
+import unittest
+from io import BytesIO
+
+import imageio
+import tifffile
+import numpy as np
+
+from gbdxtools.rda import decode
+from gbdxtools.rda.decode import decoders, set_decoder, get_decoder
+
+RGB = (np.arange(16 * 16 * 3) % 251).astype(np.uint8).reshape(16, 16, 3)
+PNG = imageio.imwrite(imageio.RETURN_BYTES, RGB, format='png')
+PAN = np.arange(16 * 16, dtype=np.uint16).reshape(16, 16)
+_tiff = BytesIO()
+tifffile.imwrite(_tiff, PAN)
+TIFF = _tiff.getvalue()
+
+
+class DecoderTest(unittest.TestCase):
+
+    def tearDown(self):
+        set_decoder("inline")
+
+    def check(self, decoder):
+        arr = decoder.decode(PNG, 'image/png')
+        np.testing.assert_array_equal(arr, np.rollaxis(RGB, 2, 0))
+        arr = decoder.decode(TIFF, 'image/tiff')
+        np.testing.assert_array_equal(arr, PAN[None])
+
+    def test_inline(self):
+        self.check(decoders["inline"]())
+
+    def test_processes(self):
+        decoder = decoders["processes"](1)
+        self.check(decoder)
+        decoder.shutdown()
+
+    @unittest.skipUnless(decode.has_imagecodecs, "imagecodecs is not installed")
+    def test_imagecodecs(self):
+        self.check(decoders["imagecodecs"]())
+
+    def test_set_decoder(self):
+        set_decoder("processes", workers=1)
+        self.assertEqual(get_decoder().name, "processes")
+        np.testing.assert_array_equal(decode.decode(TIFF, 'image/tiff'), PAN[None])
+        with self.assertRaises(ValueError):
+            set_decoder("threads")
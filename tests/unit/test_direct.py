@@ -0,0 +1,55 @@
+'''
+Unit tests for direct reads of fetch-and-slice images
+'''
+
+import numpy as np
+import dask.array as da
+
+from gbdxtools.rda import direct
+
+from helpers import TileTestCase, make_image, urls
+
+
+class DirectReadTest(TileTestCase):
+
+    def assertReadsDirectly(self, img, bands=None):
+        tiles = direct.plan(img)
+        self.assertIsNotNone(tiles)
+        expected = img.compute(scheduler='sync')
+        if bands is not None:
+            expected = expected[bands]
+        np.testing.assert_array_equal(direct.read(img, tiles, bands=bands), expected)
+
+    def test_image(self):
+        self.assertReadsDirectly(make_image(4, 3))
+
+    def test_windows(self):
+        img = make_image(5, 5)
+        self.assertReadsDirectly(img[:, 3:29, 5:37])
+        self.assertReadsDirectly(img[:, 3:29, 5:37][:, 2:20, 1:9])
+        self.assertReadsDirectly(img._window(-5, 30, 20, 50))
+        # slices made by dask itself
+        self.assertReadsDirectly(da.Array.__getitem__(img, (slice(None), slice(3, 29), slice(5, 37))))
+
+    def test_bands(self):
+        img = make_image(2, 2)[:, 1:12, 3:15]
+        self.assertReadsDirectly(img, bands=[2, 0])
+        self.assertReadsDirectly(img, bands=1)
+        np.testing.assert_array_equal(img.read(bands=[2, 0]), img[[2, 0], ...].compute(scheduler='sync'))
+
+    def test_fetches_each_tile_once(self):
+        img = make_image(4, 4)[:, 4:28, 4:28]
+        img.read()
+        self.assertEqual(len(urls), 16)
+        self.assertEqual(len(set(urls)), 16)
+
+    def test_other_graphs_use_dask(self):
+        img = make_image(3, 3)
+        self.assertIsNone(direct.plan(img.map_blocks(lambda block: block * 2)))
+        self.assertIsNone(direct.plan((img + 1)[:, 2:10, 2:10]))
+        np.testing.assert_array_equal(img.map_blocks(lambda block: block * 2).read(),
+                                      img.compute(scheduler='sync') * 2)
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            make_image(3, 1, min_x=-1).read()
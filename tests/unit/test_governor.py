@@ -0,0 +1,199 @@
+'''
+Unit tests for the request concurrency governor
+'''
+
+import time
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from gbdxtools.rda import governor as gov
+from gbdxtools.rda.governor import Governor, HostLimiter, CLOSED, OPEN, HALF_OPEN
+from gbdxtools.rda.error import CircuitOpen
+
+URL = "https://rda.geobigdata.io/v1/template/abc/tile/3/4"
+
+
+class Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class Session(object):
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        status = self.statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return Response(status)
+
+
+class HostLimiterTest(unittest.TestCase):
+
+    def test_bounds_in_flight(self):
+        limiter = HostLimiter(max_limit=4)
+        peak, lock = [0, 0], threading.Lock()
+        def request():
+            limiter.acquire()
+            with lock:
+                peak[0] += 1
+                peak[1] = max(peak)
+            time.sleep(0.05)
+            with lock:
+                peak[0] -= 1
+            limiter.release(status=200)
+        threads = [threading.Thread(target=request) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(peak[1], 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_aimd(self):
+        limiter = HostLimiter(max_limit=32)
+        limiter.acquire()
+        limiter.release(status=429)
+        self.assertEqual(limiter.limit, 16)
+        # a burst of throttled responses only cuts the limit once per round trip
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(status=429)
+        self.assertEqual(limiter.limit, 16)
+        for _ in range(16):
+            limiter.acquire()
+            limiter.release(status=200)
+        self.assertTrue(16.9 < limiter.limit < 17.1)
+        self.assertEqual(limiter.state, CLOSED)
+
+    def test_latency_signal(self):
+        limiter = HostLimiter(max_limit=32)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(status=200, latency=0.01)
+        limiter.acquire()
+        limiter.release(status=200, latency=1.0)
+        self.assertTrue(limiter.limit < 32)
+
+    def test_circuit_breaker(self):
+        limiter = HostLimiter(failure_threshold=3, reset_timeout=0.1)
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(status=500)
+        self.assertEqual(limiter.state, OPEN)
+        with self.assertRaises(CircuitOpen):
+            limiter.acquire()
+        time.sleep(0.15)
+        # one probe is let through, everything else waits until it returns
+        limiter.acquire()
+        self.assertEqual(limiter.state, HALF_OPEN)
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        waiter.join(0.05)
+        self.assertTrue(waiter.is_alive())
+        limiter.release(status=200)
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(limiter.state, CLOSED)
+        self.assertEqual(limiter.in_flight, 1)
+        limiter.release(status=200)
+
+    def test_failed_probe_reopens(self):
+        limiter = HostLimiter(failure_threshold=1, reset_timeout=0.2)
+        limiter.acquire()
+        limiter.release(error=IOError())
+        time.sleep(0.25)
+        limiter.acquire()
+        errors = []
+        def wait():
+            try:
+                limiter.acquire()
+            except CircuitOpen as e:
+                errors.append(e)
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        limiter.release(error=IOError())
+        waiter.join(1)
+        self.assertEqual(limiter.state, OPEN)
+        # requests waiting on the probe fail once it does
+        self.assertEqual(len(errors), 1)
+
+    def test_throttling_is_not_failure(self):
+        limiter = HostLimiter(max_limit=32, failure_threshold=3)
+        for status in [502, 503, 504, 429] * 3:
+            limiter.acquire()
+            limiter.release(status=status)
+        # an autoscaling burst cuts the limit but doesn't open the circuit
+        self.assertEqual(limiter.state, CLOSED)
+        self.assertEqual(limiter.failures, 0)
+        self.assertEqual(limiter.throttled, 12)
+        self.assertEqual(limiter.limit, 16)
+
+    def test_acquire_async(self):
+        limiter = HostLimiter(max_limit=2)
+        peak = [0, 0]
+        async def request():
+            await limiter.acquire_async()
+            peak[0] += 1
+            peak[1] = max(peak)
+            await asyncio.sleep(0.02)
+            peak[0] -= 1
+            limiter.release(status=200)
+        async def main():
+            await asyncio.gather(*[request() for _ in range(8)])
+        asyncio.new_event_loop().run_until_complete(main())
+        self.assertEqual(peak[1], 2)
+
+
+class GovernorTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(gov, "backoff", return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hosts_are_independent(self):
+        g = Governor(max_limit=8)
+        self.assertIs(g.limiter(URL), g.limiter(URL.replace("tile/3/4", "tile/5/5")))
+        self.assertIsNot(g.limiter(URL), g.limiter("http://a.tile.openstreetmap.org/1/1/1.png"))
+
+    def test_get_retries(self):
+        g = Governor()
+        session = Session([429, 502, 200])
+        res = g.get(session, URL)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(session.calls, 3)
+        self.assertEqual(g.stats()["rda.geobigdata.io"].throttled, 2)
+
+    def test_get_returns_last_response(self):
+        g = Governor()
+        session = Session([502] * 5)
+        self.assertEqual(g.get(session, URL).status_code, 502)
+        self.assertEqual(session.calls, 5)
+
+    def test_get_raises_connection_error(self):
+        g = Governor()
+        session = Session([IOError("reset")] * 5)
+        with self.assertRaises(IOError):
+            g.get(session, URL)
+
+    def test_get_fails_fast_when_open(self):
+        g = Governor(failure_threshold=2)
+        session = Session([500] * 5)
+        with self.assertRaises(CircuitOpen):
+            g.get(session, URL)
+        self.assertEqual(session.calls, 2)
+
+
+class BackoffTest(unittest.TestCase):
+
+    def test_jittered_and_capped(self):
+        delays = [gov.backoff(10) for _ in range(50)]
+        self.assertTrue(all(0 <= d <= 30 for d in delays))
+        self.assertTrue(len(set(delays)) > 1)
+        self.assertTrue(gov.backoff(0) <= 0.5)
@@ -0,0 +1,116 @@
+'''
+Unit tests for hedged tile requests
+'''
+
+import time
+import asyncio
+import threading
+import unittest
+
+from gbdxtools.rda.hedge import Hedger, LatencyTracker
+
+URL = "https://rda.geobigdata.io/v1/template/abc/tile/3/4"
+
+
+def warm(hedger, latency=0.01, n=20):
+    for _ in range(n):
+        hedger.tracker(URL).add(latency)
+
+
+class LatencyTrackerTest(unittest.TestCase):
+
+    def test_percentile(self):
+        tracker = LatencyTracker(min_samples=10)
+        for i in range(9):
+            tracker.add(i)
+        self.assertIsNone(tracker.percentile(95))
+        for i in range(9, 100):
+            tracker.add(i)
+        self.assertAlmostEqual(tracker.percentile(95), 94.05)
+
+
+class HedgerTest(unittest.TestCase):
+
+    def slow_then_fast(self):
+        calls = []
+        lock = threading.Lock()
+        def fetch(url):
+            with lock:
+                calls.append(url)
+                n = len(calls)
+            if n == 1:
+                time.sleep(1)
+                return "slow"
+            return "fast"
+        return fetch, calls
+
+    def test_disabled(self):
+        hedger = Hedger()
+        warm(hedger)
+        fetch, calls = self.slow_then_fast()
+        self.assertEqual(hedger.call(URL, fetch), "slow")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(hedger.info().hedges, 0)
+
+    def test_hedge_wins(self):
+        hedger = Hedger(enabled=True)
+        warm(hedger)
+        fetch, calls = self.slow_then_fast()
+        start = time.time()
+        self.assertEqual(hedger.call(URL, fetch), "fast")
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(hedger.info()[1:], (1, 1))
+
+    def test_no_hedge_until_warm(self):
+        hedger = Hedger(enabled=True)
+        warm(hedger, n=5)
+        fetch, calls = self.slow_then_fast()
+        self.assertEqual(hedger.call(URL, fetch), "slow")
+        self.assertEqual(len(calls), 1)
+
+    def test_first_failure_falls_back(self):
+        hedger = Hedger(enabled=True)
+        warm(hedger)
+        def fetch(url):
+            time.sleep(0.05)
+            raise IOError("reset")
+        with self.assertRaises(IOError):
+            hedger.call(URL, fetch)
+
+    def test_budget(self):
+        hedger = Hedger(enabled=True, budget=0.1, quantile=50)
+        warm(hedger, n=500)
+        def fetch(url):
+            time.sleep(0.05)
+            return 1
+        for _ in range(10):
+            hedger.call(URL, fetch)
+        # one hedge up front, then one per ten requests
+        self.assertEqual(hedger.info(), (10, 1, 0))
+        for _ in range(10):
+            hedger.call(URL, fetch)
+        self.assertEqual(hedger.info().hedges, 2)
+
+    def test_async_cancels_loser(self):
+        hedger = Hedger(enabled=True)
+        warm(hedger)
+        cancelled = []
+        calls = []
+        async def fetch(url):
+            calls.append(url)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(1)
+                except asyncio.CancelledError:
+                    cancelled.append(url)
+                    raise
+                return "slow"
+            return "fast"
+        async def main():
+            result = await hedger.call_async(URL, fetch)
+            await asyncio.sleep(0)
+            return result
+        result = asyncio.new_event_loop().run_until_complete(main())
+        self.assertEqual(result, "fast")
+        self.assertEqual(cancelled, [URL])
@@ -0,0 +1,194 @@
+'''
+Unit tests for the lazy tile graph layers
+'''
+
+import time
+import unittest
+
+import numpy as np
+import dask.array as da
+from dask.highlevelgraph import HighLevelGraph
+from shapely.geometry import box, shape, Polygon
+
+from gbdxtools.images.layers import TemplateTileLayer, SliceLayer
+
+from helpers import TILE, TileTestCase, make_image, tile_xy, urls
+
+
+def load_flat_tile(url, accept=None):
+    # 2 band tiles filled with 100 * y + x
+    urls.append(url)
+    x, y = tile_xy(url)
+    return np.full((2, TILE, TILE), 100 * y + x, dtype=np.uint16)
+
+
+def template_image(nx, ny):
+    return make_image(nx, ny, nbands=2, loader=load_flat_tile)
+
+
+class TileLayerTest(unittest.TestCase):
+
+    def test_tasks(self):
+        layer = TemplateTileLayer('image-a', load_flat_tile, 'http://rda.test/template/abc/tile', 'nodeId=Format',
+                                  10, 20, 3, 2, args=('image/png',))
+        self.assertEqual(len(layer), 6)
+        self.assertEqual(len(list(layer)), 6)
+        self.assertEqual(layer[('image-a', 0, 1, 2)],
+                         (load_flat_tile, 'http://rda.test/template/abc/tile/12/21?nodeId=Format', 'image/png'))
+        self.assertTrue(('image-a', 0, 0, 0) in layer)
+        self.assertFalse(('image-a', 0, 2, 0) in layer)
+        self.assertFalse(('image-b', 0, 0, 0) in layer)
+        with self.assertRaises(KeyError):
+            layer[('image-a', 0, 0, 3)]
+
+    def test_footprint(self):
+        # a diagonal strip: tiles the footprint misses are zeros, the rest are fetched
+        footprint = Polygon([(0, 0), (6, 0), (32, 26), (32, 32), (26, 32), (0, 6)])
+        layer = TemplateTileLayer('image-a', load_flat_tile, 'http://rda.test/template/abc/tile', 'nodeId=Format',
+                                  0, 0, 4, 4, footprint=footprint, tile_shape=(2, TILE, TILE), dtype=np.uint16)
+        self.assertEqual(layer[('image-a', 0, 3, 0)], (np.zeros, (2, TILE, TILE), np.uint16))
+        self.assertEqual(layer[('image-a', 0, 0, 3)], (np.zeros, (2, TILE, TILE), np.uint16))
+        self.assertEqual(layer[('image-a', 0, 1, 2)][0], load_flat_tile)
+        self.assertEqual(layer[('image-a', 0, 0, 1)][0], load_flat_tile)
+        self.assertEqual(sum(layer[key][0] is np.zeros for key in layer), 6)
+
+
+class SliceLayerTest(unittest.TestCase):
+
+    def test_matches_numpy(self):
+        arr = np.arange(2 * 30 * 50).reshape(2, 30, 50)
+        darr = da.from_array(arr, chunks=(2, 8, 16))
+        for bounds in [(0, 0, 50, 30), (3, 5, 41, 29), (16, 8, 32, 16), (17, 9, 18, 10)]:
+            name = 'slice-{}'.format(bounds)
+            layer = SliceLayer(name, darr.name, darr.chunks, bounds)
+            dsk = HighLevelGraph.from_collections(name, layer, dependencies=[darr])
+            minx, miny, maxx, maxy = bounds
+            window = da.Array(dsk, name, layer.chunks, dtype=darr.dtype)
+            np.testing.assert_array_equal(window.compute(scheduler='sync'), arr[:, miny:maxy, minx:maxx])
+
+    def test_padding(self):
+        arr = np.arange(2 * 30 * 50).reshape(2, 30, 50)
+        darr = da.from_array(arr, chunks=(2, 8, 16))
+        layer = SliceLayer('padded', darr.name, darr.chunks, (-5, 20, 60, 40), dtype=darr.dtype)
+        dsk = HighLevelGraph.from_collections('padded', layer, dependencies=[darr])
+        window = da.Array(dsk, 'padded', layer.chunks, dtype=darr.dtype).compute(scheduler='sync')
+        expected = np.zeros((2, 20, 65), dtype=arr.dtype)
+        expected[:, :10, 5:55] = arr[:, 20:, :]
+        np.testing.assert_array_equal(window, expected)
+
+    def test_interior_blocks_alias_parent(self):
+        layer = SliceLayer('slice', 'parent', ((2,), (8,) * 4, (8,) * 4), (4, 8, 32, 24))
+        self.assertEqual(layer[('slice', 0, 0, 1)], ('parent', 0, 1, 1))
+        self.assertEqual(layer.chunks, ((2,), (8, 8), (4, 8, 8, 8)))
+
+
+class LazyGraphTest(TileTestCase):
+
+    def test_window(self):
+        img = template_image(6, 5)
+        window = img._window(4, 12, 30, 37)
+        self.assertEqual(window.shape, (2, 25, 26))
+        self.assertEqual(window.__geo_transform__.fwd(0, 0), (4.0, -12.0))
+        result = window.compute(scheduler='sync')
+        self.assertEqual(result[0, 0, 0], 100 * 1 + 0)
+        self.assertEqual(result[0, -1, -1], 100 * 4 + 3)
+        # only the tiles under the window were fetched
+        self.assertEqual(len(urls), 4 * 4)
+
+    def test_slicing(self):
+        img = template_image(6, 5)
+        expected = img.compute(scheduler='sync')
+        window = img[:, 3:29, 17:40]
+        self.assertEqual(window.__geo_transform__.fwd(0, 0), (17.0, -3.0))
+        np.testing.assert_array_equal(window.compute(scheduler='sync'), expected[:, 3:29, 17:40])
+        # only the window's own tasks are in its graph
+        self.assertEqual(len(window.dask), 4 * 3 + 4 * 3)
+        np.testing.assert_array_equal(img[:, 30:, :8].compute(scheduler='sync'), expected[:, 30:, :8])
+        np.testing.assert_array_equal(img[[1], 2:5, 2:5].compute(scheduler='sync'), expected[[1], 2:5, 2:5])
+
+    def test_window_cover(self):
+        img = template_image(3, 2)
+        expected = img.compute(scheduler='sync')
+        windows = list(img.window_cover((10, 10)))
+        self.assertEqual(len(windows), 2 * 3)
+        padded = np.zeros((2, 20, 30), dtype=expected.dtype)
+        padded[:, :16, :24] = expected
+        np.testing.assert_array_equal(windows[-1].compute(scheduler='sync'), padded[:, 10:, 20:])
+        self.assertEqual(shape(windows[-1]).bounds, (20.0, -20.0, 30.0, -10.0))
+        self.assertEqual(len(list(img.window_cover((10, 10), pad=False))), 2)
+
+    def test_band_chunks(self):
+        # windows of images with bands in several chunks are sliced and padded by dask
+        img = template_image(3, 2).rechunk((1, TILE, TILE))
+        expected = img.compute(scheduler='sync')
+        padded = np.zeros((2, 20, 30), dtype=expected.dtype)
+        padded[:, :16, :24] = expected
+        aoi = img[box(2, -13, 20, -3)]
+        self.assertEqual(aoi.__geo_transform__.fwd(0, 0), (2.0, -3.0))
+        np.testing.assert_array_equal(aoi.compute(scheduler='sync'), expected[:, 3:13, 2:20])
+        windows = list(img.window_cover((10, 10)))
+        self.assertEqual(len(windows), 2 * 3)
+        self.assertEqual(windows[-1].chunks[0], (1, 1))
+        np.testing.assert_array_equal(windows[-1].compute(scheduler='sync'), padded[:, 10:, 20:])
+        np.testing.assert_array_equal(img._window(-3, -2, 5, 4).compute(scheduler='sync'),
+                                      np.pad(expected, ((0, 0), (2, 0), (3, 0)))[:, :6, :8])
+        (origins, data), = img.window_batches((10, 10), batch_size=6)
+        np.testing.assert_array_equal(data[4], padded[:, 10:, 10:20])
+
+    def test_window_batches(self):
+        img = template_image(3, 2)
+        expected = self.expected(img)
+        padded = np.zeros((2, 20, 30), dtype=expected.dtype)
+        padded[:, :16, :24] = expected
+        batches = list(img.window_batches((10, 10), batch_size=4))
+        self.assertEqual([len(origins) for origins, _ in batches], [4, 2])
+        origins, data = batches[0]
+        self.assertEqual(data.shape, (4, 2, 10, 10))
+        self.assertEqual(origins[1], (0, 10))
+        np.testing.assert_array_equal(data[1], padded[:, 0:10, 10:20])
+        np.testing.assert_array_equal(batches[1][1][1], padded[:, 10:20, 20:30])
+        self.assertEqual(len(list(img.window_batches((10, 10), pad=False))[0][0]), 2)
+
+    def test_overlapping_window_batches(self):
+        img = template_image(4, 4)
+        expected = self.expected(img)
+        (origins, data), = img.window_batches((8, 8), batch_size=100, stride=4, pad=False)
+        self.assertEqual(len(origins), 7 * 7)
+        for (y, x), window in zip(origins, data):
+            np.testing.assert_array_equal(window, expected[:, y:y + 8, x:x + 8])
+        # every tile is fetched once for the batch, not once for each window it is in
+        self.assertEqual(len(urls), 16)
+
+    def test_map_overlap(self):
+        def box_sum(block):
+            # the sum of each pixel's 3x3 neighbourhood
+            padded = np.pad(block.astype(np.int64), ((0, 0), (1, 1), (1, 1)))
+            return sum(padded[:, dy:dy + block.shape[1], dx:dx + block.shape[2]] for dy in range(3) for dx in range(3))
+        img = template_image(4, 3)
+        expected = box_sum(self.expected(img))
+        window = img[:, 3:22, 5:30]
+        result = window.map_overlap(box_sum, depth=1, boundary='none', dtype=np.int64)
+        self.assertEqual(result.__geo_transform__.fwd(0, 0), window.__geo_transform__.fwd(0, 0))
+        self.assertEqual(result.chunks, window.chunks)
+        data = result.compute(scheduler='sync')
+        np.testing.assert_array_equal(data[:, 1:-1, 1:-1], expected[:, 4:21, 6:29])
+        # the margins come from tiles the window reads anyway
+        self.assertEqual(len(urls), 3 * 4)
+
+    def test_map_overlap_narrow_blocks(self):
+        img = template_image(4, 3)
+        window = img[:, 3:22, 5:30]
+        # the 5 and 3 pixel edge blocks are merged into their neighbours to give 6 pixel margins
+        result = window.map_overlap(lambda block: block, depth=(6, 6))
+        self.assertEqual(result.chunks[1:], ((13, 6), (11, 8, 6)))
+        np.testing.assert_array_equal(result.compute(scheduler='sync'), window.compute(scheduler='sync'))
+
+    def test_small_aoi_of_large_image(self):
+        # a million tile strip: building and reading a small AOI doesn't touch the rest of it
+        start = time.time()
+        img = template_image(1000, 1000)
+        aoi = img._window(0, 0, img.shape[2], img.shape[1], cull=False)[:, 4000:4020, 6000:6020]
+        np.testing.assert_array_equal(aoi.compute(scheduler='sync')[0, ::8, ::8],
+                                      [[100 * y + x for x in (750, 751, 752)] for y in (500, 501, 502)])
+        self.assertEqual(len(urls), 9)
+        self.assertTrue(time.time() - start < 5)
@@ -0,0 +1,92 @@
+'''
+Unit tests for prefetching window traversals
+'''
+
+import time
+import threading
+import unittest
+
+import numpy as np
+
+from gbdxtools.images.meta import DaskImage
+from gbdxtools.rda import cache
+from gbdxtools.rda.cache import load_tile
+from gbdxtools.rda.fetch import tile_loader
+from gbdxtools.rda.prefetch import prefetch
+
+fetched = []
+_lock = threading.Lock()
+
+
+def fetch(url):
+    with _lock:
+        fetched.append(url)
+    time.sleep(0.02)
+    return np.ones((1, 8, 8), dtype=np.uint8)
+
+
+@tile_loader(headers=dict)
+def load_test_tile(url):
+    return load_tile(url, fetch)
+
+
+def make_image(name):
+    dsk = {(name, 0, y, x): (load_test_tile, 'http://tiles.test/{}/{}/{}'.format(name, x, y))
+           for y in range(4) for x in range(4)}
+    return DaskImage({'dask': dsk, 'name': name, 'chunks': ((1,), (8,) * 4, (8,) * 4),
+                      'dtype': np.uint8, 'shape': (1, 32, 32)})
+
+
+def wait_for(count, timeout=2):
+    deadline = time.time() + timeout
+    while len(fetched) < count and time.time() < deadline:
+        time.sleep(0.01)
+    return len(fetched)
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.tile_cache.clear()
+        del fetched[:]
+
+    def tearDown(self):
+        cache.tile_cache.clear()
+
+    def test_prefetches_ahead(self):
+        windows = make_image('prefetch-ahead').window_cover((8, 8), prefetch=2)
+        first = next(windows)
+        # the first window and the two after it are downloading without being read
+        self.assertEqual(wait_for(3), 3)
+        time.sleep(0.1)
+        self.assertEqual(len(fetched), 3)
+        first.compute()
+        count = 1
+        for window in windows:
+            window.compute()
+            count += 1
+        self.assertEqual(count, 16)
+        # every tile was fetched once, by the prefetcher or the read
+        self.assertEqual(len(fetched), 16)
+        self.assertEqual(len(set(fetched)), 16)
+
+    def test_cancelled_when_closed(self):
+        windows = make_image('prefetch-close').window_cover((8, 8), prefetch=4)
+        next(windows)
+        windows.close()
+        time.sleep(0.3)
+        self.assertTrue(len(fetched) <= 5)
+
+    def test_byte_budget(self):
+        image = make_image('prefetch-budget')
+        windows = prefetch(image._window_cover((8, 8), True), depth=8, max_bytes=64)
+        next(windows)
+        time.sleep(0.2)
+        # a single 64 byte tile fills the budget, so nothing is fetched past the current window
+        self.assertEqual(len(fetched), 1)
+        windows.close()
+
+    def test_iterwindows(self):
+        windows = list(make_image('prefetch-random').iterwindows(count=5, window_shape=(8, 8), prefetch=2))
+        self.assertEqual(len(windows), 5)
+        self.assertTrue(all(w.shape == (1, 8, 8) for w in windows))
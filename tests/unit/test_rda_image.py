@@ -11,6 +11,7 @@ from helpers import WV02_CATID, WV04_CATID
 
 from gbdxtools import IdahoImage, CatalogImage
 from gbdxtools.images.meta import DaskImage
+from gbdxtools.rda.fetch import load_url
 
 import dask.array as da
 import numpy as np
@@ -35,6 +36,15 @@ class RdaImageTest(unittest.TestCase):
         assert img.shape == (4, 6510, 6955)
         assert img.proj == 'EPSG:4326'
 
+    @gbdx_vcr.use_cassette('tests/unit/cassettes/test_ipe_image_default.yaml')
+    def test_ipe_image_tile_format(self):
+        idahoid = '8c3c4fc6-abcb-4f5f-bce6-d496c1a91676'
+        img = self.gbdx.idaho_image(idahoid, bucket='rda-images-1', tile_format='auto')
+        tasks = [task for task in dict(img.dask).values() if type(task) is tuple and task[0] is load_url]
+        self.assertTrue(len(tasks) > 0)
+        # float tiles are asked for in a lossless encoding that can hold them
+        self.assertTrue(all(task[2].startswith('image/tiff; compression=deflate') for task in tasks))
+
     @gbdx_vcr.use_cassette('tests/unit/cassettes/test_ipe_image_init_with_aoi2.yaml')
     def test_ipe_image_with_aoi(self):
         idahoid = '8c3c4fc6-abcb-4f5f-bce6-d496c1a91676'
@@ -0,0 +1,61 @@
+'''
+Unit tests for reading images into preallocated and memory-mapped outputs
+'''
+
+import unittest
+
+import numpy as np
+
+from gbdxtools.images import meta
+from gbdxtools.rda import direct
+
+from helpers import make_image
+
+
+class ReadOutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.img = make_image(3, 2)[:, 2:14, 1:20]
+        self.expected = self.img.compute(scheduler='sync')
+
+    def read_both_ways(self, **kwargs):
+        # once directly and once through the dask scheduler
+        results = []
+        for enabled in (True, False):
+            direct.enabled = enabled
+            try:
+                results.append(self.img.read(**kwargs))
+            finally:
+                direct.enabled = True
+        return results
+
+    def test_out(self):
+        out = np.zeros(self.expected.shape, dtype=np.float32)
+        for result in self.read_both_ways(out=out):
+            self.assertIs(result, out)
+        np.testing.assert_array_equal(out, self.expected)
+
+    def test_out_shape(self):
+        with self.assertRaises(ValueError):
+            self.img.read(out=np.zeros((3, 12, 18)))
+        with self.assertRaises(ValueError):
+            self.img.read(layout="WHC")
+
+    def test_hwc(self):
+        for result in self.read_both_ways(layout="HWC"):
+            self.assertEqual(result.shape, (12, 19, 3))
+            self.assertTrue(result.flags.c_contiguous)
+            np.testing.assert_array_equal(result, np.rollaxis(self.expected, 0, 3))
+        for result in self.read_both_ways(bands=[2, 1], layout="HWC"):
+            np.testing.assert_array_equal(result, np.rollaxis(self.expected[[2, 1]], 0, 3))
+
+    def test_spill(self):
+        budget = meta.memory_budget
+        meta.memory_budget = self.expected.nbytes - 1
+        try:
+            for result in self.read_both_ways():
+                self.assertIsInstance(result, np.memmap)
+                np.testing.assert_array_equal(result, self.expected)
+            self.assertNotIsInstance(self.img.read(bands=[0]), np.memmap)
+        finally:
+            meta.memory_budget = budget
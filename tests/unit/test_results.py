@@ -0,0 +1,87 @@
+'''
+Unit tests for the cross-compute result cache
+'''
+
+import threading
+
+import numpy as np
+import dask.local
+
+from gbdxtools.rda import results, scheduler
+from gbdxtools.rda.results import ResultCache, set_result_cache
+from gbdxtools.rda.scheduler import set_scheduler
+
+from helpers import TileTestCase, make_image, urls
+
+calls = []
+_lock = threading.Lock()
+
+
+def double(block):
+    # dask also calls the function on a tiny array to find the result type
+    if block.size > 1:
+        with _lock:
+            calls.append(block.shape)
+    return block * 2
+
+
+class ResultCacheTest(TileTestCase):
+
+    def setUp(self):
+        super(ResultCacheTest, self).setUp()
+        self._saved = scheduler._scheduler
+        set_scheduler("sync")
+        set_result_cache(1024 ** 2)
+        del calls[:]
+
+    def tearDown(self):
+        set_result_cache(0)
+        scheduler._scheduler = self._saved
+
+    def test_repeated_read(self):
+        img = make_image(3, 3).map_blocks(double)
+        first = img.read()
+        self.assertEqual(len(calls), 9)
+        np.testing.assert_array_equal(img.read(), first)
+        self.assertEqual(len(calls), 9)
+        # the tiles are only fetched for the first read
+        self.assertEqual(len(urls), 9)
+
+    def test_overlapping_reads(self):
+        img = make_image(4, 4).map_blocks(double)
+        expected = img.compute(scheduler="sync")
+        del calls[:]
+        np.testing.assert_array_equal(img[:, 0:16, 0:16].read(), expected[:, 0:16, 0:16])
+        self.assertEqual(len(calls), 4)
+        np.testing.assert_array_equal(img[:, 8:24, 8:24].read(), expected[:, 8:24, 8:24])
+        # only the blocks the first read didn't cover are computed
+        self.assertEqual(len(calls), 4 + 3)
+
+    def test_tiles_not_kept(self):
+        make_image(2, 2).map_blocks(double).read()
+        self.assertTrue(all(not key[0].startswith("image-") for key in results.result_cache._store._entries))
+
+    def test_views_copied(self):
+        img = make_image(2, 2)[:, 1:9, 1:9]
+        img.read()
+        entries = [value for value, _, _ in results.result_cache._store._entries.values()]
+        self.assertTrue(entries)
+        # the cached slices don't hold on to the tiles they were sliced from
+        self.assertTrue(all(value.base is None for value in entries))
+        self.assertEqual(results.result_cache.cache_info().nbytes, sum(value.nbytes for value in entries))
+        np.testing.assert_array_equal(img.read(), img.compute(scheduler="sync"))
+
+    def test_byte_budget(self):
+        cache = ResultCache(max_bytes=3 * 8 * 8 * 3 * 2)
+        img = make_image(3, 3).map_blocks(double)
+        img.compute(scheduler=cache.wrap(dask.local.get_sync))
+        info = cache.cache_info()
+        self.assertEqual(info.entries, 3)
+        self.assertTrue(info.nbytes <= info.max_bytes)
+
+    def test_disabled(self):
+        set_result_cache(0)
+        img = make_image(2, 2).map_blocks(double)
+        img.read()
+        img.read()
+        self.assertEqual(len(calls), 8)
@@ -0,0 +1,98 @@
+'''
+Unit tests for the locality aware window sampler and loader
+'''
+
+import unittest
+
+import numpy as np
+
+from gbdxtools.rda import cache
+from gbdxtools.rda.fetch import tile_loader
+from gbdxtools.rda.sampler import WindowSampler, WindowLoader
+
+from helpers import TILE, TileTestCase, load_tile, make_image, urls
+
+
+@tile_loader(headers=dict)
+def load_cached_tile(url, accept=None):
+    return cache.load_tile(url, load_tile, accept)
+
+
+def tiles(origin, window_shape=(TILE, TILE)):
+    y, x = origin
+    return {(row, col) for row in range(y // TILE, (y + window_shape[0] - 1) // TILE + 1)
+            for col in range(x // TILE, (x + window_shape[1] - 1) // TILE + 1)}
+
+
+class WindowSamplerTest(unittest.TestCase):
+
+    def test_windows(self):
+        img = make_image(10, 10)
+        expected = img.compute(scheduler='sync')
+        sampler = WindowSampler(img, (TILE, TILE), seed=1)
+        for _ in range(20):
+            (y, x), window = sampler.window()
+            self.assertEqual(window.shape, (3, TILE, TILE))
+            np.testing.assert_array_equal(window.compute(scheduler='sync'), expected[:, y:y + TILE, x:x + TILE])
+
+    def test_locality(self):
+        img = make_image(50, 50)
+
+        def distinct_tiles(locality):
+            sampler = WindowSampler(img, (TILE, TILE), locality=locality, seed=2)
+            return len(set().union(*[tiles(sampler.origin()) for _ in range(200)]))
+        # windows drawn near recent windows touch far fewer tiles than uniform ones
+        self.assertTrue(distinct_tiles(0.9) * 3 < distinct_tiles(0))
+
+    def test_cached_tiles(self):
+        img = make_image(50, 50, loader=load_cached_tile)
+        cache.tile_cache.clear()
+        sampler = WindowSampler(img, (TILE, TILE), locality=1, seed=6)
+        fetched = []
+        for _ in range(50):
+            del urls[:]
+            _, window = sampler.window()
+            window.compute(scheduler='sync')
+            fetched.append(len(urls))
+        # the first window is drawn uniformly, the rest land on the tiles it fetched
+        self.assertTrue(fetched[0] > 0)
+        self.assertEqual(sum(fetched[1:]), 0)
+        cache.tile_cache.clear()
+
+    def test_errors(self):
+        img = make_image(2, 2)
+        with self.assertRaises(ValueError):
+            WindowSampler(img, (TILE, TILE), locality=2)
+        with self.assertRaises(ValueError):
+            WindowSampler(img, (100, 100))
+
+
+class WindowLoaderTest(TileTestCase):
+
+    def test_batches(self):
+        img = make_image(6, 6)
+        expected = img.compute(scheduler='sync')
+        batches = list(img.window_loader((TILE, TILE), batch_size=5, count=7, seed=3))
+        self.assertEqual(len(batches), 7)
+        for origins, data in batches:
+            self.assertEqual(data.shape, (5, 3, TILE, TILE))
+            for (y, x), window in zip(origins, data):
+                np.testing.assert_array_equal(window, expected[:, y:y + TILE, x:x + TILE])
+
+    def test_close(self):
+        img = make_image(6, 6)
+        with img.window_loader((TILE, TILE), batch_size=2, workers=3, seed=4) as loader:
+            for i, (origins, data) in enumerate(loader):
+                if i == 5:
+                    break
+        self.assertTrue(all(not thread.is_alive() for thread in self._join(loader)))
+
+    def test_errors(self):
+        loader = WindowLoader(WindowSampler(make_image(3, 1, min_x=-1), (TILE, TILE), seed=5), batch_size=4)
+        with self.assertRaises(TypeError):
+            list(loader)
+
+    def _join(self, loader):
+        for thread in loader._threads:
+            thread.join(5)
+        return loader._threads
@@ -0,0 +1,71 @@
+'''
+Unit tests for the scheduler configuration
+'''
+
+import unittest
+
+import numpy as np
+import dask.local
+import dask.threaded
+
+from gbdxtools.connections import connection_manager
+from gbdxtools.rda import direct, scheduler
+from gbdxtools.rda.scheduler import Scheduler, set_scheduler, get_scheduler
+
+from helpers import make_image
+
+
+class Unshared(Scheduler):
+    shared_memory = False
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = scheduler._scheduler
+
+    def tearDown(self):
+        scheduler._scheduler = self._saved
+        connection_manager.resize()
+
+    def test_default(self):
+        scheduler._scheduler = None
+        sched = get_scheduler()
+        self.assertEqual(sched.name, "threads")
+        self.assertEqual(sched.num_workers, scheduler.threads)
+        self.assertIs(sched.get.func, dask.threaded.get)
+        self.assertTrue(sched.shared_memory)
+
+    def test_set(self):
+        sched = set_scheduler("sync")
+        self.assertIs(get_scheduler(), sched)
+        self.assertIs(sched.get, dask.local.get_sync)
+        processes = set_scheduler("processes", num_workers=2)
+        self.assertEqual(processes.get.keywords, {"num_workers": 2})
+        self.assertFalse(processes.shared_memory)
+        with self.assertRaises(ValueError):
+            Scheduler("gpu")
+
+    def test_resizes_pools(self):
+        set_scheduler("threads", num_workers=3)
+        self.assertEqual(connection_manager.adapter("rda").stats().pool_size, 3)
+        self.assertEqual(direct._executor()._max_workers, 3)
+        set_scheduler("threads", num_workers=5)
+        self.assertEqual(connection_manager.adapter("tms").stats().pool_size, 5)
+        self.assertEqual(direct._executor()._max_workers, 5)
+
+    @unittest.skipIf(scheduler.has_distributed, "distributed is installed")
+    def test_distributed_needs_package(self):
+        with self.assertRaises(AssertionError):
+            Scheduler(client="tcp://127.0.0.1:8786")
+
+    def test_read(self):
+        img = make_image(2, 2)[:, 1:12, 3:15]
+        expected = img.compute(scheduler="sync")
+        set_scheduler("sync")
+        np.testing.assert_array_equal(img.read(), expected)
+        np.testing.assert_array_equal(img.map_blocks(lambda block: block + 1).read(), expected + 1)
+        # a scheduler without shared memory returns whole results instead of storing blocks
+        scheduler._scheduler = Unshared("sync")
+        np.testing.assert_array_equal(img.map_blocks(lambda block: block + 1).read(layout="HWC"),
+                                      np.rollaxis(expected + 1, 0, 3))
@@ -6,10 +6,15 @@ Unit tests for the gbdxtools.Idaho class
 '''
 
 from gbdxtools import RDAImage
+from gbdxtools.images import template_image
+from gbdxtools.images.template_image import TemplateMeta
 from auth_mock import gbdx
 import vcr
 import tempfile
 import unittest
+from unittest import mock
+
+import numpy as np
 
 
 
@@ -44,3 +49,45 @@ class TemplateImageTest(unittest.TestCase):
         self.assertTrue(isinstance(img, RDAImage))
         assert img.shape == (3, 116277, 52241)
         assert img.proj == 'EPSG:32632'
+
+    def test_template_names(self):
+        def meta(node_id="Format", **params):
+            m = TemplateMeta("DigitalGlobeStripTemplate", node_id, **params)
+            m._graph = {"id": "abc", "nodes": [{"id": "Format"}]}
+            m._template_id = "abc"
+            return m
+        # the same template, node and parameters always get the same name
+        self.assertEqual(meta(catId="1", bands="MS").name, meta(bands="MS", catId="1").name)
+        self.assertNotEqual(meta(catId="1").name, meta(catId="2").name)
+        self.assertNotEqual(meta(catId="1").name, meta("Ortho", catId="1").name)
+        self.assertTrue(meta(catId="1").name.startswith("image-Format-"))
+
+    def test_template_names_offline(self):
+        def graph_template(conn, template_name):
+            raise AssertionError("fetched the template")
+        with mock.patch.object(template_image, "get_rda_graph_template", graph_template):
+            m = TemplateMeta("DigitalGlobeStripTemplate", catId="1", nodeId="Format")
+            self.assertTrue(m.name.startswith("image-Format-"))
+            self.assertEqual(m.name, TemplateMeta("DigitalGlobeStripTemplate", catId="1", nodeId="Format").name)
+            self.assertTrue(TemplateMeta("DigitalGlobeStripTemplate", catId="1").name.startswith(
+                "image-DigitalGlobeStripTemplate-"))
+
+    def test_empty_tiles(self):
+        def metadata(conn, template_id, **params):
+            image = {"minTileX": 2, "minTileY": 1, "maxTileX": 5, "maxTileY": 4, "tileXSize": 256, "tileYSize": 256,
+                     "numBands": 4, "dataType": "BYTE",
+                     "imageBoundsWGS84": "POLYGON ((0.1 -0.1, 0.3 -0.1, 0.3 -0.2, 0.1 -0.2, 0.1 -0.1))"}
+            georef = {"spatialReferenceSystemCode": "EPSG:4326", "translateX": 0.0, "scaleX": 0.0001, "shearX": 0.0,
+                      "translateY": 0.0, "shearY": 0.0, "scaleY": -0.0001}
+            return {"image": image, "georef": georef, "rpcs": None}
+        m = TemplateMeta("DigitalGlobeStripTemplate", "Format", catId="1")
+        m._graph = {"id": "abc", "nodes": [{"id": "Format"}]}
+        m._template_id = "abc"
+        with mock.patch.object(template_image, "get_rda_template_metadata", metadata):
+            layer = m.dask
+        # the bounds cover pixels 1000-3000 x 1000-2000, tiles 3-5 x 3-4 of the grid's tiles 2-5 x 1-4
+        empty = [(row, col) for _, _, row, col in layer if layer[(m.name, 0, row, col)][0] is np.zeros]
+        self.assertEqual(len(empty), 16 - 6)
+        self.assertEqual(layer[(m.name, 0, 0, 0)], (np.zeros, (4, 256, 256), np.dtype("uint8")))
+        self.assertIn((1, 1), empty)
+        self.assertNotIn((2, 1), empty)
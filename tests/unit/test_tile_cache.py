@@ -0,0 +1,192 @@
+'''
+Unit tests for the persistent tile cache
+'''
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from gbdxtools.rda import cache
+from gbdxtools.rda.cache import DiskCache, TileCache, SingleFlight, tile_key, cached_fetch, load_tile, set_disk_cache
+from gbdxtools.rda.error import CacheMiss
+
+URL = "https://rda.geobigdata.io/v1/template/abc/tile/3/4?nodeId=Format&catId=123"
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self._saved = cache.disk_cache
+
+    def tearDown(self):
+        cache.disk_cache = self._saved
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def test_tile_key_ignores_param_order(self):
+        other = "https://rda.geobigdata.io/v1/template/abc/tile/3/4?catId=123&nodeId=Format"
+        self.assertEqual(tile_key(URL), tile_key(other))
+        self.assertNotEqual(tile_key(URL), tile_key(URL.replace("tile/3/4", "tile/4/3")))
+        self.assertNotEqual(tile_key(URL), tile_key(URL.replace("abc", "abd")))
+
+    def test_put_get(self):
+        dc = DiskCache(self._path)
+        arr = np.arange(3 * 4 * 5, dtype=np.uint16).reshape(3, 4, 5)
+        key = tile_key(URL)
+        self.assertIsNone(dc.get(key))
+        dc.put(key, arr)
+        self.assertTrue(key in dc)
+        np.testing.assert_array_equal(dc.get(key), arr)
+        # a second instance sees the same tiles
+        np.testing.assert_array_equal(DiskCache(self._path).get(key), arr)
+
+    def test_lru_eviction(self):
+        arr = np.zeros((1, 64, 64), dtype=np.uint8)
+        tile_bytes = 64 * 64 + 128
+        dc = DiskCache(self._path, max_size=3 * tile_bytes)
+        keys = [tile_key(URL.replace("tile/3/4", "tile/{}/0".format(i))) for i in range(3)]
+        for i, key in enumerate(keys):
+            dc.put(key, arr)
+            os.utime(dc._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+        # touch the oldest tile so the second one becomes least recently used
+        dc.get(keys[0])
+        dc.put(tile_key(URL), arr)
+        self.assertTrue(keys[0] in dc)
+        self.assertFalse(keys[1] in dc)
+        self.assertTrue(dc.size() <= dc.max_size)
+
+    def test_clear(self):
+        dc = DiskCache(self._path)
+        dc.put(tile_key(URL), np.zeros((1, 8, 8)))
+        dc.clear()
+        self.assertEqual(dc.size(), 0)
+
+    def test_cached_fetch(self):
+        calls = []
+        def fetch(url):
+            calls.append(url)
+            return np.ones((1, 8, 8))
+        set_disk_cache(self._path)
+        cached_fetch(URL, fetch)
+        cached_fetch(URL, fetch)
+        self.assertEqual(len(calls), 1)
+
+    def test_offline_miss(self):
+        set_disk_cache(self._path, offline=True)
+        with self.assertRaises(CacheMiss):
+            cached_fetch(URL, lambda url: np.ones((1, 8, 8)))
+
+    def test_disabled(self):
+        set_disk_cache(None)
+        self.assertIsNone(cache.disk_cache)
+        arr = cached_fetch(URL, lambda url: np.ones((1, 8, 8)))
+        self.assertEqual(arr.shape, (1, 8, 8))
+
+
+class TileCacheTest(unittest.TestCase):
+
+    def test_byte_budget(self):
+        tc = TileCache(max_bytes=3 * 1024)
+        for i in range(4):
+            tc.put(str(i), np.zeros(1024, dtype=np.uint8))
+        self.assertEqual(len(tc), 3)
+        self.assertFalse("0" in tc)
+        self.assertTrue(tc.nbytes <= tc.max_bytes)
+        self.assertEqual(tc.cache_info().evictions, 1)
+
+    def test_lru_order(self):
+        tc = TileCache(max_bytes=2 * 1024)
+        tc.put("a", np.zeros(1024, dtype=np.uint8))
+        tc.put("b", np.zeros(1024, dtype=np.uint8))
+        tc.get("a")
+        tc.put("c", np.zeros(1024, dtype=np.uint8))
+        self.assertTrue("a" in tc)
+        self.assertFalse("b" in tc)
+
+    def test_counters(self):
+        tc = TileCache()
+        self.assertIsNone(tc.get("a"))
+        tc.put("a", np.ones((1, 4, 4)))
+        tc.get("a")
+        info = tc.cache_info()
+        self.assertEqual((info.hits, info.misses, info.entries), (1, 1, 1))
+        tc.clear()
+        self.assertEqual(tc.cache_info(), (0, 0, 0, 0, 0, tc.max_bytes))
+
+    def test_resize(self):
+        tc = TileCache(max_bytes=4 * 1024)
+        for i in range(4):
+            tc.put(str(i), np.zeros(1024, dtype=np.uint8))
+        tc.resize(2 * 1024)
+        self.assertEqual(len(tc), 2)
+        self.assertTrue("3" in tc)
+
+    def test_compressed_cold_entries(self):
+        tc = TileCache(max_bytes=64 * 1024, compress="zlib", hot_fraction=0.25)
+        tiles = {str(i): np.full((4, 32, 32), i, dtype=np.float32) for i in range(4)}
+        for key, arr in tiles.items():
+            tc.put(key, arr)
+        # the constant-valued tiles compress well, so all of them fit in less than their raw size
+        self.assertEqual(len(tc), 4)
+        self.assertTrue(tc.nbytes < sum(arr.nbytes for arr in tiles.values()))
+        for key, arr in tiles.items():
+            np.testing.assert_array_equal(tc.get(key), arr)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            TileCache(compress="nope")
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def _run_concurrently(self, fn, n=8):
+        results, errors = [], []
+        def call():
+            try:
+                results.append(fn())
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_coalesces_concurrent_calls(self):
+        sf = SingleFlight()
+        calls = []
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+        results, errors = self._run_concurrently(lambda: sf.do("key", slow))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [42] * 8)
+        self.assertFalse("key" in sf)
+
+    def test_errors_reach_waiters(self):
+        sf = SingleFlight()
+        def fail():
+            time.sleep(0.2)
+            raise IOError("tile fetch failed")
+        results, errors = self._run_concurrently(lambda: sf.do("key", fail))
+        self.assertEqual(len(errors), 8)
+        self.assertFalse("key" in sf)
+
+    def test_load_tile(self):
+        cache.tile_cache.clear()
+        calls = []
+        def fetch(url):
+            calls.append(url)
+            time.sleep(0.2)
+            return np.ones((1, 8, 8))
+        results, errors = self._run_concurrently(lambda: load_tile(URL, fetch))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        cache.tile_cache.clear()
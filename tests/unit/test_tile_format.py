@@ -0,0 +1,66 @@
+'''
+Unit tests for tile format negotiation
+'''
+
+import unittest
+from io import BytesIO
+
+import numpy as np
+import tifffile
+
+from gbdxtools.images.drivers import IdahoDriver
+from gbdxtools.rda.cache import tile_key
+from gbdxtools.rda.decode import decode
+from gbdxtools.rda.error import IncompatibleOptions
+from gbdxtools.rda.fetch import accept_header
+
+URL = "https://rda.geobigdata.io/v1/template/abc/tile/3/4?nodeId=Format"
+
+
+class TileFormatTest(unittest.TestCase):
+
+    def test_default_is_servers_choice(self):
+        self.assertIsNone(accept_header(None, np.float32))
+
+    def test_auto_is_lossless(self):
+        self.assertTrue(accept_header("auto", np.uint8).startswith("image/png,"))
+        self.assertTrue(accept_header("auto", np.uint16).startswith("image/png,"))
+        self.assertTrue(accept_header("auto", np.float32).startswith("image/tiff; compression=deflate,"))
+
+    def test_fallback(self):
+        self.assertEqual(accept_header("jpeg", "uint8"), "image/jpeg, */*;q=0.1")
+
+    def test_incompatible(self):
+        with self.assertRaises(IncompatibleOptions):
+            accept_header("jpeg", np.float32)
+        with self.assertRaises(IncompatibleOptions):
+            accept_header("png", np.int16)
+        with self.assertRaises(ValueError):
+            accept_header("gif", np.uint8)
+
+    def test_cache_key(self):
+        self.assertEqual(tile_key(URL), tile_key(URL, None))
+        self.assertNotEqual(tile_key(URL), tile_key(URL, accept_header("jpeg", np.uint8)))
+
+    def test_driver_option(self):
+        graphs = []
+
+        class Target(object):
+            @classmethod
+            def _build_graph(cls, rda_id, **options):
+                graphs.append(options)
+
+        driver = IdahoDriver(rda_id="abc", bucket="rda-images-1", tile_format="png")
+        driver.drive(Target)
+        self.assertEqual(driver.read_options, {"tile_format": "png"})
+        self.assertIn("tile_format", Target.__supported_options__)
+        # the tile format is applied to the image, not the graph
+        self.assertNotIn("tile_format", graphs[0])
+        self.assertEqual(IdahoDriver(rda_id="abc").read_options, {"tile_format": None})
+
+    def test_decode_compressed_tiff(self):
+        arr = np.arange(4 * 16 * 16, dtype=np.float32).reshape(16, 16, 4)
+        buf = BytesIO()
+        tifffile.imwrite(buf, arr, compression='zlib')
+        tile = decode(buf.getvalue(), "image/tiff; compression=deflate")
+        np.testing.assert_array_equal(tile, np.rollaxis(arr, 2, 0))
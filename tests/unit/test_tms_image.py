@@ -56,6 +56,19 @@ class TmsImageTest(unittest.TestCase):
         assert img.shape == (3, 1024, 256)
         assert img.proj == 'EPSG:3857'
 
+    def test_tms_image_names(self):
+        bbox = [-74.71046447753906, 40.53624234037728, -74.70909118652344, 40.54041698756514]
+        url = r"https://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
+        img1 = TmsImage(url=url, zoom=18, bbox=bbox)
+        img2 = TmsImage(url=url, zoom=18, bbox=bbox)
+        self.assertEqual(img1.name, img2.name)
+        self.assertNotEqual(img1.name, TmsImage(url=url, zoom=17, bbox=bbox).name)
+        # shared tiles are only in the combined graph once
+        def tiles(img):
+            return [key for key in dict(img.__dask_graph__()) if key[0] in (img1.name, img2.name)]
+        self.assertTrue(tiles(img1))
+        self.assertEqual(len(tiles(img1 + img2)), len(tiles(img1)))
+
     def test_tms_image_aoi(self):
         # tms z18 tiles 76669, 98727-98730
         # a 1 x 4 chunk of tiles, so 256 x 1024 pixels
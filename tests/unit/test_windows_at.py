@@ -0,0 +1,45 @@
+'''
+Unit tests for reading windows centered on many geometries
+'''
+
+import numpy as np
+from shapely.geometry import Point, box
+
+from helpers import TileTestCase, make_image, urls
+
+
+class WindowsAtTest(TileTestCase):
+
+    def test_matches_window_at(self):
+        img = make_image(6, 6)
+        geoms = [Point(10, -10), box(20, -30, 26, -22), Point(40.5, -7.5), Point(4, -44)]
+        index, data = img.windows_at(geoms, (6, 6), batch_size=3)
+        self.assertEqual(index.tolist(), [0, 1, 2, 3])
+        self.assertEqual(data.shape, (4, 3, 6, 6))
+        for geom, window in zip(geoms, data):
+            np.testing.assert_array_equal(window, img.window_at(geom, (6, 6)).compute(scheduler='sync'))
+
+    def test_shared_tiles(self):
+        img = make_image(6, 6)
+        geoms = [Point(x + 0.5, -(y + 0.5)) for x in range(6, 42, 3) for y in range(6, 42, 3)]
+        index, data = img.windows_at(geoms, (4, 4), batch_size=len(geoms))
+        self.assertEqual(len(index), 12 * 12)
+        # each tile is fetched once for the batch, however many windows need it
+        self.assertEqual(len(urls), len(set(urls)))
+
+    def test_out_of_bounds(self):
+        img = make_image(2, 2)
+        expected = img.compute(scheduler='sync')
+        geoms = [Point(8, -8), Point(1, -1), Point(15, -8)]
+        with self.assertRaises(ValueError):
+            img.windows_at(geoms, (4, 4))
+        index, data = img.windows_at(geoms, (4, 4), out_of_bounds="drop")
+        self.assertEqual(index.tolist(), [0])
+        np.testing.assert_array_equal(data[0], expected[:, 6:10, 6:10])
+        index, data = img.windows_at(geoms, (4, 4), out_of_bounds="pad")
+        self.assertEqual(len(index), 3)
+        np.testing.assert_array_equal(data[1, :, 1:, 1:], expected[:, :3, :3])
+        self.assertFalse(data[1, :, :1, :].any())
+        np.testing.assert_array_equal(data[2, :, :, :3], expected[:, 6:10, 13:])
+        with self.assertRaises(ValueError):
+            img.windows_at(geoms, (4, 4), out_of_bounds="clip")